@@ -11,6 +11,7 @@ python manage.py migrate --noinput
 # Estáticos - limpio y simple
 python manage.py collectstatic --noinput --clear
 
-python scripts/load_products.py
+# Semilla idempotente: una consulta si no cambió; las imágenes se descargan fuera del build
+python manage.py seed_products
 
 echo "✅ BUILD COMPLETADO"
\ No newline at end of file
@@ -0,0 +1,259 @@
+# === chat/catalog.py - Índice del catálogo para respuestas de Masibot ===
+#
+# Índice invertido en memoria sobre nombre y categoría de cada producto,
+# con precio y estado de stock ya resueltos. Se usa para:
+#   - inyectar en el prompt solo los top-k productos relevantes (datos reales)
+#   - responder sin llamar a Gemini las consultas directas de precio/stock
+#     ("¿tienen el G203?", "precio del Kumara")
+#
+# Actualización igual que el índice de autocompletado: señales del propio
+# proceso (incremental) y una consulta de firma cada REFRESH_INTERVAL segundos
+# para cambios hechos por otros workers. El primer build ocurre en la primera
+# consulta del proceso, no al importar. Pasado el primer build, la firma y la
+# reconstrucción corren en un hilo: el request sigue con el índice anterior.
+
+import logging
+import math
+import threading
+import time
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Count, Max
+from django.urls import reverse
+
+from marketplace.models import Product
+from marketplace.text import words
+
+logger = logging.getLogger(__name__)
+
+MIN_PREFIX = 3
+TOP_K = 5
+MAX_DIRECT_PRODUCTS = 3
+
+PRICE_WORDS = {'precio', 'precios', 'cuanto', 'sale', 'salen', 'cuesta', 'cuestan', 'vale', 'valen', 'valor'}
+STOCK_WORDS = {'tienen', 'tenes', 'hay', 'stock', 'disponible', 'disponibles', 'queda', 'quedan', 'venden'}
+IGNORED_WORDS = PRICE_WORDS | STOCK_WORDS | {
+    'a', 'al', 'con', 'de', 'del', 'el', 'en', 'es', 'esta', 'la', 'las', 'lo', 'los', 'me',
+    'para', 'por', 'que', 'se', 'su', 'un', 'una', 'unos', 'y', 'hola', 'buenas', 'todavia',
+    'ustedes', 'modelo',
+}
+
+STOCK_LABELS = {
+    'en_stock': 'en stock',
+    'poco_stock': 'quedan pocas unidades',
+    'agotado': 'agotado por ahora',
+    'no_disponible': 'no disponible',
+}
+
+
+def format_price(price):
+    return '${:,.2f}'.format(price).replace(',', 'X').replace('.', ',').replace('X', '.')
+
+
+class ProductFact:
+    __slots__ = ('id', 'name', 'category', 'price', 'status', 'url', 'tokens')
+
+    def __init__(self, product):
+        self.id = product.id
+        self.name = product.name
+        self.category = product.get_category_display()
+        self.price = Decimal(str(product.price))
+        self.status = product.get_stock_status() if product.available else 'no_disponible'
+        self.url = reverse('product_detail', args=[product.id])
+        self.tokens = frozenset(words(product.name) + words(self.category) + words(product.category))
+
+    @property
+    def in_stock(self):
+        return self.status in ('en_stock', 'poco_stock')
+
+    def prompt_line(self):
+        return f"- {self.name} | {self.category} | {format_price(self.price)} | {STOCK_LABELS[self.status]}"
+
+    def sentence(self):
+        return f"{self.name}: {format_price(self.price)} ({STOCK_LABELS[self.status]}) 👉 {self.url}"
+
+
+class CatalogIndex:
+    REFRESH_INTERVAL = 30
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._facts = {}
+        self._postings = {}  # término o prefijo -> tuple(ids)
+        self._signature = None
+        self._checked_at = 0.0
+        self._refreshing = False
+        self.ready = False
+
+    # -------------------------------------------------------------------------
+    # Construcción y actualización
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _terms(fact):
+        for token in fact.tokens:
+            yield token
+            for size in range(MIN_PREFIX, len(token)):
+                yield token[:size]
+
+    @staticmethod
+    def _signature_query():
+        return Product.objects.aggregate(count=Count('id'), last=Max('updated_at'))
+
+    def build(self):
+        started = time.perf_counter()
+        signature = self._signature_query()
+        facts = {}
+        postings = {}
+        for product in Product.objects.iterator():
+            fact = ProductFact(product)
+            facts[fact.id] = fact
+            for term in set(self._terms(fact)):
+                postings.setdefault(term, []).append(fact.id)
+
+        with self._lock:
+            self._facts = facts
+            self._postings = {term: tuple(ids) for term, ids in postings.items()}
+            self._signature = signature
+            self._checked_at = time.monotonic()
+            self.ready = True
+        logger.info("Índice del catálogo para el chat: %s productos en %.1f ms",
+                    len(facts), (time.perf_counter() - started) * 1000)
+
+    def ensure_fresh(self):
+        if not self.ready:
+            # Primera consulta del proceso: no hay índice anterior que servir.
+            # Un solo hilo construye, el resto espera
+            with self._build_lock:
+                if not self.ready:
+                    self.build()
+            return
+        if time.monotonic() - self._checked_at < self.REFRESH_INTERVAL:
+            return
+        self._checked_at = time.monotonic()
+        self.refresh_in_background()
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        thread = threading.Thread(target=self._refresh, name='catalog-refresh', daemon=True)
+        thread.start()
+        return thread
+
+    def _refresh(self):
+        try:
+            if self._signature_query() != self._signature:
+                self.build()
+        except Exception as e:
+            logger.warning("No se pudo actualizar el índice del catálogo: %s", e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+            # La conexión es de este hilo: nadie más la va a cerrar
+            connection.close()
+
+    def _unlink(self, product_id):
+        old = self._facts.pop(product_id, None)
+        if old is None:
+            return
+        for term in set(self._terms(old)):
+            ids = tuple(i for i in self._postings.get(term, ()) if i != product_id)
+            if ids:
+                self._postings[term] = ids
+            else:
+                self._postings.pop(term, None)
+
+    def upsert(self, product):
+        if not self.ready:
+            return
+        fact = ProductFact(product)
+        with self._lock:
+            self._unlink(fact.id)
+            self._facts[fact.id] = fact
+            for term in set(self._terms(fact)):
+                self._postings[term] = self._postings.get(term, ()) + (fact.id,)
+
+    def remove(self, product_id):
+        if not self.ready:
+            return
+        with self._lock:
+            self._unlink(product_id)
+
+    # -------------------------------------------------------------------------
+    # Consulta
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def query_terms(message):
+        return [token for token in words(message) if token not in IGNORED_WORDS and len(token) > 1]
+
+    def search(self, message, limit=TOP_K):
+        """
+        Devuelve [(fact, términos que coincidieron)] ordenado por relevancia.
+        Cada término pesa según su rareza (un código de modelo vale más que 'mouse').
+        """
+        terms = self.query_terms(message)
+        if not terms:
+            return []
+        postings = self._postings
+        facts = self._facts
+        total = max(len(facts), 1)
+
+        scores = {}
+        matched = {}
+        for term in terms:
+            ids = postings.get(term, ())
+            if not ids:
+                continue
+            weight = math.log(1 + total / len(ids))
+            for product_id in ids:
+                scores[product_id] = scores.get(product_id, 0) + weight
+                matched.setdefault(product_id, set()).add(term)
+
+        # `postings` y `facts` se leyeron por separado: un build o un remove en el medio
+        # puede dejar ids que ya no están en `facts`
+        ranked = sorted((pid for pid in scores if pid in facts), key=lambda pid: (-scores[pid], facts[pid].name))
+        return [(facts[pid], matched[pid]) for pid in ranked[:limit]]
+
+    def prompt_context(self, results):
+        if not results:
+            return "(no hay productos del catálogo que coincidan con la consulta)"
+        return '\n'.join(fact.prompt_line() for fact, _ in results)
+
+    def direct_answer(self, message, results=None):
+        """
+        Respuesta sin LLM para consultas directas de precio o stock cuando
+        todos los términos de la consulta coinciden con pocos productos.
+        """
+        tokens = set(words(message))
+        asks_price = bool(tokens & PRICE_WORDS)
+        asks_stock = bool(tokens & STOCK_WORDS)
+        if not (asks_price or asks_stock):
+            return None
+
+        terms = set(self.query_terms(message))
+        if not terms:
+            return None
+        if results is None:
+            results = self.search(message)
+        exact = [fact for fact, matched in results if matched == terms]
+        if not exact or len(exact) > MAX_DIRECT_PRODUCTS:
+            return None
+
+        if len(exact) == 1:
+            fact = exact[0]
+            if fact.in_stock:
+                opening = "✅ ¡Sí, lo tenemos!" if asks_stock else "💰 Te paso el precio:"
+            else:
+                opening = "😕 Lo tenemos publicado pero está " + STOCK_LABELS[fact.status] + "."
+            return f"{opening} {fact.sentence()}"
+
+        lines = '\n'.join(f"• {fact.sentence()}" for fact in exact)
+        return f"🎮 Encontré estos productos:\n{lines}"
+
+
+catalog_index = CatalogIndex()
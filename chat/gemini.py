@@ -0,0 +1,239 @@
+# === chat/gemini.py - Proveedor perezoso del modelo de Gemini ===
+#
+# Antes el modelo se resolvía al importar chat.views: hasta cuatro llamadas
+# generate_content("Hola") en cada arranque de worker y en cada comando de
+# manage.py (migrate, collectstatic...). Ahora:
+#   - Nada toca la red al importar; la librería se importa en el primer uso.
+#   - El modelo elegido se guarda en el cache de Django con un TTL, así los
+#     demás workers lo reutilizan sin volver a probar.
+#   - Las pruebas corren en un hilo de fondo. Mientras tanto se usa el último
+#     modelo conocido (o el preferido, de forma optimista). Si una respuesta
+#     falla porque el modelo no existe o el servicio no está disponible, el
+#     modelo se marca como caído y se vuelve a probar en segundo plano, como
+#     mucho una vez cada REPROBE_INTERVAL entre todos los workers. Un 429, un
+#     timeout o un prompt bloqueado no justifican cambiar de modelo.
+
+import asyncio
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CANDIDATE_MODELS = [
+    'models/gemini-2.0-flash-001',
+    'models/gemini-2.5-flash',
+    'models/gemini-flash-latest',
+    'models/gemini-pro-latest',
+]
+
+CACHE_KEY = 'chat:gemini-model'
+MODEL_TTL = 6 * 60 * 60       # cuánto vale una prueba exitosa
+UNAVAILABLE_TTL = 5 * 60      # cuánto esperar para reintentar si ningún modelo respondió
+PROBE_TIMEOUT = 10
+UNAVAILABLE = ''              # marcador en cache: se probó y no hubo modelo
+REPROBE_KEY = 'chat:gemini-reprobe'
+REPROBE_INTERVAL = 60         # mínimo entre pruebas disparadas por fallas
+# Fallas que indican que hay que cambiar de modelo (google.api_core: NotFound, ServiceUnavailable)
+REPROBE_STATUSES = {404, 503}
+REPROBE_ERRORS = {'NotFound', 'ServiceUnavailable'}
+
+
+def should_reprobe(error):
+    """La falla dice algo del modelo elegido (no existe o no está disponible)"""
+    if error is None:
+        return True
+    code = getattr(error, 'code', None)
+    try:
+        # google.api_core expone el status HTTP como int o HTTPStatus
+        return int(code) in REPROBE_STATUSES
+    except (TypeError, ValueError):
+        return type(error).__name__ in REPROBE_ERRORS
+
+
+class GeminiProvider:
+    """Resuelve y comparte el GenerativeModel de forma perezosa y thread-safe"""
+
+    def __init__(self, candidates=None):
+        self.candidates = list(candidates or CANDIDATE_MODELS)
+        self._lock = threading.Lock()
+        self._configured_key = None
+        self._model = None
+        self._model_name = None
+        self._expires_at = 0.0
+        self._probing = False
+
+    # -------------------------------------------------------------------------
+    # Estado
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def api_key():
+        return getattr(settings, 'GEMINI_API_KEY', None)
+
+    def is_configured(self):
+        """Hay API key (no garantiza que el servicio responda)"""
+        return bool(self.api_key())
+
+    @property
+    def model_name(self):
+        return self._model_name
+
+    def _genai(self):
+        import google.generativeai as genai
+
+        key = self.api_key()
+        if self._configured_key != key:
+            genai.configure(api_key=key)
+            self._configured_key = key
+        return genai
+
+    def _use(self, name, ttl):
+        """Publica el modelo `name` (o ninguno si es UNAVAILABLE) por `ttl` segundos"""
+        model = self._genai().GenerativeModel(name) if name else None
+        with self._lock:
+            self._model = model
+            self._model_name = name or None
+            self._expires_at = time.monotonic() + ttl
+
+    # -------------------------------------------------------------------------
+    # API pública
+    # -------------------------------------------------------------------------
+
+    def get_model(self):
+        """
+        Devuelve el GenerativeModel a usar o None. Nunca bloquea en la red:
+        si la elección venció se revalida en segundo plano.
+        """
+        if not self.is_configured():
+            return None
+
+        if time.monotonic() >= self._expires_at:
+            cached = cache.get(CACHE_KEY)
+            if cached is not None:
+                # Otro worker ya probó: adoptar su elección
+                self._use(cached, MODEL_TTL if cached else UNAVAILABLE_TTL)
+            else:
+                if self._model is None and self._model_name is None:
+                    # Primer uso sin datos: preferido optimista hasta que termine la prueba
+                    self._use(self.candidates[0], UNAVAILABLE_TTL)
+                self.probe_in_background()
+        return self._model
+
+    def report_failure(self, name=None, error=None):
+        """Una generación falló: si fue el modelo, descartar la elección y volver a probar"""
+        if name and name != self._model_name:
+            return
+        if not should_reprobe(error):
+            return
+        if not cache.add(REPROBE_KEY, 1, REPROBE_INTERVAL):
+            # Otro request (o worker) ya disparó una prueba hace poco
+            return
+        logger.warning("Gemini: el modelo %s falló (%s), se vuelve a probar", self._model_name, error)
+        cache.delete(CACHE_KEY)
+        with self._lock:
+            self._expires_at = 0.0
+        self.probe_in_background(skip=name)
+
+    def probe_in_background(self, skip=None):
+        with self._lock:
+            if self._probing:
+                return
+            self._probing = True
+        thread = threading.Thread(target=self._probe, args=(skip,), name='gemini-probe', daemon=True)
+        thread.start()
+        return thread
+
+    # -------------------------------------------------------------------------
+    # Prueba de modelos
+    # -------------------------------------------------------------------------
+
+    def _probe(self, skip=None):
+        try:
+            name = self.probe(skip)
+            cache.set(CACHE_KEY, name or UNAVAILABLE, MODEL_TTL if name else UNAVAILABLE_TTL)
+            self._use(name or UNAVAILABLE, MODEL_TTL if name else UNAVAILABLE_TTL)
+        except Exception as e:
+            logger.error("Gemini: error probando modelos: %s", e)
+        finally:
+            with self._lock:
+                self._probing = False
+
+    def probe(self, skip=None):
+        """Devuelve el primer candidato que responde (llamadas de red, bloqueante)"""
+        genai = self._genai()
+        candidates = [name for name in self.candidates if name != skip] + ([skip] if skip else [])
+        for name in candidates:
+            try:
+                response = genai.GenerativeModel(name).generate_content(
+                    "Hola", request_options={'timeout': PROBE_TIMEOUT}
+                )
+                if response.text:
+                    logger.info("Gemini configurado con: %s", name)
+                    return name
+            except Exception as e:
+                logger.warning("Gemini: %s no disponible: %s", name, e)
+        logger.error("Gemini: ningún modelo respondió")
+        return None
+
+
+gemini_provider = GeminiProvider()
+
+
+# =============================================================================
+# CONTROL DE ADMISIÓN PARA LLAMADAS AL MODELO
+# =============================================================================
+
+class LLMSlots:
+    """
+    Semáforo del proceso para llamadas salientes a Gemini. Si no hay lugar se
+    espera como mucho `wait` segundos; después se rechaza (429) en lugar de
+    acumular workers bloqueados esperando al servicio.
+    """
+
+    POLL_INTERVAL = 0.02
+
+    def __init__(self, limit, wait):
+        self.limit = limit
+        self.wait = wait
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.rejected = 0
+
+    def _taken(self, acquired):
+        with self._lock:
+            if acquired:
+                self.in_use += 1
+            else:
+                self.rejected += 1
+        return acquired
+
+    def acquire(self):
+        return self._taken(self._semaphore.acquire(timeout=self.wait))
+
+    async def aacquire(self):
+        """Variante para vistas async: no bloquea el event loop mientras espera"""
+        deadline = time.monotonic() + self.wait
+        while not self._semaphore.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                return self._taken(False)
+            await asyncio.sleep(self.POLL_INTERVAL)
+        return self._taken(True)
+
+    def release(self):
+        with self._lock:
+            self.in_use -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {'limit': self.limit, 'in_use': self.in_use, 'rejected': self.rejected}
+
+
+llm_slots = LLMSlots(
+    limit=getattr(settings, 'CHAT_LLM_CONCURRENCY', 4),
+    wait=getattr(settings, 'CHAT_LLM_QUEUE_SECONDS', 0.5),
+)
@@ -0,0 +1,167 @@
+# === chat/intents.py - Motor de intenciones para las respuestas de respaldo ===
+#
+# La tabla de intenciones vive en chat/data/intents.json (o settings.CHAT_INTENTS_FILE):
+#
+#   {"name": "envios", "keywords": ["envio", ...], "answer": "...", "priority": 15}
+#
+# Todas las palabras clave se compilan una sola vez en un autómata de
+# Aho-Corasick sobre texto sin acentos, así un mensaje se recorre una única
+# vez (O(largo del mensaje + coincidencias)) sin importar cuántas
+# intenciones haya. Una palabra clave debe empezar en un inicio de palabra y
+# funciona como prefijo ('envio' encuentra 'envios'). Las intenciones con
+# prioridad 0 (saludos, agradecimientos) solo responden si no hubo otra.
+
+import json
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+
+from django.conf import settings
+
+from marketplace.text import fold
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTENTS_FILE = Path(__file__).resolve().parent / 'data' / 'intents.json'
+MAX_ANSWERS = 2
+
+
+class Intent:
+    __slots__ = ('name', 'keywords', 'answer', 'priority')
+
+    def __init__(self, name, keywords, answer, priority=10):
+        self.name = name
+        self.keywords = keywords
+        self.answer = answer
+        self.priority = priority
+
+    def __repr__(self):
+        return f"<Intent {self.name} ({self.priority})>"
+
+
+class AhoCorasick:
+    """Autómata de Aho-Corasick: encuentra todas las claves en una sola pasada"""
+
+    def __init__(self, patterns):
+        # Estado 0 = raíz. goto[estado] = {caracter: estado}
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        for pattern, value in patterns:
+            self._add(pattern, value)
+        self._link()
+
+    def _add(self, pattern, value):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state] += ((len(pattern), value),)
+
+    def _link(self):
+        """Enlaces de fallo por BFS; cada estado hereda las salidas de su enlace"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                link = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = link if link != next_state else 0
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def finditer(self, text):
+        """Genera (inicio, valor) por cada clave encontrada en `text`"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, value in output[state]:
+                yield position - length + 1, value
+
+    def __len__(self):
+        return len(self._goto)
+
+
+class IntentEngine:
+    """Tabla de intenciones compilada; se carga de forma perezosa y thread-safe"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._intents = None
+        self._automaton = None
+
+    def _source(self):
+        return Path(self.path or getattr(settings, 'CHAT_INTENTS_FILE', None) or DEFAULT_INTENTS_FILE)
+
+    def load(self, entries=None):
+        """Compila la tabla (desde `entries` o desde el archivo de datos)"""
+        if entries is None:
+            with open(self._source(), encoding='utf-8') as data:
+                entries = json.load(data)
+
+        intents = []
+        patterns = []
+        for entry in entries:
+            intent = Intent(entry['name'], entry['keywords'], entry['answer'], entry.get('priority', 10))
+            intents.append(intent)
+            for keyword in {fold(keyword).strip() for keyword in intent.keywords}:
+                if keyword:
+                    patterns.append((keyword, intent))
+
+        automaton = AhoCorasick(patterns)
+        with self._lock:
+            self._intents = intents
+            self._automaton = automaton
+        logger.info("Intenciones cargadas: %s (%s claves, %s estados)", len(intents), len(patterns), len(automaton))
+
+    def _ensure_loaded(self):
+        if self._automaton is None:
+            with self._lock:
+                loaded = self._automaton is not None
+            if not loaded:
+                self.load()
+        return self._automaton
+
+    def match(self, message):
+        """Intenciones presentes en el mensaje, ordenadas por prioridad y aparición"""
+        automaton = self._ensure_loaded()
+        text = fold(message)
+        found = {}
+        for start, intent in automaton.finditer(text):
+            # Solo coincidencias que arrancan en un inicio de palabra
+            if start and text[start - 1].isalnum():
+                continue
+            if intent.name not in found:
+                found[intent.name] = (start, intent)
+
+        ranked = sorted(found.values(), key=lambda item: (-item[1].priority, item[0]))
+        intents = [intent for _, intent in ranked]
+        if any(intent.priority > 0 for intent in intents):
+            intents = [intent for intent in intents if intent.priority > 0]
+        return intents
+
+    def answer(self, message, max_answers=MAX_ANSWERS):
+        """Respuesta combinada de las intenciones principales, o None si no hay ninguna"""
+        answers = []
+        for intent in self.match(message):
+            if intent.answer not in answers:
+                answers.append(intent.answer)
+            if len(answers) == max_answers:
+                break
+        return '\n'.join(answers) or None
+
+
+intent_engine = IntentEngine()
@@ -0,0 +1,188 @@
+# === chat/memory.py - Memoria de conversación por sesión para Masibot ===
+#
+# Cada chat_session_id guarda en el cache de Django:
+#   - un buffer circular con los últimos CHAT_MEMORY_TURNS turnos
+#     (mensaje del cliente + respuesta), limitado además por un presupuesto
+#     de tokens estimado (~4 caracteres por token)
+#   - un resumen de los turnos que salieron del buffer: se conserva la
+#     pregunta del cliente recortada (extractivo, sin otra llamada al modelo)
+#     y se descartan los temas más viejos si supera su propio presupuesto
+#
+# El valor se guarda como JSON compacto (comprimido con zlib si es grande) y
+# vence tras CHAT_MEMORY_IDLE_SECONDS sin actividad. stats() y size() permiten
+# dimensionar la memoria necesaria para miles de chats simultáneos.
+
+import json
+import logging
+import threading
+import zlib
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TURNS = 6
+DEFAULT_TOKEN_BUDGET = 600
+DEFAULT_SUMMARY_TOKENS = 120
+DEFAULT_IDLE_SECONDS = 30 * 60
+
+CHARS_PER_TOKEN = 4
+SUMMARY_TOPIC_CHARS = 80
+COMPRESS_OVER = 512
+MAX_SESSION_ID = 64
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def clip(text, limit):
+    text = ' '.join(text.split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + '…'
+
+
+class Conversation:
+    """Resumen + buffer circular de turnos (cliente, Masibot)"""
+
+    __slots__ = ('summary', 'turns')
+
+    def __init__(self, summary='', turns=()):
+        self.summary = summary
+        self.turns = deque(tuple(turn) for turn in turns)
+
+    def __bool__(self):
+        return bool(self.summary or self.turns)
+
+    def tokens(self):
+        return estimate_tokens(self.summary) + sum(estimate_tokens(u) + estimate_tokens(b) for u, b in self.turns)
+
+    def add(self, user, bot, max_turns, token_budget, summary_tokens):
+        # Un turno nunca ocupa más de la mitad del presupuesto
+        limit = token_budget * CHARS_PER_TOKEN // 2
+        self.turns.append((clip(user, limit // 2), clip(bot, limit)))
+        while len(self.turns) > max_turns or (len(self.turns) > 1 and self.tokens() > token_budget):
+            self._fold(self.turns.popleft(), summary_tokens)
+
+    def _fold(self, turn, summary_tokens):
+        """Pasa un turno viejo al resumen, descartando los temas más antiguos si no entra"""
+        topics = [topic for topic in self.summary.split(' | ') if topic]
+        topics.append(clip(turn[0], SUMMARY_TOPIC_CHARS))
+        while len(topics) > 1 and estimate_tokens(' | '.join(topics)) > summary_tokens:
+            topics.pop(0)
+        self.summary = ' | '.join(topics)
+
+    def prompt_block(self):
+        if not self:
+            return "(inicio de la conversación)"
+        lines = []
+        if self.summary:
+            lines.append(f"Temas anteriores: {self.summary}")
+        for user, bot in self.turns:
+            lines.append(f"Cliente: {user}")
+            lines.append(f"Masibot: {bot}")
+        return '\n'.join(lines)
+
+    # -------------------------------------------------------------------------
+    # Serialización compacta
+    # -------------------------------------------------------------------------
+
+    def dumps(self):
+        data = json.dumps([self.summary, list(self.turns)], ensure_ascii=False, separators=(',', ':')).encode()
+        if len(data) > COMPRESS_OVER:
+            return b'z' + zlib.compress(data, 6)
+        return b'j' + data
+
+    @classmethod
+    def loads(cls, raw):
+        data = zlib.decompress(raw[1:]) if raw[:1] == b'z' else raw[1:]
+        summary, turns = json.loads(data)
+        return cls(summary, turns)
+
+
+class ConversationMemory:
+    """Memoria por sesión sobre el cache de Django, con vencimiento por inactividad"""
+
+    def __init__(self, max_turns=DEFAULT_TURNS, token_budget=DEFAULT_TOKEN_BUDGET,
+                 summary_tokens=DEFAULT_SUMMARY_TOKENS, idle_seconds=DEFAULT_IDLE_SECONDS):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @staticmethod
+    def key(session_id):
+        if not isinstance(session_id, str) or not session_id or len(session_id) > MAX_SESSION_ID:
+            return None
+        return f"chat:memory:{session_id}"
+
+    def load(self, session_id):
+        key = self.key(session_id)
+        raw = cache.get(key) if key else None
+        if raw is None:
+            return Conversation()
+        try:
+            return Conversation.loads(raw)
+        except (ValueError, zlib.error) as e:
+            logger.warning("Memoria de chat ilegible para %s: %s", session_id, e)
+            return Conversation()
+
+    def append(self, session_id, user_message, answer):
+        """Agrega un turno y renueva el vencimiento; devuelve los bytes guardados"""
+        key = self.key(session_id)
+        if not key or not answer:
+            return 0
+        conversation = self.load(session_id)
+        conversation.add(user_message, answer, self.max_turns, self.token_budget, self.summary_tokens)
+        raw = conversation.dumps()
+        cache.set(key, raw, self.idle_seconds)
+        with self._lock:
+            self.writes += 1
+            self.bytes_written += len(raw)
+            self.max_bytes = max(self.max_bytes, len(raw))
+        return len(raw)
+
+    def clear(self, session_id):
+        key = self.key(session_id)
+        if key:
+            cache.delete(key)
+
+    def size(self, session_id):
+        """Bytes que ocupa hoy la sesión en el cache (0 si no existe)"""
+        key = self.key(session_id)
+        raw = cache.get(key) if key else None
+        return len(raw) if raw else 0
+
+    # -------------------------------------------------------------------------
+    # Métricas
+    # -------------------------------------------------------------------------
+
+    def reset_stats(self):
+        with self._lock:
+            self.writes = 0
+            self.bytes_written = 0
+            self.max_bytes = 0
+
+    def stats(self):
+        average = self.bytes_written / self.writes if self.writes else 0
+        return {
+            'writes': self.writes,
+            'avg_bytes': round(average),
+            'max_bytes': self.max_bytes,
+            # Cota para dimensionar el backend: todas las sesiones con el buffer lleno
+            'estimated_kb_per_1000_sessions': round(self.max_bytes * 1000 / 1024),
+            'max_turns': self.max_turns,
+            'token_budget': self.token_budget,
+            'idle_seconds': self.idle_seconds,
+        }
+
+
+conversation_memory = ConversationMemory(
+    max_turns=getattr(settings, 'CHAT_MEMORY_TURNS', DEFAULT_TURNS),
+    token_budget=getattr(settings, 'CHAT_MEMORY_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET),
+    summary_tokens=getattr(settings, 'CHAT_MEMORY_SUMMARY_TOKENS', DEFAULT_SUMMARY_TOKENS),
+    idle_seconds=getattr(settings, 'CHAT_MEMORY_IDLE_SECONDS', DEFAULT_IDLE_SECONDS),
+)
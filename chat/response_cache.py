@@ -0,0 +1,239 @@
+# === chat/response_cache.py - Cache de respuestas de Masibot ===
+#
+# Dos niveles delante del modelo:
+#   1. Exacto: la consulta normalizada (minúsculas, sin acentos ni palabras
+#      vacías, tokens ordenados) -> "que teclados tienen?" y "Teclados que
+#      tienen" comparten entrada.
+#   2. Similar (opcional, requiere NumPy): cada clave se guarda como un vector
+#      TF-IDF de trigramas de caracteres, hasheado a VECTOR_DIM dimensiones en
+#      float32 (2 KB por entrada). La búsqueda es un producto matriz-vector
+#      contra todas las entradas; se acepta la mejor si supera el umbral.
+#
+# Las entradas vencen por TTL y se desalojan por LRU al llenarse. La versión
+# del prompt forma parte del estado: si cambia la plantilla, el cache se vacía.
+# Cada entrada guarda además la huella de los datos con que se respondió (las
+# líneas del catálogo del prompt): solo se sirve si la consulta actual ve los
+# mismos datos. Un cambio de stock que no cambia el estado publicado no vacía nada.
+
+import hashlib
+import logging
+import math
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+
+from marketplace.text import words
+
+try:
+    import numpy as np
+except ImportError:  # el nivel por similitud queda deshabilitado
+    np = None
+
+logger = logging.getLogger(__name__)
+
+STOP_WORDS = {
+    'a', 'al', 'algo', 'algun', 'alguna', 'alguno', 'como', 'con', 'cual', 'cuales',
+    'de', 'del', 'donde', 'el', 'en', 'es', 'esta', 'estan', 'hay', 'la', 'las', 'le',
+    'lo', 'los', 'me', 'mi', 'mis', 'o', 'para', 'por', 'que', 'quiero', 'se', 'si',
+    'son', 'su', 'sus', 'te', 'tenes', 'tienen', 'tiene', 'un', 'una', 'unos', 'unas',
+    'y', 'ya', 'yo', 'hola', 'buenas', 'porfa', 'favor',
+}
+
+DEFAULT_TTL = 60 * 60
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_SIMILARITY = 0.85
+VECTOR_DIM = 512
+
+
+def normalize(message):
+    """Clave canónica de una consulta ('' si no queda nada significativo)"""
+    tokens = {token for token in words(message) if token not in STOP_WORDS}
+    return ' '.join(sorted(tokens))
+
+
+def prompt_version(template):
+    return hashlib.sha1(template.encode()).hexdigest()[:12]
+
+
+def grounding_digest(grounding):
+    return hashlib.sha1(grounding.encode()).hexdigest()[:12] if grounding else ''
+
+
+class _Entry:
+    __slots__ = ('answer', 'source', 'expires_at', 'slot', 'grounding')
+
+    def __init__(self, answer, source, expires_at, slot, grounding=''):
+        self.answer = answer
+        self.source = source
+        self.expires_at = expires_at
+        self.slot = slot
+        self.grounding = grounding
+
+
+class ResponseCache:
+    """Cache LRU con TTL, thread-safe, con nivel opcional por similitud"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, similarity=DEFAULT_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity if np is not None else None
+        self._lock = threading.Lock()
+        self._version = None
+        self._reset()
+
+    def _reset(self):
+        self._entries = OrderedDict()
+        self.hits = self.similar_hits = self.misses = self.evictions = 0
+        if self.similarity:
+            self._vectors = np.zeros((self.max_entries, VECTOR_DIM), dtype=np.float32)
+            self._slot_keys = [None] * self.max_entries
+            self._free_slots = list(range(self.max_entries - 1, -1, -1))
+            self._document_frequency = np.zeros(VECTOR_DIM, dtype=np.float32)
+
+    # -------------------------------------------------------------------------
+    # Vectores
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _features(key):
+        padded = f' {key} '
+        counts = {}
+        for i in range(len(padded) - 2):
+            index = zlib.crc32(padded[i:i + 3].encode()) % VECTOR_DIM
+            counts[index] = counts.get(index, 0) + 1
+        return counts
+
+    def _vector(self, features):
+        """TF-IDF con la frecuencia documental de las entradas cacheadas"""
+        vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+        documents = len(self._entries) + 1
+        for index, count in features.items():
+            idf = math.log((documents + 1) / (self._document_frequency[index] + 1)) + 1
+            vector[index] = (1 + math.log(count)) * idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _store_vector(self, key):
+        if not self._free_slots:
+            return None
+        slot = self._free_slots.pop()
+        features = self._features(key)
+        for index in features:
+            self._document_frequency[index] += 1
+        self._vectors[slot] = self._vector(features)
+        self._slot_keys[slot] = key
+        return slot
+
+    def _free_vector(self, key, slot):
+        if slot is None:
+            return
+        for index in self._features(key):
+            self._document_frequency[index] -= 1
+        self._vectors[slot] = 0
+        self._slot_keys[slot] = None
+        self._free_slots.append(slot)
+
+    def _nearest(self, key):
+        if not self._entries:
+            return None
+        scores = self._vectors @ self._vector(self._features(key))
+        slot = int(np.argmax(scores))
+        if scores[slot] >= self.similarity:
+            return self._slot_keys[slot]
+        return None
+
+    # -------------------------------------------------------------------------
+    # API pública
+    # -------------------------------------------------------------------------
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._version is not None:
+                logger.info("Cambió la plantilla del prompt: cache de respuestas vaciado")
+            self._reset()
+            self._version = version
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        if self.similarity:
+            self._free_vector(key, entry.slot)
+
+    def get(self, message, version, grounding=''):
+        """
+        Devuelve (respuesta, origen) o None. `grounding` son los datos que vería
+        el modelo para esta consulta; una entrada respondida con otros no sirve.
+        """
+        key = normalize(message)
+        if not key:
+            return None
+        digest = grounding_digest(grounding)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            similar = False
+            if entry is None and self.similarity:
+                nearest = self._nearest(key)
+                entry = self._entries.get(nearest) if nearest else None
+                key, similar = nearest, True
+            if entry is not None and entry.expires_at <= now:
+                self._drop(key)
+                entry = None
+            if entry is not None and entry.grounding != digest:
+                if not similar:
+                    # Precio o disponibilidad cambiaron: la respuesta quedó vieja
+                    self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if similar:
+                self.similar_hits += 1
+            else:
+                self.hits += 1
+            return entry.answer, entry.source
+
+    def set(self, message, version, answer, source, grounding=''):
+        key = normalize(message)
+        if not key or not answer:
+            return
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self._drop(key)
+            while len(self._entries) >= self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+            slot = self._store_vector(key) if self.similarity else None
+            self._entries[key] = _Entry(answer, source, time.monotonic() + self.ttl, slot, grounding_digest(grounding))
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def stats(self):
+        lookups = self.hits + self.similar_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'similar_hits': self.similar_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round((self.hits + self.similar_hits) / lookups, 3) if lookups else 0.0,
+            'similarity_enabled': bool(self.similarity),
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+response_cache = ResponseCache(
+    max_entries=getattr(settings, 'CHAT_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+    ttl=getattr(settings, 'CHAT_CACHE_TTL_SECONDS', DEFAULT_TTL),
+    similarity=getattr(settings, 'CHAT_CACHE_SIMILARITY', DEFAULT_SIMILARITY),
+)
@@ -0,0 +1,18 @@
+# === chat/signals.py - Mantiene el índice del catálogo del chat al día ===
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from marketplace.models import Product
+
+from .catalog import catalog_index
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    catalog_index.upsert(instance)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    catalog_index.remove(instance.id)
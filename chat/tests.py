@@ -1,3 +1,475 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from marketplace.models import Product
+from marketplace.ratelimit import get_store
+
+from .catalog import CatalogIndex, catalog_index
+from .gemini import CACHE_KEY, REPROBE_KEY, GeminiProvider, LLMSlots, gemini_provider
+from .intents import AhoCorasick, IntentEngine
+from .memory import Conversation, ConversationMemory, conversation_memory
+from .response_cache import ResponseCache, response_cache
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStreamingModel:
+    """Imita GenerativeModel.generate_content_async: fragmentos con stream=True, todo junto sin él"""
+
+    def __init__(self, chunks, delay=0.01, fail_after=None):
+        self.chunks = chunks
+        self.delay = delay
+        self.fail_after = fail_after
+        self.prompts = []
+
+    async def generate_content_async(self, prompt, stream=False):
+        self.prompts.append(prompt)
+        if not stream:
+            await asyncio.sleep(self.delay)
+            return FakeChunk(''.join(self.chunks))
+        return self._stream()
+
+    async def _stream(self):
+        for index, text in enumerate(self.chunks):
+            if self.fail_after is not None and index >= self.fail_after:
+                raise RuntimeError("conexión cortada")
+            await asyncio.sleep(self.delay)
+            yield FakeChunk(text)
+
+
+def parse_events(body):
+    """Convierte el cuerpo SSE en [(evento, datos)]"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+class ChatStreamTests(TestCase):
+
+    def setUp(self):
+        response_cache.clear()
+        catalog_index.ready = False
+        get_store().clear()
+
+    def post(self, message):
+        return self.async_client.post(
+            reverse('chat_stream'),
+            data=json.dumps({'message': message}),
+            content_type='application/json',
+            secure=True,
+        )
+
+    async def stream(self, message, model):
+        with mock.patch.object(gemini_provider, 'get_model', return_value=model), \
+                mock.patch.object(gemini_provider, 'report_failure') as report_failure:
+            response = await self.post(message)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.report_failure = report_failure
+        return chunks
+
+    async def test_relays_model_chunks_as_they_arrive(self):
+        model = FakeStreamingModel(['¡Hola! ', 'Tenemos ', 'teclados 🎮'])
+
+        chunks = await self.stream('qué teclados tienen?', model)
+
+        # Un evento por escritura: start, tres chunks y done
+        self.assertEqual(len(chunks), 5)
+        events = parse_events(b''.join(chunks).decode())
+        session = await self.async_client.asession()
+        self.assertEqual(events[0], ('start', {'session_id': await session.aget('chat_session_id')}))
+        self.assertEqual(''.join(data['text'] for event, data in events if event == 'chunk'),
+                         '¡Hola! Tenemos teclados 🎮')
+        self.assertEqual(events[-1][0], 'done')
+        self.assertIn('qué teclados tienen?', model.prompts[0])
+
+    async def test_without_model_streams_fallback_answer(self):
+        chunks = await self.stream('hacen envios?', None)
+
+        events = parse_events(b''.join(chunks).decode())
+        self.assertEqual([event for event, _ in events], ['start', 'chunk', 'done'])
+        self.assertIn('Envíos', events[1][1]['text'])
+        self.assertEqual(events[2][1], {'source': 'fallback'})
+
+    async def test_failure_before_first_chunk_falls_back(self):
+        model = FakeStreamingModel(['nunca llega'], fail_after=0)
+
+        chunks = await self.stream('garantia', model)
+
+        events = parse_events(b''.join(chunks).decode())
+        self.assertEqual(events[-1][1], {'source': 'fallback'})
+        self.report_failure.assert_called_once()
+
+    async def test_failure_mid_stream_reports_error(self):
+        model = FakeStreamingModel(['Primera parte', 'segunda'], fail_after=1)
+
+        chunks = await self.stream('monitores', model)
+
+        events = parse_events(b''.join(chunks).decode())
+        self.assertEqual([event for event, _ in events], ['start', 'chunk', 'error'])
+
+    async def test_repeated_question_is_served_from_cache(self):
+        model = FakeStreamingModel(['Sí, ', 'hasta 12 cuotas 💳'])
+        await self.stream('¿Aceptan cuotas?', model)
+
+        chunks = await self.stream('aceptan CUOTAS', FakeStreamingModel(['no debería usarse']))
+
+        events = parse_events(b''.join(chunks).decode())
+        self.assertEqual(events[1], ('chunk', {'text': 'Sí, hasta 12 cuotas 💳'}))
+        self.assertEqual(events[2], ('done', {'source': 'cache'}))
+        self.assertEqual(response_cache.stats()['hits'], 1)
+
+    async def test_price_question_is_answered_from_catalog(self):
+        await Product.objects.acreate(name='Mouse Logitech G203', description='RGB', category='mouses',
+                                      price=Decimal('25000.00'), stock=3)
+        model = FakeStreamingModel(['no debería usarse'])
+
+        chunks = await self.stream('¿Cuánto sale el G203?', model)
+
+        events = parse_events(b''.join(chunks).decode())
+        self.assertIn('Mouse Logitech G203: $25.000,00 (quedan pocas unidades)', events[1][1]['text'])
+        self.assertEqual(events[2], ('done', {'source': 'catalog'}))
+        self.assertEqual(model.prompts, [])
+
+    async def test_prompt_only_lists_matching_products(self):
+        await Product.objects.acreate(name='Mouse Logitech G203', description='RGB', category='mouses',
+                                      price=Decimal('25000.00'), stock=10)
+        await Product.objects.acreate(name='Monitor Samsung Odyssey', description='144hz', category='monitores',
+                                      price=Decimal('300000.00'), stock=10)
+        model = FakeStreamingModel(['Para FPS te recomiendo el G203 🖱️'])
+
+        await self.stream('qué mouse me recomendás para fps?', model)
+
+        self.assertIn('- Mouse Logitech G203 | Mouses Gaming | $25.000,00 | en stock', model.prompts[0])
+        self.assertNotIn('Odyssey', model.prompts[0])
+
+    async def test_follow_up_sees_previous_turns(self):
+        await self.stream('busco auriculares inalámbricos', FakeStreamingModel(['Tenemos los HyperX Cloud 🎧']))
+        model = FakeStreamingModel(['Sí, vienen con micrófono'])
+
+        await self.stream('y tienen micrófono?', model)
+
+        self.assertIn('Cliente: busco auriculares inalámbricos\nMasibot: Tenemos los HyperX Cloud 🎧',
+                      model.prompts[0])
+        # La respuesta depende de la conversación: no se guarda en el cache compartido
+        self.assertEqual(len(response_cache), 1)
+
+    async def test_cached_answer_survives_stock_changes_but_not_price_changes(self):
+        monitor = await Product.objects.acreate(name='Monitor Samsung Odyssey', description='144hz',
+                                                category='monitores', price=Decimal('300000.00'), stock=10)
+        await self.stream('qué monitor me recomendás para jugar?', FakeStreamingModel(['El Odyssey 🖥️']))
+
+        # Una venta: sigue "en stock", la respuesta cacheada sigue valiendo
+        monitor.stock = 9
+        await monitor.asave()
+        chunks = await self.stream('qué monitor me recomendás para jugar?', FakeStreamingModel(['no debería usarse']))
+        self.assertEqual(parse_events(b''.join(chunks).decode())[-1], ('done', {'source': 'cache'}))
+
+        monitor.price = Decimal('280000.00')
+        await monitor.asave()
+        model = FakeStreamingModel(['El Odyssey, ahora más barato 🖥️'])
+        chunks = await self.stream('qué monitor me recomendás para jugar?', model)
+        self.assertEqual(len(model.prompts), 1)
+        self.assertIn('$280.000,00', model.prompts[0])
+
+    async def test_memory_is_keyed_by_django_session_not_body(self):
+        await sync_to_async(conversation_memory.append)('ajena', 'mi dirección es Calle 123', 'Anotado')
+        model = FakeStreamingModel(['Tenemos varios 🖱️'])
+
+        with mock.patch.object(gemini_provider, 'get_model', return_value=model):
+            response = await self.async_client.post(
+                reverse('chat_stream'), data=json.dumps({'message': 'qué mouse tienen?', 'session_id': 'ajena'}),
+                content_type='application/json', secure=True,
+            )
+            events = parse_events(b''.join([chunk async for chunk in response.streaming_content]).decode())
+
+        session = await self.async_client.asession()
+        self.assertNotEqual(events[0][1]['session_id'], 'ajena')
+        self.assertEqual(events[0][1]['session_id'], await session.aget('chat_session_id'))
+        self.assertNotIn('Calle 123', model.prompts[0])
+        self.assertEqual(len((await sync_to_async(conversation_memory.load)('ajena')).turns), 1)
+        await sync_to_async(conversation_memory.clear)('ajena')
+
+    async def test_full_llm_slots_answer_429_fast(self):
+        slots = LLMSlots(limit=1, wait=0.05)
+        with mock.patch('chat.views.llm_slots', slots), \
+                mock.patch.object(gemini_provider, 'is_configured', return_value=True):
+            await slots.aacquire()
+            response = await self.post('qué monitor me recomendás?')
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '1')
+
+            slots.release()
+            await self.stream('qué monitor me recomendás?', FakeStreamingModel(['El Odyssey 🖥️']))
+        # El stream devuelve el lugar al terminar
+        self.assertEqual(slots.stats(), {'limit': 1, 'in_use': 0, 'rejected': 1})
+
+
+class ChatApiTests(TestCase):
+
+    def setUp(self):
+        response_cache.clear()
+        catalog_index.ready = False
+        get_store().clear()
+
+    async def test_concurrent_requests_wait_for_the_model_together(self):
+        model = FakeStreamingModel(['¡Dale! ', 'Te recomiendo un mouse liviano 🖱️'], delay=0.3)
+        questions = [f'qué me recomendás para jugar {n}?' for n in range(6)]
+
+        with mock.patch.object(gemini_provider, 'get_model', return_value=model), \
+                mock.patch('chat.views.llm_slots', LLMSlots(limit=6, wait=0.5)):
+            started = time.perf_counter()
+            responses = await asyncio.gather(*(
+                self.async_client.post(reverse('chat_api'), data=json.dumps({'message': question}),
+                                       content_type='application/json', secure=True)
+                for n, question in enumerate(questions)
+            ))
+            elapsed = time.perf_counter() - started
+
+        self.assertEqual({response.json()['response'] for response in responses},
+                         {'¡Dale! Te recomiendo un mouse liviano 🖱️'})
+        # Las seis esperas al modelo se superponen (en serie serían 1.8 s)
+        self.assertLess(elapsed, 1.2)
+
+
+class ConversationMemoryTests(SimpleTestCase):
+
+    def test_old_turns_are_folded_into_summary(self):
+        conversation = Conversation()
+        for number in range(5):
+            conversation.add(f'pregunta {number}', 'respuesta', max_turns=3, token_budget=600, summary_tokens=100)
+
+        self.assertEqual([user for user, _ in conversation.turns], ['pregunta 2', 'pregunta 3', 'pregunta 4'])
+        self.assertEqual(conversation.summary, 'pregunta 0 | pregunta 1')
+
+    def test_token_budget_bounds_storage(self):
+        memory = ConversationMemory(max_turns=50, token_budget=200, summary_tokens=30)
+        for number in range(40):
+            memory.append('sesion-1', f'consulta número {number} sobre monitores', 'respuesta ' * 30)
+
+        conversation = memory.load('sesion-1')
+        self.assertLessEqual(conversation.tokens(), 200 + 30)
+        self.assertIn('consulta número 39', conversation.turns[-1][0])
+        self.assertTrue(0 < memory.size('sesion-1') <= memory.stats()['max_bytes'])
+        self.assertEqual(Conversation.loads(conversation.dumps()).turns, conversation.turns)
+        memory.clear('sesion-1')
+        self.assertEqual(memory.size('sesion-1'), 0)
+
+
+class CatalogIndexTests(TestCase):
+
+    def setUp(self):
+        self.g203 = Product.objects.create(name='Mouse Logitech G203 Lightsync', description='', category='mouses',
+                                           price=Decimal('25000.00'), stock=10)
+        self.kumara = Product.objects.create(name='Teclado Redragon Kumara K552', description='',
+                                             category='teclados', price=Decimal('45000.00'), stock=0)
+        Product.objects.create(name='Mouse Redragon Cobra M711', description='', category='mouses',
+                               price=Decimal('18000.00'), stock=10)
+        self.index = CatalogIndex()
+        self.index.build()
+
+    def test_direct_answers_for_specific_products(self):
+        self.assertIn('¡Sí, lo tenemos!', self.index.direct_answer('¿tienen el G203?'))
+        self.assertIn('$45.000,00 (agotado por ahora)', self.index.direct_answer('precio del Kumara'))
+        self.assertIn('Cobra', self.index.direct_answer('precio de los mouses redragon'))
+
+    def test_open_questions_go_to_the_model(self):
+        self.assertIsNone(self.index.direct_answer('qué mouse me recomendás?'))
+        self.assertIsNone(self.index.direct_answer('precio de un mouse gamer'))
+        self.assertEqual([fact.name for fact, _ in self.index.search('redragon')][0], 'Mouse Redragon Cobra M711')
+
+    def test_updates_are_incremental(self):
+        self.kumara.name = 'Teclado Redragon Kumara Pro'
+        self.kumara.price = Decimal('50000.00')
+        self.index.upsert(self.kumara)
+        self.index.remove(self.g203.id)
+
+        self.assertIn('$50.000,00', self.index.direct_answer('precio del kumara pro'))
+        self.assertIsNone(self.index.direct_answer('tienen el g203?'))
+        self.assertNotIn('k552', self.index._postings)
+
+
+    def test_search_skips_products_dropped_between_reads(self):
+        # Un build o un remove entre la lectura de postings y la de facts
+        self.index._facts.pop(self.g203.id)
+
+        names = [fact.name for fact, _ in self.index.search('mouse')]
+
+        self.assertEqual(names, ['Mouse Redragon Cobra M711'])
+
+    def test_refresh_rebuilds_in_background(self):
+        building, release = threading.Event(), threading.Event()
+
+        def slow_build():
+            building.set()
+            release.wait(5)
+
+        self.index._checked_at = 0.0
+        with mock.patch.object(self.index, '_signature_query', return_value='otra firma'), \
+                mock.patch.object(self.index, 'build', side_effect=slow_build):
+            self.index.ensure_fresh()
+            self.assertTrue(building.wait(5))
+            # El request no espera la reconstrucción: se sirve el índice anterior
+            self.assertIn('G203', self.index.direct_answer('¿tienen el G203?'))
+            # Mientras tanto no se lanza otra
+            self.assertIsNone(self.index.refresh_in_background())
+            release.set()
+            for _ in range(50):
+                if not self.index._refreshing:
+                    break
+                time.sleep(0.01)
+        self.assertFalse(self.index._refreshing)
+
+
+class ResponseCacheTests(SimpleTestCase):
+
+    def test_entry_is_served_only_with_the_same_grounding(self):
+        cache = ResponseCache()
+        cache.set('qué mouse me recomendás?', 'v1', 'El G203', 'gemini', grounding='- G203 | $25.000,00')
+
+        self.assertEqual(cache.get('qué mouse me recomendás?', 'v1', grounding='- G203 | $25.000,00'),
+                         ('El G203', 'gemini'))
+        self.assertIsNone(cache.get('qué mouse me recomendás?', 'v1', grounding='- G203 | $22.000,00'))
+        # La entrada vieja se descarta
+        self.assertEqual(len(cache), 0)
+
+
+class FakeGenAI:
+    """Imita google.generativeai: los modelos de `down` fallan con la excepción indicada"""
+
+    def __init__(self, down=None):
+        self.down = down or {}
+        self.calls = []
+        fake = self
+
+        class GenerativeModel:
+            def __init__(self, name):
+                self.model_name = name
+
+            def generate_content(self, prompt, request_options=None):
+                fake.calls.append(self.model_name)
+                if self.model_name in fake.down:
+                    raise fake.down[self.model_name]
+                return FakeChunk('¡Hola!')
+
+        self.GenerativeModel = GenerativeModel
+
+
+class NotFound(Exception):
+    code = 404
+
+
+class TooManyRequests(Exception):
+    code = 429
+
+
+@override_settings(GEMINI_API_KEY='test-key')
+class GeminiProviderTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.delete(CACHE_KEY)
+        cache.delete(REPROBE_KEY)
+        self.genai = FakeGenAI()
+        self.provider = GeminiProvider(candidates=['models/a', 'models/b'])
+        self.provider._genai = lambda: self.genai
+
+    def test_import_does_not_touch_the_network(self):
+        # Proceso limpio: importar las vistas del chat no carga el SDK de Gemini
+        code = (
+            "import sys, django; django.setup(); import chat.views; "
+            "sys.exit('google.generativeai' in sys.modules)"
+        )
+        result = subprocess.run([sys.executable, '-c', code], env={**os.environ, 'GEMINI_API_KEY': 'x'},
+                                capture_output=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr.decode())
+
+    def test_adopts_model_probed_by_another_worker(self):
+        cache.set(CACHE_KEY, 'models/b', 60)
+
+        with mock.patch.object(self.provider, 'probe_in_background') as probe:
+            model = self.provider.get_model()
+
+        self.assertEqual(model.model_name, 'models/b')
+        probe.assert_not_called()
+        self.assertEqual(self.genai.calls, [])
+
+    def test_probe_fails_over_to_next_candidate(self):
+        self.genai.down['models/a'] = NotFound('modelo retirado')
+
+        self.provider.probe_in_background().join(5)
+
+        self.assertEqual(self.provider.model_name, 'models/b')
+        self.assertEqual(cache.get(CACHE_KEY), 'models/b')
+        self.assertEqual(self.genai.calls, ['models/a', 'models/b'])
+
+    def test_only_model_errors_trigger_a_reprobe(self):
+        self.provider._use('models/a', 60)
+
+        with mock.patch.object(self.provider, 'probe_in_background') as probe:
+            self.provider.report_failure('models/a', TooManyRequests('cuota'))
+            self.provider.report_failure('models/a', TimeoutError())
+            probe.assert_not_called()
+
+            self.provider.report_failure('models/a', NotFound('modelo retirado'))
+            probe.assert_called_once_with(skip='models/a')
+
+    def test_reprobes_are_rate_limited(self):
+        self.provider._use('models/a', 60)
+
+        with mock.patch.object(self.provider, 'probe_in_background') as probe:
+            for _ in range(5):
+                self.provider.report_failure('models/a', NotFound('modelo retirado'))
+
+        self.assertEqual(probe.call_count, 1)
+
+
+class IntentEngineTests(SimpleTestCase):
+
+    def setUp(self):
+        self.engine = IntentEngine()
+        self.engine.load([
+            {'name': 'saludo', 'keywords': ['hola'], 'answer': 'Hola', 'priority': 0},
+            {'name': 'envios', 'keywords': ['envío'], 'answer': 'Envíos', 'priority': 15},
+            {'name': 'cuotas', 'keywords': ['cuota'], 'answer': 'Cuotas', 'priority': 16},
+            {'name': 'mouse', 'keywords': ['mouse'], 'answer': 'Mouses', 'priority': 10},
+        ])
+
+    def names(self, message):
+        return [intent.name for intent in self.engine.match(message)]
+
+    def test_overlapping_patterns(self):
+        automaton = AhoCorasick([(word, word) for word in ('he', 'she', 'his', 'hers')])
+        self.assertEqual(sorted(automaton.finditer('ushers')), [(1, 'she'), (2, 'he'), (2, 'hers')])
+
+    def test_accents_and_case_are_folded(self):
+        self.assertEqual(self.names('HACEN ENVIOS?'), ['envios'])
+        self.assertEqual(self.names('hacen envíos?'), ['envios'])
+
+    def test_multi_intent_ordered_by_priority(self):
+        self.assertEqual(self.names('hola! mouse con envio en cuotas?'), ['cuotas', 'envios', 'mouse'])
+        self.assertEqual(self.engine.answer('mouse con envio en cuotas?'), 'Cuotas\nEnvíos')
+
+    def test_low_priority_only_answers_alone(self):
+        self.assertEqual(self.engine.answer('hola'), 'Hola')
+        self.assertEqual(self.engine.answer('hola, envios?'), 'Envíos')
+
+    def test_keywords_start_at_word_boundary(self):
+        self.assertEqual(self.names('reenvio'), [])
+        self.assertIsNone(self.engine.answer('nada que ver'))
@@ -4,4 +4,7 @@ from . import views
 urlpatterns = [
     path('', views.chat_view, name='chat'),
     path('api/', views.chat_api, name='chat_api'),
+    path('api/stream/', views.chat_stream, name='chat_stream'),
+    path('api/cache/', views.chat_cache_stats, name='chat_cache_stats'),
+    path('api/memory/', views.chat_memory_stats, name='chat_memory_stats'),
 ]
\ No newline at end of file
@@ -1,94 +1,26 @@
-import google.generativeai as genai
 import json
+import random
 import uuid
 import logging
 from django.shortcuts import render
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.conf import settings
 
-# Configurar logging
-logger = logging.getLogger(__name__)
+from .catalog import catalog_index
+from marketplace.ratelimit import rate_limit, too_many_requests
 
-# Configurar Gemini con el modelo CORRECTO
-def setup_gemini():
-    try:
-        if hasattr(settings, 'GEMINI_API_KEY') and settings.GEMINI_API_KEY:
-            genai.configure(api_key=settings.GEMINI_API_KEY)
-            
-            # USAR EL MODELO CORRECTO de tu lista
-            model_name = 'models/gemini-2.0-flash-001'  # ← MODELO ESTABLE Y RÁPIDO
-            
-            try:
-                model = genai.GenerativeModel(model_name)
-                # Probar el modelo
-                test_response = model.generate_content("Hola")
-                if test_response.text:
-                    logger.info(f"✅ Gemini configurado con: {model_name}")
-                    return model
-            except Exception as e:
-                logger.error(f"❌ Error con {model_name}: {e}")
-                
-                # Fallback a otros modelos
-                fallback_models = [
-                    'models/gemini-2.5-flash',
-                    'models/gemini-flash-latest', 
-                    'models/gemini-pro-latest'
-                ]
-                
-                for fallback_model in fallback_models:
-                    try:
-                        model = genai.GenerativeModel(fallback_model)
-                        test_response = model.generate_content("Hola")
-                        if test_response.text:
-                            logger.info(f"✅ Gemini configurado con fallback: {fallback_model}")
-                            return model
-                    except:
-                        continue
-            
-            logger.error("❌ Ningún modelo de Gemini funcionó")
-            return None
-            
-        else:
-            logger.warning("⚠️  GEMINI_API_KEY no configurada")
-            return None
-            
-    except Exception as e:
-        logger.error(f"❌ Error configurando Gemini: {e}")
-        return None
-
-# Configurar al iniciar
-gemini_model = setup_gemini()
+from .gemini import gemini_provider, llm_slots
+from .intents import intent_engine
+from .memory import conversation_memory
+from .response_cache import prompt_version, response_cache
 
-def chat_view(request):
-    session_id = request.session.get('chat_session_id')
-    if not session_id:
-        session_id = str(uuid.uuid4())
-        request.session['chat_session_id'] = session_id
-    
-    return render(request, 'chat/chat.html', {
-        'session_id': session_id,
-        'gemini_available': gemini_model is not None
-    })
+# Configurar logging
+logger = logging.getLogger(__name__)
 
-@csrf_exempt
-def chat_api(request):
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            user_message = data.get('message', '').strip()
-            session_id = data.get('session_id')
-            
-            logger.info(f"📨 Mensaje del usuario: {user_message}")
-            
-            if not user_message:
-                return JsonResponse({'response': '¡Hola! ¿En qué puedo ayudarte? 😊'})
-            
-            # USAR GEMINI CON EL MODELO CORRECTO
-            if gemini_model:
-                try:
-                    # Prompt optimizado para Masivo Tech
-                    prompt = f"""Eres Masibot, el asistente virtual oficial de Masivo Tech.
+# Prompt optimizado para Masivo Tech
+PROMPT_TEMPLATE = """Eres Masibot, el asistente virtual oficial de Masivo Tech.
 
 INFORMACIÓN REAL:
 - Tienda: Masivo Tech - Periféricos gaming
@@ -100,83 +32,291 @@ INFORMACIÓN REAL:
 - Contacto: WhatsApp +54 11 1234-5678, info@masivotech.com
 - Horario: Lunes a Viernes 9-18hs
 
+PRODUCTOS DEL CATÁLOGO RELACIONADOS (precio y stock actuales):
+{catalog}
+
+CONVERSACIÓN HASTA AHORA:
+{history}
+
 RESPONDE:
 - En español argentino coloquial y amigable
 - Usa emojis relevantes 🎮🖱️⌨️🎧🚚💳
 - Sé entusiasta sobre gaming
 - Responde específicamente a la consulta
-- NO inventes precios exactos
-- NO inventes stocks exactos
+- Para precios y stock usa SOLO los datos de la lista de productos
+- Si un producto no figura en la lista, NO inventes precios ni stocks
 - Mantén respuestas breves (máximo 2 párrafos)
+- Ten en cuenta la conversación previa si la consulta hace referencia a ella
 
-Consulta: {user_message}
+Consulta: {message}
 
 Respuesta:"""
-                    
-                    response = gemini_model.generate_content(prompt)
-                    bot_response = response.text.strip()
-                    
-                    logger.info(f"🤖 Gemini 2.0 Flash respondió: {bot_response}")
-                    
-                    return JsonResponse({
-                        'response': bot_response,
-                        'session_id': session_id,
-                        'source': 'gemini_2.0_flash'
-                    })
-                    
-                except Exception as e:
-                    logger.error(f"❌ Error con Gemini: {e}")
-                    # Continuar con fallback
-            
-            # FALLBACK INTELIGENTE
-            return handle_fallback_response(user_message)
-                
-        except Exception as e:
-            logger.error(f"❌ Error general: {e}")
-            return JsonResponse({
-                'response': '¡Hola! 😊 Soy Masibot. ¿En qué puedo ayudarte? 🎮'
-            })
-    
-    return JsonResponse({'error': 'Método no permitido'}, status=405)
 
-def handle_fallback_response(user_message):
-    """Sistema de respuestas predefinidas"""
-    user_lower = user_message.lower()
-    
-    responses = {
-        'hola': "¡Hola! 😊 Soy Masibot de Masivo Tech. ¿Buscás algún periférico gaming? 🎮",
-        'mouse': "🖱️ Tenemos mouses gaming Logitech, Razer, Redragon. ¿Inalámbricos o con cable?",
-        'teclado': "🎹 Teclados mecánicos con switches azul, rojo o marrón. Marcas: Redragon, Logitech, Razer",
-        'auricular': "🎧 Auriculares gaming con sonido surround 7.1. HyperX, Logitech, Razer",
-        'monitor': "🖥️ Monitores gaming 144Hz, 240Hz. Samsung, LG, ASUS. ¿Qué tamaño?",
-        'silla': "💺 Sillas gamer ergonómicas con soporte lumbar ajustable",
-        'logitech': "🎮 Logitech G! Pro X Superlight, G502 Hero, G203 Lightsync. ¿Cuál modelo?",
-        'razer': "🐍 Razer! DeathAdder, Viper, BlackWidow. Calidad premium",
-        'redragon': "🐲 Redragon! Kumara, Griffin, Lamia. Excelente calidad-precio",
-        'envío': "🚚 ¡Envíos a todo el país! CABA: 24-48hs | Interior: 3-5 días | Gratis +$50.000",
-        'envios': "🚚 ¡Envíos a todo el país! CABA: 24-48hs | Interior: 3-5 días | Gratis +$50.000",
-        'pago': "💳 Tarjetas (12 cuotas SIN interés), transferencia (10% OFF), efectivo",
-        'cuota': "💰 ¡12 cuotas SIN interés! Transferencia con 10% de descuento",
-        'garantía': "✅ Garantía oficial 6-12 meses. Distribuidores autorizados",
-        'garantia': "✅ Garantía oficial 6-12 meses. Distribuidores autorizados",
-        'stock': "📦 Todos los productos publicados están disponibles. Stock en tiempo real!",
-        'contacto': "📞 WhatsApp: +54 11 1234-5678 | Email: info@masivotech.com | Lun-Vie 9-18hs",
-        'whatsapp': "💬 WhatsApp: +54 11 1234-5678 - Respondemos al instante!",
-        'gracias': "¡De nada! 😊 ¿Necesitás algo más?",
-    }
-    
-    for keyword, answer in responses.items():
-        if keyword in user_lower:
-            return JsonResponse({'response': answer, 'source': 'fallback'})
+
+PROMPT_VERSION = prompt_version(PROMPT_TEMPLATE)
+
+BUSY_MESSAGE = 'Masibot está atendiendo muchas consultas. Probá de nuevo en unos segundos 🙏'
+
+
+def build_prompt(user_message, catalog='', history=''):
+    return PROMPT_TEMPLATE.format(message=user_message, catalog=catalog, history=history)
+
+
+def ground(user_message):
+    """
+    Datos del catálogo para la consulta: (respuesta directa o None, productos
+    para el prompt, versión del cache). Los productos del prompt también son la
+    huella de la entrada en el cache: una respuesta con precios viejos no se
+    sirve, pero vender una unidad no invalida las demás respuestas.
+    """
+    try:
+        catalog_index.ensure_fresh()
+        results = catalog_index.search(user_message)
+        direct = catalog_index.direct_answer(user_message, results)
+        context = catalog_index.prompt_context(results)
+    except Exception as e:
+        logger.error(f"❌ Error consultando el catálogo: {e}")
+        direct, context = None, catalog_index.prompt_context([])
+    return direct, context, PROMPT_VERSION
+
+
+def chat_session_id(request):
+    """
+    ID de la conversación, guardado en la sesión de Django. Los endpoints del
+    chat no usan el session_id del body: cualquiera podría leer o ensuciar la
+    memoria de otra conversación con solo conocerlo.
+    """
+    session_id = request.session.get('chat_session_id')
+    if not session_id:
+        session_id = str(uuid.uuid4())
+        request.session['chat_session_id'] = session_id
+    return session_id
+
+def chat_view(request):
+    chat_session_id(request)
     
-    import random
-    contextual = [
-        f"😊 ¿Sobre '{user_message}'? ¡Contame más! ¿Qué te interesa? 🎮",
-        f"🎯 ¿'{user_message}'? Preguntame sobre productos gaming, envíos o garantías!",
-        f"🖥️ ¿Necesitás info sobre '{user_message}'? Soy experto en periféricos!",
-    ]
+    return render(request, 'chat/chat.html', {
+        'gemini_available': gemini_provider.is_configured()
+    })
+
+# La memoria de conversación vive en el cache de Django (Redis en producción): fuera del event loop
+remember = sync_to_async(conversation_memory.append, thread_sensitive=False)
+load_history = sync_to_async(conversation_memory.load, thread_sensitive=False)
+
+async def resolve_ready(user_message):
+    """
+    Catálogo (ORM) y cache de respuestas, antes de pensar en el modelo:
+    (respuesta lista o None, productos para el prompt, versión del cache)
+    """
+    direct, catalog, version = await sync_to_async(ground)(user_message)
+    if direct:
+        return (direct, 'catalog'), catalog, version
+    # La búsqueda por similitud es un producto matriz-vector: también en un hilo
+    cached = await sync_to_async(response_cache.get, thread_sensitive=False)(user_message, version, catalog)
+    return ((cached[0], 'cache') if cached else None), catalog, version
+
+@csrf_exempt
+@rate_limit('chat')
+async def chat_api(request):
+    """Vista async: mientras Gemini responde el worker sigue atendiendo otros requests (ASGI)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        user_message = data.get('message', '').strip()
+        session_id = await sync_to_async(chat_session_id)(request)
+        
+        logger.info(f"📨 Mensaje del usuario: {user_message}")
+        
+        if not user_message:
+            return JsonResponse({'response': '¡Hola! ¿En qué puedo ayudarte? 😊'})
+        
+        # Consultas directas de precio/stock (catálogo) y preguntas frecuentes (cache)
+        ready, catalog, version = await resolve_ready(user_message)
+        if ready:
+            answer, source = ready
+            await remember(session_id, user_message, answer)
+            return JsonResponse({'response': answer, 'session_id': session_id, 'source': source})
+        
+        history = await load_history(session_id)
+        
+        # Modelo resuelto de forma perezosa (sin bloquear en pruebas de red)
+        gemini_model = await sync_to_async(gemini_provider.get_model, thread_sensitive=False)()
+        model_name = gemini_provider.model_name
+        if gemini_model:
+            # Cupo de llamadas simultáneas al modelo: si está lleno, 429 inmediato
+            if not await llm_slots.aacquire():
+                return too_many_requests(1, BUSY_MESSAGE)
+            try:
+                prompt = build_prompt(user_message, catalog, history.prompt_block())
+                response = await gemini_model.generate_content_async(prompt)
+                bot_response = response.text.strip()
+                
+                logger.info(f"🤖 Gemini respondió: {bot_response}")
+                await remember(session_id, user_message, bot_response)
+                if not history:
+                    # Solo se cachean respuestas que no dependen de la conversación previa
+                    await sync_to_async(response_cache.set, thread_sensitive=False)(
+                        user_message, version, bot_response, model_name, catalog
+                    )
+                
+                return JsonResponse({
+                    'response': bot_response,
+                    'session_id': session_id,
+                    'source': model_name
+                })
+                
+            except Exception as e:
+                logger.error(f"❌ Error con Gemini: {e}")
+                gemini_provider.report_failure(model_name, e)
+                # Continuar con fallback
+            finally:
+                llm_slots.release()
+        
+        # FALLBACK INTELIGENTE
+        answer, source = fallback_answer(user_message)
+        await remember(session_id, user_message, answer)
+        return JsonResponse({'response': answer, 'source': source})
+            
+    except Exception as e:
+        logger.error(f"❌ Error general: {e}")
+        return JsonResponse({
+            'response': '¡Hola! 😊 Soy Masibot. ¿En qué puedo ayudarte? 🎮'
+        })
+
+# =============================================================================
+# STREAMING (Server-Sent Events)
+# =============================================================================
+
+def sse_event(event, data):
+    """Serializa un evento SSE con datos JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_answer(user_message, session_id, catalog, version, ready=None, holds_slot=False):
+    """
+    Genera los eventos de la respuesta: 'start' de inmediato, un 'chunk' por
+    fragmento del modelo y 'done' al final. `ready` es una respuesta ya
+    resuelta (catálogo o cache). Sin modelo (o si falla antes del primer
+    fragmento) se envía la respuesta predefinida como un único chunk.
+    """
+    yield sse_event('start', {'session_id': session_id})
+
+    try:
+        if ready:
+            answer, source = ready
+            await remember(session_id, user_message, answer)
+            yield sse_event('chunk', {'text': answer})
+            yield sse_event('done', {'source': source})
+            return
+
+        history = await load_history(session_id)
+
+        gemini_model = await sync_to_async(gemini_provider.get_model, thread_sensitive=False)()
+        model_name = gemini_provider.model_name
+        parts = []
+        sent = False
+        if gemini_model:
+            try:
+                response = await gemini_model.generate_content_async(
+                    build_prompt(user_message, catalog, history.prompt_block()), stream=True
+                )
+                async for chunk in response:
+                    text = chunk.text
+                    if text:
+                        sent = True
+                        parts.append(text)
+                        yield sse_event('chunk', {'text': text})
+                if sent:
+                    answer = ''.join(parts).strip()
+                    await remember(session_id, user_message, answer)
+                    if not history:
+                        await sync_to_async(response_cache.set, thread_sensitive=False)(
+                            user_message, version, answer, model_name, catalog
+                        )
+                    yield sse_event('done', {'source': model_name})
+                    return
+            except Exception as e:
+                logger.error(f"❌ Error con Gemini (stream): {e}")
+                gemini_provider.report_failure(model_name, e)
+                if sent:
+                    # La respuesta quedó a medias: avisar en lugar de mezclar con el fallback
+                    yield sse_event('error', {'message': 'Se interrumpió la respuesta. Intentá nuevamente.'})
+                    return
+
+        answer, source = fallback_answer(user_message)
+        await remember(session_id, user_message, answer)
+        yield sse_event('chunk', {'text': answer})
+        yield sse_event('done', {'source': source})
+    finally:
+        if holds_slot:
+            llm_slots.release()
+
+@csrf_exempt
+@rate_limit('chat')
+async def chat_stream(request):
+    """Variante de chat_api que envía la respuesta a medida que se genera"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        data = {}
+    user_message = str(data.get('message', '')).strip()
+    session_id = await sync_to_async(chat_session_id)(request)
+
+    if not user_message:
+        return JsonResponse({'response': '¡Hola! ¿En qué puedo ayudarte? 😊'})
+
+    logger.info(f"📨 Mensaje del usuario (stream): {user_message}")
+
+    # Catálogo y cache se resuelven antes de abrir el stream: no ocupan cupo del modelo
+    ready, catalog, version = await resolve_ready(user_message)
+
+    holds_slot = False
+    if not ready and gemini_provider.is_configured():
+        holds_slot = await llm_slots.aacquire()
+        if not holds_slot:
+            return too_many_requests(1, BUSY_MESSAGE)
+
+    response = StreamingHttpResponse(
+        stream_answer(user_message, session_id, catalog, version, ready, holds_slot),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Evita que nginx/proxies acumulen la respuesta antes de reenviarla
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@staff_member_required
+def chat_cache_stats(request):
+    """Contadores del cache de respuestas y del cupo del modelo de este worker"""
+    return JsonResponse({**response_cache.stats(), 'llm_slots': llm_slots.stats()})
+
+@staff_member_required
+def chat_memory_stats(request):
+    """Tamaño de la memoria de conversación (global del worker o de ?session_id=)"""
+    stats = conversation_memory.stats()
+    session_id = request.GET.get('session_id')
+    if session_id:
+        stats['session'] = {
+            'session_id': session_id,
+            'bytes': conversation_memory.size(session_id),
+            'tokens': conversation_memory.load(session_id).tokens(),
+        }
+    return JsonResponse(stats)
+
+CONTEXTUAL_ANSWERS = [
+    "😊 ¿Sobre '{message}'? ¡Contame más! ¿Qué te interesa? 🎮",
+    "🎯 ¿'{message}'? Preguntame sobre productos gaming, envíos o garantías!",
+    "🖥️ ¿Necesitás info sobre '{message}'? Soy experto en periféricos!",
+]
+
+def fallback_answer(user_message):
+    """Respuesta predefinida para el mensaje: (texto, origen)"""
+    answer = intent_engine.answer(user_message)
+    if answer:
+        return answer, 'fallback'
     
-    return JsonResponse({
-        'response': random.choice(contextual),
-        'source': 'fallback_contextual'
-    })
\ No newline at end of file
+    return random.choice(CONTEXTUAL_ANSWERS).format(message=user_message), 'fallback_contextual'
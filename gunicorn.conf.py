@@ -0,0 +1,25 @@
+# === gunicorn.conf.py - Modo de ejecución del servidor web ===
+#
+#   ASGI_MODE=False (por defecto): workers sync con masivo_tech.wsgi. Cada
+#     worker atiende un request a la vez; una llamada a Gemini o MercadoPago
+#     lo deja bloqueado hasta que responde.
+#   ASGI_MODE=True: workers de uvicorn con masivo_tech.asgi. Las vistas async
+#     (chat_api, chat_stream, create_mercadopago_payment) esperan la red sin
+#     ocupar el worker; el resto del sitio sigue siendo sync y Django lo corre
+#     en hilos.
+#
+# La cantidad de workers sale de WEB_CONCURRENCY (gunicorn la lee solo).
+# Comparación de capacidad por worker: manage.py benchmark_workers
+
+import os
+
+ASGI_MODE = os.getenv('ASGI_MODE', 'False').lower() == 'true'
+
+if ASGI_MODE:
+    wsgi_app = 'masivo_tech.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'masivo_tech.wsgi:application'
+
+# Los streams del chat pueden durar más que el default de 30 s
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
@@ -1,10 +1,16 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Product, Order, OrderItem, ShippingOption, ShippingZone
+from .models import (
+    Order, OrderItem, PaymentEvent, PendingProductImage, Product, SeedManifest, ShippingOption, ShippingZone,
+)
 from django.urls import path
 from django.shortcuts import redirect
 from django.utils import timezone
 from datetime import timedelta
+from django.db import transaction
+from .inventory import refund_order, release_order
+from .sales import is_sold, reverse_sale, track_status_change
+from .images import rendition_src
 
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['image_preview', 'name', 'category_display', 'price', 'stock', 'available', 'created_at']
@@ -23,7 +29,8 @@ class ProductAdmin(admin.ModelAdmin):
     
     def image_preview(self, obj):
         if obj.image and obj.image.url:
-            return format_html('<img src="{}" style="width: 50px; height: 50px; object-fit: cover;" />', obj.image.url)
+            return format_html('<img src="{}" style="width: 50px; height: 50px; object-fit: cover;" />',
+                               rendition_src(obj, 'thumb'))
         return "📷 Sin imagen"
     image_preview.short_description = 'Imagen'
     
@@ -74,6 +81,46 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     ]
     
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        with transaction.atomic():
+            # Estado real con lock (no el del formulario): un webhook puede haberlo cambiado
+            previous = Order.objects.select_for_update().values_list('status', flat=True).get(id=obj.id)
+            if previous == 'pending' and obj.status != 'pending' and not is_sold(obj.status):
+                # Cancelada a mano: la reserva vuelve al stock
+                release_order(obj.id, status=obj.status)
+                obj.reserved_until = None
+            elif is_sold(previous) and not is_sold(obj.status):
+                # Venta anulada a mano: mismo camino que un reembolso (stock y resumen)
+                refund_order(obj.id)
+            else:
+                # Pago confirmado a mano o cambio entre estados de venta: el stock ya está tomado
+                if previous == 'pending' and is_sold(obj.status):
+                    obj.reserved_until = None
+                track_status_change(obj.id, previous, obj.status)
+            super().save_model(request, obj, form, change)
+    
+    def delete_model(self, request, obj):
+        # El resumen de ventas y la reserva se corrigen antes de perder los items
+        with transaction.atomic():
+            self._before_delete(Order.objects.filter(id=obj.id))
+            super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            self._before_delete(queryset)
+            super().delete_queryset(request, queryset)
+    
+    @staticmethod
+    def _before_delete(orders):
+        # Estado leído con lock: un webhook en paralelo no puede cambiarlo a mitad del borrado
+        for order_id, status in orders.select_for_update().values_list('id', 'status'):
+            if is_sold(status):
+                reverse_sale(order_id)
+            elif status == 'pending':
+                release_order(order_id)
+    
     def total_display(self, obj):
         return f"${obj.total}"
     total_display.short_description = 'Total'
@@ -97,6 +144,31 @@ class ShippingZoneAdmin(admin.ModelAdmin):
     list_display = ['name', 'postal_code_start', 'postal_code_end', 'shipping_option']
     list_filter = ['shipping_option']
 
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ['notification_id', 'topic', 'resource_id', 'status', 'attempts', 'received_at', 'processed_at',
+                    'next_attempt_at']
+    list_filter = ['status', 'topic']
+    search_fields = ['notification_id', 'resource_id']
+    readonly_fields = ['notification_id', 'topic', 'resource_id', 'payload', 'attempts', 'last_error',
+                       'received_at', 'processed_at', 'next_attempt_at']
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(SeedManifest)
+class SeedManifestAdmin(admin.ModelAdmin):
+    list_display = ['name', 'checksum', 'applied_at']
+    readonly_fields = ['name', 'checksum', 'files', 'applied_at']
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(PendingProductImage)
+class PendingProductImageAdmin(admin.ModelAdmin):
+    list_display = ['product', 'url', 'attempts', 'last_error', 'created_at']
+    raw_id_fields = ['product']
+
 # Registrar modelos
 admin.site.register(Product, ProductAdmin)
 admin.site.register(Order, OrderAdmin)
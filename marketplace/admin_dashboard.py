@@ -1,77 +1,148 @@
+# === marketplace/admin_dashboard.py - Dashboard de ventas del admin ===
+#
+# Lee el resumen materializado DailySales en lugar de recorrer las órdenes:
+# la carga hace una consulta por bloque (ventas, órdenes, top productos,
+# inventario) sin importar el tamaño del historial.
+
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
 from django.contrib import admin
-from django.urls import path
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
 from django.shortcuts import render
-from django.db.models import Sum, Count, Avg
 from django.utils import timezone
-from datetime import timedelta
-import json
-from .models import Order, OrderItem, Product
+from django.utils.dateparse import parse_date
+
+from .models import DailySales, Order, OrderItem, Product
+from .sales import LINE_TOTAL, SOLD_STATUSES
+
+DEFAULT_RANGE_DAYS = 30
+MAX_RANGE_DAYS = 366 * 3
+LOW_STOCK_THRESHOLD = 10
+
+
+def dashboard_range(request):
+    """Rango de fechas (inclusivo) desde ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD"""
+    today = timezone.localdate()
+    end = parse_date(request.GET.get('hasta') or '') or today
+    start = parse_date(request.GET.get('desde') or '') or end - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    if start > end:
+        start, end = end, start
+    start = max(start, end - timedelta(days=MAX_RANGE_DAYS))
+    return start, end
+
+
+def datetime_bounds(start, end):
+    """[inicio del primer día, inicio del día siguiente al último) en la zona del sitio"""
+    return (
+        timezone.make_aware(datetime.combine(start, time.min)),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+    )
+
+
+def daily_series(start, end, sales_rows, order_rows):
+    """Serie completa día por día (los días sin ventas quedan en cero)"""
+    by_day = {}
+    for row in sales_rows:
+        day = by_day.setdefault(row['date'], {'total': Decimal('0'), 'units': 0, 'orders': 0})
+        day['total'] += row['revenue']
+        day['units'] += row['units']
+    for row in order_rows:
+        day = by_day.setdefault(row['day'], {'total': Decimal('0'), 'units': 0, 'orders': 0})
+        day['orders'] += row['count']
+
+    series = []
+    day = start
+    while day <= end:
+        values = by_day.get(day, {'total': Decimal('0'), 'units': 0, 'orders': 0})
+        series.append({
+            'date': day.isoformat(),
+            'day_name': day.strftime('%d/%m'),
+            'total': float(values['total']),
+            'units': values['units'],
+            'count': values['orders'],
+        })
+        day += timedelta(days=1)
+    return series
+
 
 def admin_dashboard(request):
     """Dashboard personalizado para el admin"""
-    
-    # Estadísticas principales
-    total_orders = Order.objects.count()
-    total_revenue = Order.objects.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    total_products = Product.objects.count()
-    low_stock_products = Product.objects.filter(stock__lt=10, stock__gt=0).count()
-    out_of_stock_products = Product.objects.filter(stock=0).count()
-    
-    # Ventas últimos 30 días
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    recent_orders = Order.objects.filter(created_at__gte=thirty_days_ago)
-    recent_revenue = recent_orders.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    
-    # Órdenes por estado
-    orders_by_status = Order.objects.values('status').annotate(
-        count=Count('id'),
-        revenue=Sum('total_amount')
+    start, end = dashboard_range(request)
+    since, until = datetime_bounds(start, end)
+
+    # 1. Ventas por día y categoría (resumen materializado)
+    sales_rows = list(
+        DailySales.objects.filter(date__range=(start, end))
+        .values('date', 'category', 'orders', 'units', 'revenue')
+    )
+    categories = {}
+    for row in sales_rows:
+        category = categories.setdefault(row['category'], {'orders': 0, 'units': 0, 'revenue': Decimal('0')})
+        category['orders'] += row['orders']
+        category['units'] += row['units']
+        category['revenue'] += row['revenue']
+    category_labels = dict(Product.CATEGORY_CHOICES)
+    sales_by_category = sorted(
+        ({'category': category_labels.get(key, key), **values} for key, values in categories.items()),
+        key=lambda item: item['revenue'], reverse=True,
     )
-    
-    # Productos más vendidos
-    top_products = OrderItem.objects.values(
-        'product__name', 
-        'product__category'
-    ).annotate(
-        total_sold=Sum('quantity'),
-        revenue=Sum('price')
-    ).order_by('-total_sold')[:10]
-    
-    # Ventas por día (últimos 7 días)
-    sales_data = []
-    for i in range(7):
-        day = timezone.now() - timedelta(days=i)
-        day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        day_sales = Order.objects.filter(
-            created_at__range=(day_start, day_end)
-        ).aggregate(
-            total=Sum('total_amount'),
-            count=Count('id')
+
+    # 2. Órdenes del rango por día y estado (TruncDate sobre el índice de created_at)
+    order_rows = list(
+        Order.objects.filter(created_at__gte=since, created_at__lt=until)
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'status')
+        .annotate(count=Count('id'), revenue=Sum('total'))
+        .order_by()
+    )
+    status_totals = {}
+    for row in order_rows:
+        totals = status_totals.setdefault(row['status'], {'status': row['status'], 'count': 0, 'revenue': 0})
+        totals['count'] += row['count']
+        totals['revenue'] += float(row['revenue'] or 0)
+    sold_orders = [row for row in order_rows if row['status'] in SOLD_STATUSES]
+    sales_data = daily_series(start, end, sales_rows, sold_orders)
+
+    # 3. Productos más vendidos del rango
+    top_products = list(
+        OrderItem.objects.filter(
+            order__status__in=SOLD_STATUSES, order__created_at__gte=since, order__created_at__lt=until
         )
-        
-        sales_data.append({
-            'date': day.strftime('%Y-%m-%d'),
-            'day_name': day.strftime('%a'),
-            'total': day_sales['total'] or 0,
-            'count': day_sales['count'] or 0
-        })
-    
-    sales_data.reverse()
-    
+        .values('product__name', 'product__category')
+        .annotate(total_sold=Sum('quantity'), revenue=Sum(LINE_TOTAL))
+        .order_by('-total_sold')[:10]
+    )
+
+    # 4. Inventario: contadores en un solo aggregate + lista de alertas
+    inventory = Product.objects.aggregate(
+        total=Count('id'),
+        low=Count('id', filter=Q(stock__lt=LOW_STOCK_THRESHOLD, stock__gt=0)),
+        out=Count('id', filter=Q(stock=0)),
+    )
+    low_stock_products_list = Product.objects.filter(stock__lt=LOW_STOCK_THRESHOLD).only(
+        'id', 'name', 'stock'
+    ).order_by('stock', 'name')[:10]
+
     context = {
+        **admin.site.each_context(request),
         'title': 'Dashboard MasivoTech',
-        'total_orders': total_orders,
-        'total_revenue': total_revenue,
-        'total_products': total_products,
-        'low_stock_products': low_stock_products,
-        'out_of_stock_products': out_of_stock_products,
-        'recent_revenue': recent_revenue,
-        'orders_by_status': list(orders_by_status),
-        'top_products': list(top_products),
+        'start': start,
+        'end': end,
+        'total_orders': sum(row['count'] for row in sold_orders),
+        'total_revenue': sum((item['revenue'] for item in sales_by_category), Decimal('0')),
+        'units_sold': sum(item['units'] for item in sales_by_category),
+        'total_products': inventory['total'],
+        'low_stock_products': inventory['low'],
+        'out_of_stock_products': inventory['out'],
+        'orders_by_status': json.dumps(list(status_totals.values())),
+        'sales_by_category': sales_by_category,
+        'top_products': top_products,
+        'low_stock_products_list': low_stock_products_list,
         'sales_data': sales_data,
         'sales_json': json.dumps(sales_data),
     }
-    
-    return render(request, 'admin/marketplace/dashboard.html', context)
\ No newline at end of file
+
+    return render(request, 'admin/marketplace/dashboard.html', context)
@@ -0,0 +1,237 @@
+# === marketplace/autocomplete.py - Índice de autocompletado en memoria ===
+#
+# Mapa de edge n-grams (prefijos) -> ids de producto sobre nombre, marca y
+# categoría. Cada producto guarda su resultado ya serializado a JSON, así
+# /buscar/autocomplete/ responde sin tocar la base ni Cloudinary.
+#
+# Actualización:
+#   - Construcción perezosa en la primera consulta de cada proceso (importar el
+#     módulo o arrancar el worker no toca la base)
+#   - Señales post_save / post_delete del propio proceso (incremental)
+#   - Cada REFRESH_INTERVAL segundos, una consulta de firma (count + max updated_at)
+#     detecta cambios hechos por otros workers o por queryset.update(). Corre en
+#     un hilo, como en chat/catalog.py: el request solo lee el índice en memoria.
+
+import json
+import logging
+import threading
+import time
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Count, Max
+from django.urls import reverse
+
+from .images import rendition_src
+from .models import Product
+from .text import fold, words
+
+logger = logging.getLogger(__name__)
+
+BRANDS = {
+    'logitech', 'razer', 'redragon', 'hyperx', 'steelseries',
+    'corsair', 'samsung', 'lg', 'asus',
+}
+
+# Peso de cada tipo de token al rankear
+WEIGHT_BRAND = 3
+WEIGHT_NAME = 2
+WEIGHT_CATEGORY = 1
+WEIGHT_NAME_PREFIX = 4  # la consulta completa es prefijo del nombre
+
+
+class _Entry:
+    __slots__ = ('fragment', 'name_key', 'tokens')
+
+    def __init__(self, fragment, name_key, tokens):
+        self.fragment = fragment
+        self.name_key = name_key
+        self.tokens = tokens  # token -> peso
+
+
+class AutocompleteIndex:
+    MIN_QUERY_LENGTH = 2
+    MAX_GRAM = 20
+    REFRESH_INTERVAL = 30
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._grams = {}
+        self._entries = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self._refreshing = False
+        self.ready = False
+
+    # -------------------------------------------------------------------------
+    # Construcción
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _entry_for(product):
+        tokens = {}
+        for token in words(product.get_category_display()):
+            tokens[token] = max(tokens.get(token, 0), WEIGHT_CATEGORY)
+        for token in words(product.name):
+            weight = WEIGHT_BRAND if token in BRANDS else WEIGHT_NAME
+            tokens[token] = max(tokens.get(token, 0), weight)
+
+        fragment = json.dumps({
+            'name': product.name,
+            'category': product.get_category_display(),
+            'price': '{:.2f}'.format(Decimal(str(product.price))),
+            'url': reverse('product_detail', args=[product.id]),
+            'image': rendition_src(product, 'thumb') or None,
+        }, ensure_ascii=False)
+        return _Entry(fragment, fold(product.name), tokens)
+
+    def _grams_for(self, entry):
+        for token in entry.tokens:
+            for size in range(1, min(len(token), self.MAX_GRAM) + 1):
+                yield token[:size]
+
+    @staticmethod
+    def _signature_query():
+        return Product.objects.filter(available=True).aggregate(
+            count=Count('id'), last=Max('updated_at')
+        )
+
+    def build(self):
+        """Reconstruye el índice completo y lo publica de forma atómica"""
+        started = time.perf_counter()
+        signature = self._signature_query()
+        entries = {}
+        grams = {}
+        for product in Product.objects.filter(available=True).iterator():
+            entry = self._entry_for(product)
+            entries[product.id] = entry
+            for gram in self._grams_for(entry):
+                grams.setdefault(gram, []).append(product.id)
+
+        with self._lock:
+            self._grams = {gram: tuple(ids) for gram, ids in grams.items()}
+            self._entries = entries
+            self._signature = signature
+            self._checked_at = time.monotonic()
+            self.ready = True
+
+        logger.info(
+            "Índice de autocompletado: %s productos, %s prefijos en %.1f ms",
+            len(entries), len(grams), (time.perf_counter() - started) * 1000,
+        )
+
+    def ensure_fresh(self):
+        if not self.ready:
+            # Primera búsqueda del proceso: un solo hilo construye, el resto espera
+            with self._build_lock:
+                if not self.ready:
+                    self.build()
+            return
+        if time.monotonic() - self._checked_at < self.REFRESH_INTERVAL:
+            return
+        self._checked_at = time.monotonic()
+        self.refresh_in_background()
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        thread = threading.Thread(target=self._refresh, name='autocomplete-refresh', daemon=True)
+        thread.start()
+        return thread
+
+    def _refresh(self):
+        try:
+            if self._signature_query() != self._signature:
+                self.build()
+        except Exception as e:
+            logger.warning("No se pudo actualizar el índice de autocompletado: %s", e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+            # La conexión es de este hilo: nadie más la va a cerrar
+            connection.close()
+
+    # -------------------------------------------------------------------------
+    # Actualización incremental (copy-on-write por prefijo)
+    # -------------------------------------------------------------------------
+
+    def _unlink(self, product_id):
+        old = self._entries.pop(product_id, None)
+        if old is None:
+            return
+        for gram in set(self._grams_for(old)):
+            ids = tuple(i for i in self._grams.get(gram, ()) if i != product_id)
+            if ids:
+                self._grams[gram] = ids
+            else:
+                self._grams.pop(gram, None)
+
+    def upsert(self, product):
+        if not self.ready:
+            return
+        entry = self._entry_for(product) if product.available else None
+        with self._lock:
+            self._unlink(product.id)
+            if entry is not None:
+                self._entries[product.id] = entry
+                for gram in set(self._grams_for(entry)):
+                    self._grams[gram] = self._grams.get(gram, ()) + (product.id,)
+
+    def remove(self, product_id):
+        if not self.ready:
+            return
+        with self._lock:
+            self._unlink(product_id)
+
+    # -------------------------------------------------------------------------
+    # Consulta
+    # -------------------------------------------------------------------------
+
+    def search(self, query, limit=5):
+        """Devuelve los fragmentos JSON de los mejores `limit` productos"""
+        terms = words(query)
+        if not terms:
+            return []
+
+        grams = self._grams
+        entries = self._entries
+
+        candidates = None
+        for term in terms:
+            ids = set(grams.get(term[:self.MAX_GRAM], ()))
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return []
+
+        full_query = fold(query).strip()
+        scored = []
+        for product_id in candidates:
+            entry = entries.get(product_id)
+            if entry is None:
+                continue
+            score = 0
+            for term in terms:
+                best = max(
+                    (weight for token, weight in entry.tokens.items() if token.startswith(term)),
+                    default=0,
+                )
+                if not best:
+                    # Término más largo que MAX_GRAM que no coincide completo
+                    break
+                score += best
+            else:
+                if entry.name_key.startswith(full_query):
+                    score += WEIGHT_NAME_PREFIX
+                scored.append((-score, entry.name_key, entry.fragment))
+
+        scored.sort()
+        return [fragment for _, _, fragment in scored[:limit]]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+autocomplete_index = AutocompleteIndex()
@@ -1,62 +1,66 @@
 from decimal import Decimal
-from django.conf import settings
-from .models import Product
+from .cart_store import get_cart_store
+from .snapshots import get_snapshots
 
 class Cart:
     def __init__(self, request):
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        # Persistencia delegada (sesión o tabla CartLine, según settings.CART_STORE)
+        self.store = get_cart_store(request)
+        self._cart = None
+        # Items ya resueltos; se descartan en cada modificación
+        self._items = None
+
+    @property
+    def cart(self):
+        """Líneas {product_id: {'quantity', 'price'}}, cargadas al primer uso"""
+        if self._cart is None:
+            self._cart = self.store.load()
+        return self._cart
 
     def add(self, product, quantity=1, update_quantity=False):
-        product_id = str(product.id)
-        
-        if product_id not in self.cart:
-            self.cart[product_id] = {
-                'quantity': 0,
-                'price': str(product.price)
-            }
-        
         if update_quantity:
             # Validar que no exceda el stock al actualizar
-            if quantity <= product.stock:
-                self.cart[product_id]['quantity'] = quantity
-            else:
-                self.cart[product_id]['quantity'] = product.stock
+            line = self.store.set(product, min(quantity, product.stock))
         else:
             # Validar que no exceda el stock al agregar
-            new_quantity = self.cart[product_id]['quantity'] + quantity
-            if new_quantity <= product.stock:
-                self.cart[product_id]['quantity'] = new_quantity
-            else:
-                self.cart[product_id]['quantity'] = product.stock
-        
-        self.save()
+            line = self.store.add(product, quantity, limit=product.stock)
+        self._update_line(product.id, line)
 
-    def save(self):
-        self.session[settings.CART_SESSION_ID] = self.cart
-        self.session.modified = True
+    def _update_line(self, product_id, line):
+        if self._cart is not None:
+            if line is None:
+                self._cart.pop(str(product_id), None)
+            else:
+                self._cart[str(product_id)] = line
+        self._items = None
 
     def remove(self, product):
-        product_id = str(product.id)
-        if product_id in self.cart:
-            del self.cart[product_id]
-            self.save()
+        self.store.remove(product.id)
+        self._update_line(product.id, None)
 
     def __iter__(self):
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
-        
-        for product in products:
-            cart[str(product.id)]['product'] = product
+        if self._items is None:
+            self._items = self._build_items()
+        return iter(self._items)
 
-        for item in cart.values():
-            item['price'] = Decimal(item['price'])
-            item['total_price'] = item['price'] * item['quantity']
-            yield item
+    def _build_items(self):
+        """Resuelve los productos desde los snapshots (sin consultas en el caso común)"""
+        snapshots = get_snapshots(self.cart.keys())
+        items = []
+        for product_id, data in self.cart.items():
+            product = snapshots.get(int(product_id))
+            if product is None:
+                # Producto eliminado del catálogo
+                continue
+            price = Decimal(data['price'])
+            items.append({
+                'product': product,
+                'quantity': data['quantity'],
+                'price': price,
+                'total_price': price * data['quantity'],
+            })
+        return items
 
     def __len__(self):
         return sum(item['quantity'] for item in self.cart.values())
@@ -65,11 +69,20 @@ class Cart:
         return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
 
     def clear(self):
-        del self.session[settings.CART_SESSION_ID]
-        self.session.modified = True
+        self.store.clear()
+        self._cart = {}
+        self._items = None
 
     def get_available_quantity(self, product):
         """Obtener la cantidad máxima que se puede agregar considerando el stock"""
         product_id = str(product.id)
         current_quantity = self.cart.get(product_id, {}).get('quantity', 0)
-        return max(0, product.stock - current_quantity)
\ No newline at end of file
+        return max(0, product.stock - current_quantity)
+
+
+def get_request_cart(request):
+    """Carrito memoizado por request (un solo objeto para vistas y plantillas)"""
+    cart = getattr(request, '_cart', None)
+    if cart is None:
+        cart = request._cart = Cart(request)
+    return cart
@@ -0,0 +1,265 @@
+# === marketplace/cart_store.py - Almacenamiento del carrito ===
+#
+# El carrito delega la persistencia en un store intercambiable
+# (settings.CART_STORE):
+#
+#   - SessionCartStore: el dict original dentro de la sesión. Cada cambio
+#     reescribe la fila completa de la sesión.
+#   - DatabaseCartStore: una fila CartLine por producto, con actualizaciones
+#     atómicas por línea. La sesión solo guarda un token anónimo (una vez).
+#     Un carrito que quedó en la sesión (SessionCartStore, antes del cambio
+#     de store) se pasa a CartLine la primera vez que se usa.
+#
+# Todos los stores exponen las líneas como {product_id (str): {'quantity', 'price'}}.
+#
+# Los carritos anónimos sin cambios en ANONYMOUS_CART_TTL_DAYS ya perdieron su
+# sesión: purge_anonymous_carts() (comando o tarea Celery) borra sus líneas.
+
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Least
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import CartLine, Product
+
+CART_TOKEN_SESSION_KEY = 'cart_token'
+ANONYMOUS_PREFIX = 'anon:'
+PURGE_BATCH_SIZE = 1000
+
+
+class BaseCartStore:
+    """Interfaz común de los stores"""
+
+    def __init__(self, request):
+        self.request = request
+        self.session = request.session
+
+    def load(self):
+        raise NotImplementedError
+
+    def add(self, product, quantity, limit):
+        """Suma `quantity` sin superar `limit`; devuelve la línea resultante o None"""
+        raise NotImplementedError
+
+    def set(self, product, quantity):
+        """Fija la cantidad de la línea; devuelve la línea o None si quedó vacía"""
+        raise NotImplementedError
+
+    def remove(self, product_id):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    @classmethod
+    def merge_on_login(cls, request, user):
+        """Fusiona el carrito anónimo en el del usuario (no-op por defecto)"""
+
+
+class SessionCartStore(BaseCartStore):
+    """Carrito completo dentro de la sesión (comportamiento histórico)"""
+
+    def load(self):
+        return self.session.get(settings.CART_SESSION_ID) or {}
+
+    def _write(self, cart):
+        self.session[settings.CART_SESSION_ID] = cart
+        self.session.modified = True
+
+    def add(self, product, quantity, limit):
+        cart = self.load()
+        line = cart.setdefault(str(product.id), {'quantity': 0, 'price': str(product.price)})
+        line['quantity'] = min(line['quantity'] + quantity, limit)
+        self._write(cart)
+        return line
+
+    def set(self, product, quantity):
+        cart = self.load()
+        line = cart.setdefault(str(product.id), {'quantity': 0, 'price': str(product.price)})
+        line['quantity'] = quantity
+        self._write(cart)
+        return line
+
+    def remove(self, product_id):
+        cart = self.load()
+        if cart.pop(str(product_id), None) is not None:
+            self._write(cart)
+
+    def clear(self):
+        if settings.CART_SESSION_ID in self.session:
+            del self.session[settings.CART_SESSION_ID]
+        self.session.modified = True
+
+
+class DatabaseCartStore(BaseCartStore):
+    """Una fila por línea; los cambios son UPDATE/INSERT puntuales"""
+
+    def __init__(self, request):
+        super().__init__(request)
+        self._key = None
+
+    # -------------------------------------------------------------------------
+    # Identificación del carrito
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def user_key(user):
+        return f'user:{user.pk}'
+
+    @staticmethod
+    def anonymous_key(token):
+        return f'{ANONYMOUS_PREFIX}{token}'
+
+    def cart_key(self, create=False):
+        if self._key is None:
+            # Carrito guardado por SessionCartStore antes del cambio de store: se migra una vez
+            legacy = self.session.pop(settings.CART_SESSION_ID, None)
+            if legacy:
+                self._key = self._resolve_key(create=True)
+                self._merge_lines(self._key, {
+                    int(product_id): (line['quantity'], line['price'])
+                    for product_id, line in legacy.items() if str(product_id).isdigit()
+                })
+            else:
+                self._key = self._resolve_key(create)
+        return self._key
+
+    def _resolve_key(self, create):
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return self.user_key(user)
+        token = self.session.get(CART_TOKEN_SESSION_KEY)
+        if token is None:
+            if not create:
+                return None
+            # Única escritura en la sesión de todo el ciclo del carrito
+            token = self.session[CART_TOKEN_SESSION_KEY] = uuid.uuid4().hex
+        return self.anonymous_key(token)
+
+    @staticmethod
+    def _merge_lines(cart_key, lines):
+        """Suma líneas {product_id: (quantity, price)} al carrito, sin superar el stock"""
+        stocks = dict(Product.objects.filter(id__in=lines).values_list('id', 'stock'))
+        with transaction.atomic():
+            for product_id, (quantity, price) in lines.items():
+                if product_id not in stocks:
+                    # Producto eliminado del catálogo
+                    continue
+                stock = stocks[product_id]
+                updated = CartLine.objects.filter(cart_key=cart_key, product_id=product_id).update(
+                    quantity=Least(F('quantity') + quantity, stock), updated_at=timezone.now()
+                )
+                if not updated:
+                    CartLine.objects.create(
+                        cart_key=cart_key, product_id=product_id,
+                        quantity=min(quantity, stock), price=price,
+                    )
+
+    # -------------------------------------------------------------------------
+    # Operaciones
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _line(quantity, price):
+        return {'quantity': quantity, 'price': str(price)}
+
+    def load(self):
+        key = self.cart_key()
+        if key is None:
+            return {}
+        return {
+            str(product_id): self._line(quantity, price)
+            for product_id, quantity, price in CartLine.objects.filter(cart_key=key)
+            .values_list('product_id', 'quantity', 'price')
+        }
+
+    def add(self, product, quantity, limit):
+        key = self.cart_key(create=True)
+        lines = CartLine.objects.filter(cart_key=key, product=product)
+        # Incremento atómico acotado por el stock: UPDATE ... SET quantity = MIN(quantity + n, limit).
+        # update() no pasa por auto_now: updated_at (lo usa la purga) se renueva a mano
+        if not lines.update(quantity=Least(F('quantity') + quantity, limit), updated_at=timezone.now()):
+            try:
+                with transaction.atomic():
+                    CartLine.objects.create(
+                        cart_key=key, product=product,
+                        quantity=min(quantity, limit), price=product.price,
+                    )
+            except IntegrityError:
+                # Otra request creó la línea en paralelo
+                lines.update(quantity=Least(F('quantity') + quantity, limit), updated_at=timezone.now())
+        line = lines.values_list('quantity', 'price').first()
+        return self._line(*line) if line else None
+
+    def set(self, product, quantity):
+        key = self.cart_key(create=True)
+        if quantity <= 0:
+            self.remove(product.id)
+            return None
+        CartLine.objects.bulk_create(
+            [CartLine(cart_key=key, product=product, quantity=quantity, price=product.price)],
+            update_conflicts=True,
+            unique_fields=['cart_key', 'product'],
+            update_fields=['quantity', 'updated_at'],
+        )
+        price = CartLine.objects.filter(cart_key=key, product=product).values_list('price', flat=True).first()
+        return self._line(quantity, price)
+
+    def remove(self, product_id):
+        key = self.cart_key()
+        if key is not None:
+            CartLine.objects.filter(cart_key=key, product_id=product_id).delete()
+
+    def clear(self):
+        key = self.cart_key()
+        if key is not None:
+            CartLine.objects.filter(cart_key=key).delete()
+
+    @classmethod
+    def merge_on_login(cls, request, user):
+        token = request.session.pop(CART_TOKEN_SESSION_KEY, None)
+        if not token:
+            return
+        anonymous_lines = CartLine.objects.filter(cart_key=cls.anonymous_key(token))
+        with transaction.atomic():
+            cls._merge_lines(cls.user_key(user), {
+                product_id: (quantity, price)
+                for product_id, quantity, price in anonymous_lines.values_list('product_id', 'quantity', 'price')
+            })
+            anonymous_lines.delete()
+
+
+def purge_anonymous_carts(now=None, days=None, batch_size=PURGE_BATCH_SIZE):
+    """
+    Borra, en lotes, las líneas de los carritos anónimos sin cambios en `days`
+    días (ANONYMOUS_CART_TTL_DAYS). Devuelve la cantidad de líneas borradas.
+    """
+    if days is None:
+        days = getattr(settings, 'ANONYMOUS_CART_TTL_DAYS', 14)
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    anonymous = CartLine.objects.filter(cart_key__startswith=ANONYMOUS_PREFIX)
+    # Un carrito con alguna línea reciente sigue vivo entero
+    active = anonymous.filter(updated_at__gte=cutoff).values('cart_key')
+    stale = anonymous.filter(updated_at__lt=cutoff).exclude(cart_key__in=active)
+    total = 0
+    while True:
+        line_ids = list(stale.values_list('id', flat=True)[:batch_size])
+        if not line_ids:
+            break
+        total += CartLine.objects.filter(id__in=line_ids).delete()[0]
+        if len(line_ids) < batch_size:
+            break
+    return total
+
+
+def get_cart_store_class():
+    return import_string(getattr(settings, 'CART_STORE', 'marketplace.cart_store.DatabaseCartStore'))
+
+
+def get_cart_store(request):
+    return get_cart_store_class()(request)
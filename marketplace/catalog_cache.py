@@ -0,0 +1,249 @@
+# === marketplace/catalog_cache.py - Cache de páginas y fragmentos del catálogo ===
+#
+# El catálogo solo cambia cuando se edita un Product (admin, importación,
+# movimientos de stock). Todas las claves llevan la generación del catálogo,
+# un contador en el cache de Django que se incrementa en cada cambio: las
+# entradas viejas dejan de usarse al instante y vencen solas después.
+#
+#   - Páginas completas (@cache_catalog_page): solo GET de visitantes
+#     anónimos sin mensajes pendientes, con clave por ruta + parámetros
+#     ordenados (sin utm_* y similares). El carrito no forma parte del HTML
+#     (se carga desde /carrito/api/panel/), así que todos comparten la copia.
+#     La cookie CSRF se envía siempre; si la página trae un token en el HTML,
+#     se reemplaza por el del visitante.
+#   - Fragmentos ({% cache %} en las plantillas): tarjetas de producto y
+#     navegación de categorías, para todos los usuarios. El context processor
+#     catalog_cache expone la generación y el timeout.
+#   - GET condicional (@conditional_catalog_page): ETag y Last-Modified a
+#     partir de MAX(updated_at) + COUNT del catálogo (listados) o del
+#     updated_at del producto (detalle). Se calculan antes de la vista y, si
+#     el navegador ya tiene esa versión, se responde 304 sin renderizar. El
+#     resultado se memoriza por generación: sin cambios no hay consultas.
+
+import functools
+import hashlib
+import logging
+import re
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.middleware.csrf import _unmask_cipher_token, get_token
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'marketplace:catalog-generation'
+PAGE_KEY = 'marketplace:page:{generation}:{digest}'
+DEFAULT_TIMEOUT = 600
+
+# Parámetros que no cambian el contenido (campañas, clics de anuncios)
+IGNORED_PARAMS = {'fbclid', 'gclid', 'msclkid'}
+IGNORED_PREFIXES = ('utm_',)
+
+CSRF_PLACEHOLDER = '__CATALOG_CSRF_TOKEN__'
+TOKEN_PATTERN = re.compile(r'\b[A-Za-z0-9]{64}\b')
+
+VALIDATORS_KEY = 'marketplace:validators:{generation}:{name}'
+STARTED = str(time.time_ns())
+
+
+def catalog_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+# =============================================================================
+# GENERACIÓN
+# =============================================================================
+
+def get_catalog_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Arranca en un valor único: si el cache perdió el contador, no se
+        # reutilizan claves de una generación anterior
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_catalog_generation():
+    """Invalida todas las páginas y fragmentos del catálogo (llamar tras cambiar productos)"""
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        return cache.get(GENERATION_KEY)
+
+
+# =============================================================================
+# PÁGINAS COMPLETAS
+# =============================================================================
+
+def has_pending_messages(request):
+    """Mensajes del framework sin mostrar, sin consumirlos (cookie o sesión)"""
+    if request.COOKIES.get('messages'):
+        return True
+    session = getattr(request, 'session', None)
+    return session is not None and bool(session.get('_messages'))
+
+
+def is_cacheable_request(request):
+    if not getattr(settings, 'CATALOG_PAGE_CACHE', True) or request.method not in ('GET', 'HEAD'):
+        return False
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return False
+    return not has_pending_messages(request)
+
+
+def page_key(request):
+    params = sorted(
+        (name, value)
+        for name, values in request.GET.lists()
+        if name not in IGNORED_PARAMS and not name.startswith(IGNORED_PREFIXES)
+        for value in values
+    )
+    raw = f"{request.get_host()}{request.path}?{urlencode(params)}"
+    digest = hashlib.sha1(raw.encode()).hexdigest()
+    return PAGE_KEY.format(generation=get_catalog_generation(), digest=digest)
+
+
+def _strip_csrf(content, request):
+    """Reemplaza los tokens CSRF de este visitante por un marcador"""
+    secret = request.META.get('CSRF_COOKIE')
+    if not secret:
+        return content
+    tokens = {
+        token for token in TOKEN_PATTERN.findall(content)
+        if _unmask_cipher_token(token) == secret
+    }
+    for token in tokens:
+        content = content.replace(token, CSRF_PLACEHOLDER)
+    return content
+
+
+def cache_catalog_page(view):
+    """Cache de página completa para visitantes anónimos, versionado por la generación del catálogo"""
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        # El HTML del catálogo no lleva formularios para anónimos: el JS del
+        # carrito toma el token de la cookie, que get_token hace enviar siempre
+        token = get_token(request)
+        if not is_cacheable_request(request):
+            return view(request, *args, **kwargs)
+
+        key = page_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            if CSRF_PLACEHOLDER in content:
+                content = content.replace(CSRF_PLACEHOLDER, token)
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Catalog-Cache'] = 'hit'
+            return response
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming and not response.cookies:
+            content = _strip_csrf(response.content.decode(response.charset), request)
+            cache.set(key, (content, response['Content-Type']), catalog_timeout())
+            response['X-Catalog-Cache'] = 'miss'
+        return response
+
+    return wrapper
+
+
+# =============================================================================
+# GET CONDICIONAL (ETag / Last-Modified)
+# =============================================================================
+
+def _memoized(name, compute):
+    """Resultado de `compute` guardado hasta el próximo cambio del catálogo"""
+    key = VALIDATORS_KEY.format(generation=get_catalog_generation(), name=name)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, catalog_timeout())
+    return value
+
+
+def listing_signature(request, *args, **kwargs):
+    """(cantidad, último cambio) de los productos disponibles: un único agregado indexado"""
+    def compute():
+        data = Product.objects.filter(available=True).aggregate(total=Count('id'), last=Max('updated_at'))
+        return (data['total'], data['last'])
+
+    return _memoized('listing', compute)
+
+
+def product_signature(request, product_id, *args, **kwargs):
+    """
+    (cantidad del catálogo, updated_at del producto), o None si no existe o
+    no está disponible (la vista responde 404). La cantidad cubre los
+    contadores de la navegación de categorías que también lleva la página.
+    """
+    def compute():
+        found = Product.objects.filter(id=product_id, available=True).values_list('updated_at', flat=True).first()
+        return (found,) if found else ()
+
+    found = _memoized(f'product:{product_id}', compute)
+    if not found:
+        return None
+    return (listing_signature(request)[0], found[0])
+
+
+def _validators(request, signature, args, kwargs):
+    """(etag, last_modified) una sola vez por request (condition() pide cada uno por separado)"""
+    if not hasattr(request, '_catalog_validators'):
+        validators = None
+        # Con mensajes pendientes la página no es la misma que el navegador ya tiene
+        if request.method in ('GET', 'HEAD') and not has_pending_messages(request):
+            found = signature(request, *args, **kwargs)
+            if found and found[1] is not None:
+                count, last_modified = found
+                user = getattr(request, 'user', None)
+                viewer = f"user:{user.pk}" if user is not None and user.is_authenticated else 'anon'
+                release = getattr(settings, 'RELEASE_VERSION', '') or STARTED
+                raw = f"{release}:{count}:{last_modified.isoformat()}:{viewer}"
+                # Débil: el HTML es equivalente, no idéntico byte a byte (token CSRF)
+                validators = (f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:24]}"', last_modified)
+        request._catalog_validators = validators
+    return request._catalog_validators
+
+
+def conditional_catalog_page(signature):
+    """
+    ETag/Last-Modified y 304 antes de ejecutar la vista.
+    `signature(request, *args, **kwargs)` devuelve (cantidad, datetime) o None.
+    """
+
+    def decorator(view):
+        def etag(request, *args, **kwargs):
+            validators = _validators(request, signature, args, kwargs)
+            return validators[0] if validators else None
+
+        def last_modified(request, *args, **kwargs):
+            validators = _validators(request, signature, args, kwargs)
+            return validators[1] if validators else None
+
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if getattr(request, '_catalog_validators', None) and response.status_code in (200, 304):
+                # Guardar pero revalidar siempre: la revalidación es el 304 barato
+                user = getattr(request, 'user', None)
+                private = user is not None and user.is_authenticated
+                patch_cache_control(response, no_cache=True, private=private, public=not private)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -1,9 +1,24 @@
-from .cart import Cart
+from django.utils.functional import SimpleLazyObject
+
+from .cart import get_request_cart
+from .catalog_cache import catalog_timeout, get_catalog_generation
 
 def cart_context(request):
-    cart = Cart(request)
+    """
+    Contexto del carrito diferido: nada se calcula (ni la sesión se lee)
+    hasta que la plantilla usa alguna de estas variables.
+    """
+    cart = SimpleLazyObject(lambda: get_request_cart(request))
     return {
         'cart': cart,
-        'cart_total_items': len(cart),
-        'cart_total_price': cart.get_total_price(),
-    }
\ No newline at end of file
+        'cart_total_items': SimpleLazyObject(lambda: len(cart)),
+        'cart_total_price': SimpleLazyObject(lambda: cart.get_total_price()),
+    }
+
+
+def catalog_cache(request):
+    """Generación del catálogo para las claves de {% cache %} (se lee solo si la plantilla la usa)"""
+    return {
+        'catalog_generation': SimpleLazyObject(get_catalog_generation),
+        'catalog_cache_timeout': catalog_timeout(),
+    }
@@ -0,0 +1,169 @@
+# === marketplace/images.py - Variantes responsive de las imágenes de producto ===
+#
+# Cada imagen se sirve en tamaños con nombre (RENDITIONS): 'thumb' para el
+# carrito y listados compactos, 'card' para las grillas y 'detail' para la
+# ficha. Cada tamaño tiene varios anchos para el srcset; el navegador elige
+# según el ancho de pantalla y la densidad de píxeles.
+#
+# Backends (settings.IMAGE_RENDITION_BACKEND):
+#   - 'cloudinary': agrega la transformación c_limit,w_N,f_auto,q_auto a la
+#     URL de Cloudinary (WebP/AVIF según lo que acepte el navegador). Es solo
+#     armado de texto: no hay llamadas de red.
+#   - 'local': genera archivos WebP con Pillow en IMAGE_RENDITION_ROOT, para
+#     desarrollo sin conexión y tests.
+#
+# Las URLs se calculan al guardar el producto y se guardan en
+# Product.image_renditions junto con el nombre de la imagen de origen; las
+# plantillas solo las leen. Si el origen no coincide (imagen nueva, datos
+# viejos) se recalculan al vuelo.
+
+import hashlib
+import logging
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    'thumb': {'widths': (64, 128), 'src': 128, 'sizes': '64px'},
+    'card': {
+        'widths': (320, 480, 640),
+        'src': 480,
+        'sizes': '(max-width: 576px) 50vw, (max-width: 992px) 33vw, 300px',
+    },
+    'detail': {'widths': (600, 900, 1200), 'src': 900, 'sizes': '(max-width: 992px) 100vw, 600px'},
+}
+
+
+def all_widths():
+    return sorted({width for spec in RENDITIONS.values() for width in spec['widths']})
+
+
+# =============================================================================
+# BACKENDS
+# =============================================================================
+
+class CloudinaryRenditions:
+    """Transformaciones en la URL de entrega de Cloudinary"""
+
+    MARKER = '/upload/'
+    TRANSFORMATION = 'c_limit,w_{width},f_auto,q_auto'
+
+    def build(self, image, widths):
+        url = image.url
+        if self.MARKER not in url:
+            # Otro storage: sin transformaciones posibles, se usa el original
+            return {width: url for width in widths}
+        head, tail = url.split(self.MARKER, 1)
+        return {
+            width: f"{head}{self.MARKER}{self.TRANSFORMATION.format(width=width)}/{tail}"
+            for width in widths
+        }
+
+
+class LocalRenditions:
+    """Variantes WebP generadas con Pillow en el filesystem local"""
+
+    QUALITY = 80
+
+    def __init__(self, root=None, url=None, source_root=None):
+        self.root = Path(root or getattr(settings, 'IMAGE_RENDITION_ROOT', Path(settings.MEDIA_ROOT) / 'renditions'))
+        self.url = url or getattr(settings, 'IMAGE_RENDITION_URL', f"{settings.MEDIA_URL}renditions/")
+        self.source_root = Path(source_root or getattr(settings, 'IMAGE_RENDITION_SOURCE_ROOT', settings.MEDIA_ROOT))
+
+    def _open_source(self, image):
+        from PIL import Image
+
+        local = self.source_root / image.name
+        if local.exists():
+            return Image.open(local)
+        image.open('rb')
+        try:
+            return Image.open(image.file).copy()
+        finally:
+            image.close()
+
+    def build(self, image, widths):
+        from PIL import Image
+
+        folder = hashlib.sha1(image.name.encode()).hexdigest()[:12]
+        targets = {width: self.root / folder / f"{width}.webp" for width in widths}
+        missing = [width for width, path in targets.items() if not path.exists()]
+        if missing:
+            with self._open_source(image) as source:
+                source = source.convert('RGBA' if 'A' in source.getbands() else 'RGB')
+                (self.root / folder).mkdir(parents=True, exist_ok=True)
+                for width in missing:
+                    variant = source
+                    if source.width > width:
+                        height = max(1, round(source.height * width / source.width))
+                        variant = source.resize((width, height), Image.LANCZOS)
+                    variant.save(targets[width], 'WEBP', quality=self.QUALITY, method=4)
+        return {width: f"{self.url}{folder}/{width}.webp" for width in widths}
+
+
+BACKENDS = {
+    'cloudinary': CloudinaryRenditions,
+    'local': LocalRenditions,
+}
+
+
+def get_backend():
+    return BACKENDS[getattr(settings, 'IMAGE_RENDITION_BACKEND', 'cloudinary')]()
+
+
+# =============================================================================
+# API
+# =============================================================================
+
+def compute_renditions(image):
+    """{'source': nombre, tamaño: {'src', 'srcset', 'sizes'}} o {} si no hay imagen"""
+    if not image:
+        return {}
+    urls = get_backend().build(image, all_widths())
+    data = {'source': image.name}
+    for size, spec in RENDITIONS.items():
+        data[size] = {
+            'src': urls[spec['src']],
+            'srcset': ', '.join(f"{urls[width]} {width}w" for width in spec['widths']),
+            'sizes': spec['sizes'],
+        }
+    return data
+
+
+def renditions_for(product):
+    """Variantes guardadas del producto (o calculadas si están desactualizadas)"""
+    image = product.image
+    if not image:
+        return {}
+    stored = getattr(product, 'image_renditions', None)
+    if stored and stored.get('source') == image.name:
+        return stored
+    try:
+        return compute_renditions(image)
+    except Exception as e:
+        logger.warning("No se pudieron calcular las variantes de %s: %s", image.name, e)
+        return {}
+
+
+def rendition_src(product, size):
+    """URL de una variante ('' si no hay imagen)"""
+    rendition = renditions_for(product).get(size)
+    return rendition['src'] if rendition else ''
+
+
+def refresh_product_renditions(product):
+    """Recalcula y guarda las variantes si cambió la imagen (un UPDATE, sin señales)"""
+    stored = product.image_renditions or {}
+    name = product.image.name if product.image else None
+    if stored.get('source') == name or (not name and not stored):
+        return False
+    try:
+        data = compute_renditions(product.image)
+    except Exception as e:
+        logger.warning("No se pudieron generar las variantes de %s: %s", name, e)
+        return False
+    type(product).objects.filter(pk=product.pk).update(image_renditions=data)
+    product.image_renditions = data
+    return True
@@ -0,0 +1,361 @@
+# === marketplace/importer.py - Importación masiva de productos ===
+#
+# Lee productos de un CSV o JSONL sin cargar el archivo entero en memoria y
+# los escribe por lotes:
+#   - Deduplicación contra un único set precargado de nombres normalizados
+#     (sin acentos, minúsculas, espacios colapsados): los que ya existen se
+#     actualizan con bulk_update, los nuevos se insertan con bulk_create.
+#     Las filas repetidas dentro del archivo (mismo nombre o mismo 'sku')
+#     se descartan. Product no guarda el sku: entre importaciones (y contra la
+#     base) solo deduplica el nombre.
+#   - Las imágenes se descargan y suben en paralelo con un pool de hilos
+#     acotado que comparte una requests.Session con pool de conexiones. Si
+#     la escritura del lote falla, las subidas de ese lote se borran.
+#   - Después de cada lote se guarda un checkpoint (filas procesadas); si la
+#     importación se corta, la siguiente ejecución retoma desde ahí.
+#
+# Columnas: name, description, price, category, stock, available, image_url, sku
+
+import csv
+import json
+import logging
+import mimetypes
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+import requests
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .catalog_cache import bump_catalog_generation
+from .images import compute_renditions
+from .models import Product
+from .snapshots import invalidate_products
+from .text import fold
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+IMAGE_THREADS = 8
+IMAGE_TIMEOUT = (3.05, 20)
+ROW_FIELDS = ('description', 'price', 'category', 'stock', 'available')
+TRUE_VALUES = {'1', 'true', 'si', 'sí', 'yes', 'x'}
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def name_key(name):
+    return ' '.join(fold(name).split())
+
+
+def category_lookup():
+    """Acepta tanto la clave ('mouses') como el nombre visible ('Mouses Gaming')"""
+    lookup = {}
+    for value, label in Product.CATEGORY_CHOICES:
+        lookup[name_key(value)] = value
+        lookup[name_key(label)] = value
+    return lookup
+
+
+# =============================================================================
+# LECTURA
+# =============================================================================
+
+def read_rows(path, fmt=None):
+    """Genera dicts, uno por fila, sin leer el archivo completo"""
+    fmt = fmt or ('jsonl' if Path(path).suffix.lower() in ('.jsonl', '.ndjson') else 'csv')
+    with open(path, encoding='utf-8-sig', newline='') as source:
+        if fmt == 'csv':
+            yield from csv.DictReader(source)
+        else:
+            for number, line in enumerate(source, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield {'__error__': f"línea {number}: JSON inválido ({e})"}
+
+
+def clean_row(row, categories):
+    """Normaliza una fila a los campos del modelo (lanza ImportRowError si no sirve)"""
+    if '__error__' in row:
+        raise ImportRowError(row['__error__'])
+    name = ' '.join(str(row.get('name') or '').split())
+    if not name:
+        raise ImportRowError("fila sin nombre")
+    category = categories.get(name_key(str(row.get('category') or '')))
+    if category is None:
+        raise ImportRowError(f"{name}: categoría inválida {row.get('category')!r}")
+    try:
+        price = Decimal(str(row.get('price')).replace(',', '.')).quantize(Decimal('0.01'))
+        stock = int(row.get('stock') or 0)
+    except (InvalidOperation, ValueError, TypeError):
+        raise ImportRowError(f"{name}: precio o stock inválido")
+    if price < 0 or stock < 0:
+        raise ImportRowError(f"{name}: precio o stock negativo")
+    available = row.get('available', True)
+    if isinstance(available, str):
+        available = fold(available).strip() in TRUE_VALUES if available.strip() else True
+    return {
+        'name': name,
+        'description': str(row.get('description') or ''),
+        'price': price,
+        'category': category,
+        'stock': stock,
+        'available': bool(available),
+        'image_url': str(row.get('image_url') or '').strip(),
+        'sku': str(row.get('sku') or '').strip(),
+    }
+
+
+# =============================================================================
+# IMÁGENES
+# =============================================================================
+
+class ImageFetcher:
+    """Descarga y sube imágenes en paralelo con una Session compartida"""
+
+    def __init__(self, threads=IMAGE_THREADS, session=None, storage=None):
+        self.threads = threads
+        self.session = session or self._session(threads)
+        self.storage = storage or Product._meta.get_field('image').storage
+
+    @staticmethod
+    def _session(threads):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=threads, pool_maxsize=threads, max_retries=2)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['User-Agent'] = 'MasivoTech-Importer/1.0'
+        return session
+
+    @staticmethod
+    def file_name(name, content_type):
+        extension = mimetypes.guess_extension((content_type or '').split(';')[0].strip()) or '.jpg'
+        slug = re.sub(r'[^a-z0-9]+', '_', name_key(name)).strip('_')[:80] or 'producto'
+        return f"products/{slug}{extension}"
+
+    def fetch(self, name, url):
+        """Devuelve el nombre guardado en el storage o None si falló"""
+        try:
+            response = self.session.get(url, timeout=IMAGE_TIMEOUT)
+            response.raise_for_status()
+            file_name = self.file_name(name, response.headers.get('Content-Type'))
+            return self.storage.save(file_name, ContentFile(response.content))
+        except Exception as e:
+            logger.warning("import.image_failed name=%r url=%s error=%s", name, url, e)
+            return None
+
+    def discard(self, names):
+        """Borra archivos ya subidos que no llegaron a la base"""
+        for name in names:
+            try:
+                self.storage.delete(name)
+            except Exception as e:
+                logger.warning("import.image_orphaned file=%s error=%s", name, e)
+
+    def fetch_many(self, jobs):
+        """jobs: [(nombre, url)] -> {nombre: archivo guardado o None}"""
+        if not jobs:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.threads, len(jobs)), thread_name_prefix='import-img') as pool:
+            stored = pool.map(lambda job: self.fetch(*job), jobs)
+            return {name: result for (name, _), result in zip(jobs, stored)}
+
+
+# =============================================================================
+# CHECKPOINT
+# =============================================================================
+
+class Checkpoint:
+    """Progreso de una importación, atado al tamaño y fecha del archivo de origen"""
+
+    def __init__(self, source, path=None):
+        self.source = Path(source)
+        self.path = Path(path) if path else self.source.with_name(self.source.name + '.checkpoint.json')
+
+    def _fingerprint(self):
+        stat = self.source.stat()
+        return {'source': str(self.source.resolve()), 'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+    def load(self):
+        """Filas ya procesadas (0 si no hay checkpoint o el archivo cambió)"""
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return 0
+        if {key: data.get(key) for key in ('source', 'size', 'mtime')} != self._fingerprint():
+            return 0
+        return int(data.get('rows', 0))
+
+    def save(self, rows, stats):
+        data = {**self._fingerprint(), 'rows': rows, 'stats': stats}
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# =============================================================================
+# IMPORTACIÓN
+# =============================================================================
+
+class ProductImporter:
+
+    def __init__(self, batch_size=BATCH_SIZE, only_new=False, fetcher=None, log=None):
+        self.batch_size = batch_size
+        self.only_new = only_new
+        self.fetcher = fetcher or ImageFetcher()
+        self.log = log or (lambda message: logger.info(message))
+        self.categories = category_lookup()
+        self.stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0, 'errors': 0, 'images': 0}
+        # Único set precargado para deduplicar: nombre normalizado -> id
+        self.existing = {name_key(name): pk for pk, name in Product.objects.values_list('id', 'name')}
+        self.seen_names = set()
+        self.seen_skus = set()
+
+    def run(self, path, fmt=None, checkpoint=None):
+        done = checkpoint.load() if checkpoint else 0
+        if done:
+            self.log(f"Retomando desde la fila {done + 1}")
+        rows = 0
+        batch = []
+        for row in read_rows(path, fmt):
+            rows += 1
+            if rows <= done:
+                self._remember(row)
+                continue
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                self._write(batch)
+                batch = []
+                if checkpoint:
+                    checkpoint.save(rows, self.stats)
+                self.log(f"{rows} filas procesadas ({self.stats})")
+        if batch:
+            self._write(batch)
+        if checkpoint:
+            checkpoint.clear()
+        return self.stats
+
+    def _remember(self, row):
+        """Filas ya importadas antes del corte: solo cuentan para deduplicar el resto"""
+        try:
+            cleaned = clean_row(row, self.categories)
+        except ImportRowError:
+            return
+        self.seen_names.add(name_key(cleaned['name']))
+        if cleaned['sku']:
+            self.seen_skus.add(cleaned['sku'])
+
+    def _dedupe(self, rows):
+        unique = []
+        for row in rows:
+            try:
+                cleaned = clean_row(row, self.categories)
+            except ImportRowError as e:
+                self.stats['errors'] += 1
+                logger.warning("import.invalid_row %s", e)
+                continue
+            key = name_key(cleaned['name'])
+            if key in self.seen_names or (cleaned['sku'] and cleaned['sku'] in self.seen_skus):
+                self.stats['skipped'] += 1
+                continue
+            self.seen_names.add(key)
+            if cleaned['sku']:
+                self.seen_skus.add(cleaned['sku'])
+            if self.only_new and key in self.existing:
+                self.stats['skipped'] += 1
+                continue
+            unique.append(cleaned)
+        return unique
+
+    def _write(self, rows):
+        rows = self._dedupe(rows)
+        if not rows:
+            return
+        current = Product.objects.in_bulk([self.existing[name_key(row['name'])]
+                                           for row in rows if name_key(row['name']) in self.existing])
+
+        # Imágenes solo para productos nuevos o que todavía no tienen
+        jobs = []
+        for row in rows:
+            product = current.get(self.existing.get(name_key(row['name'])))
+            if row['image_url'] and not (product and product.image):
+                jobs.append((row['name'], row['image_url']))
+        images = self.fetcher.fetch_many(jobs)
+        try:
+            created, changed = self._save(rows, current, images)
+        except Exception:
+            self.fetcher.discard([name for name in images.values() if name])
+            raise
+
+        # bulk_create no devuelve ids en todos los motores: se recuperan por nombre
+        missing = [product.name for product in created if product.pk is None]
+        ids = dict(Product.objects.filter(name__in=missing).values_list('name', 'id')) if missing else {}
+        for product in created:
+            self.existing[name_key(product.name)] = product.pk or ids.get(product.name)
+        if changed:
+            invalidate_products([product.pk for product in changed])
+        if created or changed:
+            # bulk_create/bulk_update no disparan señales
+            bump_catalog_generation()
+        self.stats['created'] += len(created)
+        self.stats['updated'] += len(changed)
+
+    def _save(self, rows, current, images):
+        """Escribe el lote en una transacción; devuelve (creados, modificados)"""
+        now = timezone.now()
+        new, changed = [], []
+        # Solo se reescriben las columnas que cambiaron en algún producto del lote:
+        # armar el CASE de bulk_update es lo caro, no la consulta
+        fields = set()
+        for row in rows:
+            touched = set()
+            product = current.get(self.existing.get(name_key(row['name'])))
+            stored = images.get(row['name'])
+            if product is None:
+                product = Product(name=row['name'])
+                new.append(product)
+            else:
+                differences = [field for field in ROW_FIELDS if getattr(product, field) != row[field]]
+                if not (differences or stored):
+                    # Sin cambios: no se reescribe (reimportar el mismo archivo es casi gratis)
+                    self.stats['unchanged'] += 1
+                    continue
+                touched.update(differences)
+                changed.append(product)
+            for field in ROW_FIELDS:
+                setattr(product, field, row[field])
+            product.updated_at = now
+            if stored:
+                product.image = stored
+                touched.add('image')
+                self.stats['images'] += 1
+            if product.image and (product.image_renditions or {}).get('source') != product.image.name:
+                product.image_renditions = compute_renditions(product.image)
+                touched.add('image_renditions')
+            if product.pk:
+                fields.update(touched)
+
+        with transaction.atomic():
+            created = Product.objects.bulk_create(new, batch_size=self.batch_size)
+            if changed:
+                Product.objects.bulk_update(changed, sorted(fields), batch_size=self.batch_size)
+                # updated_at es igual para todo el lote: un UPDATE simple (las firmas de los índices lo usan)
+                Product.objects.filter(pk__in=[product.pk for product in changed]).update(updated_at=now)
+        return created, changed
@@ -0,0 +1,225 @@
+# === marketplace/inventory.py - Reservas y descuento atómico de stock ===
+#
+# Flujo de checkout:
+#   1. reserve_order(): crea Order + OrderItems y descuenta el stock de todas
+#      las líneas con UN solo UPDATE condicional, dentro de una transacción:
+#
+#        UPDATE product SET stock = stock - CASE id WHEN a THEN n ... END
+#        WHERE id IN (...) AND stock >= CASE id WHEN a THEN n ... END
+#
+#      Si alguna línea no alcanza, el UPDATE afecta menos filas y se hace
+#      rollback. No hay SELECT FOR UPDATE: la condición la evalúa la base.
+#   2. La orden queda 'pending' con `reserved_until`. El pago la confirma
+#      (confirm_order) o el barrido (release_expired_reservations) devuelve
+#      el stock cuando vence.
+
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .catalog_cache import bump_catalog_generation
+from .models import Order, OrderItem, Product
+from .sales import SOLD_STATUSES, reverse_sale, track_status_change
+from .snapshots import invalidate_products
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH_SIZE = 200
+# Vendidas pero todavía en el depósito: un reembolso devuelve sus unidades al stock
+UNSHIPPED_STATUSES = ('paid', 'processing')
+
+
+class InsufficientStock(Exception):
+    """Alguna línea pide más unidades de las disponibles"""
+
+    def __init__(self, products):
+        self.products = products
+        names = ', '.join(product.name for product in products)
+        super().__init__(f"Stock insuficiente para: {names}")
+
+
+class _Shortage(Exception):
+    pass
+
+
+def reservation_ttl():
+    return timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_TTL_MINUTES', 15))
+
+
+def _quantity_case(quantities):
+    """CASE id WHEN <id> THEN <cantidad> ... END"""
+    return Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+
+def stock_changed(product_ids):
+    """El stock se ve en el carrito y en las páginas del catálogo (los UPDATE ya renuevan updated_at)"""
+    invalidate_products(product_ids)
+    bump_catalog_generation()
+
+
+def take_stock(quantities):
+    """
+    Descuenta {product_id: cantidad} en un único UPDATE condicional.
+    Debe llamarse dentro de una transacción; lanza InsufficientStock si no alcanza.
+    """
+    if not quantities:
+        return
+    amount = _quantity_case(quantities)
+    try:
+        # Savepoint: si falta stock se deshacen también las líneas que sí alcanzaban
+        with transaction.atomic():
+            updated = Product.objects.filter(
+                id__in=quantities.keys(), stock__gte=amount
+            ).update(stock=F('stock') - amount, updated_at=timezone.now())
+            if updated != len(quantities):
+                raise _Shortage
+    except _Shortage:
+        short = [
+            product for product in Product.objects.filter(id__in=quantities.keys())
+            if product.stock < quantities[product.id]
+        ]
+        raise InsufficientStock(short)
+    transaction.on_commit(lambda: stock_changed(quantities.keys()))
+
+
+def return_stock(quantities):
+    """Devuelve {product_id: cantidad} al inventario en un único UPDATE"""
+    if not quantities:
+        return
+    Product.objects.filter(id__in=quantities.keys()).update(
+        stock=F('stock') + _quantity_case(quantities), updated_at=timezone.now()
+    )
+    transaction.on_commit(lambda: stock_changed(quantities.keys()))
+
+
+def _order_quantities(orders):
+    quantities = {}
+    for product_id, quantity in OrderItem.objects.filter(order__in=orders).values_list('product_id', 'quantity'):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+# =============================================================================
+# CICLO DE VIDA DE LA RESERVA
+# =============================================================================
+
+def reserve_order(cart, customer, user=None, shipping_price=0):
+    """
+    Persiste la orden del carrito y reserva su stock en una sola transacción.
+    `customer` tiene los campos de contacto de Order (first_name, email, ...).
+    """
+    lines = [item for item in cart if item['quantity'] > 0]
+    if not lines:
+        raise ValueError("El carrito está vacío")
+
+    quantities = {item['product'].id: item['quantity'] for item in lines}
+    subtotal = sum((item['total_price'] for item in lines), Decimal('0'))
+
+    with transaction.atomic():
+        take_stock(quantities)
+        order = Order.objects.create(
+            user=user if user is not None and user.is_authenticated else None,
+            total=subtotal + Decimal(str(shipping_price or 0)),
+            status='pending',
+            reserved_until=timezone.now() + reservation_ttl(),
+            **customer,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=item['product'].id,
+                      quantity=item['quantity'], price=item['price'])
+            for item in lines
+        ])
+
+    logger.info("Orden #%s reservada hasta %s", order.id, order.reserved_until)
+    return order
+
+
+def release_order(order_id, status='cancelled'):
+    """Libera la reserva de una orden pendiente (pago fallido o abandonado)"""
+    with transaction.atomic():
+        # UPDATE condicional: solo una request puede pasar la orden de 'pending'
+        released = Order.objects.filter(
+            id=order_id, status='pending', reserved_until__isnull=False
+        ).update(status=status, reserved_until=None)
+        if released:
+            return_stock(_order_quantities([order_id]))
+    return bool(released)
+
+
+def confirm_order(order_id, payment_id=None):
+    """
+    Convierte la reserva en venta. Si la reserva ya había vencido, intenta
+    volver a tomar el stock (puede lanzar InsufficientStock).
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(id=order_id)
+        if order.status == 'paid':
+            return order
+        if order.status == 'cancelled':
+            # Pago tardío de una reserva ya liberada
+            take_stock(_order_quantities([order.id]))
+        previous_status = order.status
+        order.status = 'paid'
+        order.reserved_until = None
+        if payment_id:
+            order.mercadopago_id = str(payment_id)
+        order.save(update_fields=['status', 'reserved_until', 'mercadopago_id', 'updated_at'])
+        track_status_change(order.id, previous_status, order.status)
+    return order
+
+
+def refund_order(order_id):
+    """
+    Pago devuelto o contracargo: cancela la orden vendida (en cualquier estado
+    de venta) y la descuenta del resumen. El stock solo se repone si la orden
+    no salió del depósito; la devolución de un envío se carga a mano.
+    """
+    with transaction.atomic():
+        order = (
+            Order.objects.select_for_update()
+            .filter(id=order_id, status__in=SOLD_STATUSES)
+            .only('id', 'status').first()
+        )
+        if order is None:
+            return False
+        Order.objects.filter(id=order_id).update(status='cancelled', updated_at=timezone.now())
+        if order.status in UNSHIPPED_STATUSES:
+            return_stock(_order_quantities([order_id]))
+        reverse_sale(order_id)
+    logger.info("Orden #%s reembolsada (estaba %s)", order_id, order.status)
+    return True
+
+
+def release_expired_reservations(now=None, batch_size=SWEEP_BATCH_SIZE):
+    """
+    Barrido: libera en lotes las órdenes pendientes con la reserva vencida.
+    Devuelve la cantidad de órdenes liberadas.
+    """
+    now = now or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            order_ids = list(
+                Order.objects.select_for_update(skip_locked=True)
+                .filter(status='pending', reserved_until__lte=now)
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not order_ids:
+                break
+            return_stock(_order_quantities(order_ids))
+            Order.objects.filter(id__in=order_ids).update(status='cancelled', reserved_until=None)
+        total += len(order_ids)
+        if len(order_ids) < batch_size:
+            break
+
+    if total:
+        logger.info("Reservas vencidas liberadas: %s órdenes", total)
+    return total
@@ -0,0 +1,56 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.shipping import np, shipping_index
+
+
+class Command(BaseCommand):
+    help = "Compara la cotización de envíos en lote (numpy.searchsorted) contra una consulta por código"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--codigos', type=int, default=100000, help="Códigos postales a cotizar")
+        parser.add_argument('--repeticiones', type=int, default=3, help="Se informa la mejor de N corridas")
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        total = options['codigos']
+        if total < 1:
+            raise CommandError("--codigos debe ser mayor que 0")
+        shipping_index.build()
+        if not shipping_index.zones():
+            raise CommandError("No hay zonas de envío activas")
+
+        generator = random.Random(options['semilla'])
+        # Mezcla realista: formato de 4 dígitos, CPA y algunos inválidos
+        codes = []
+        for _ in range(total):
+            number = generator.randint(1000, 9999)
+            kind = generator.random()
+            if kind < 0.6:
+                codes.append(f"{number}")
+            elif kind < 0.98:
+                codes.append(f"B{number}ABC")
+            else:
+                codes.append("sin-codigo")
+
+        def best_of(function):
+            timings = []
+            for _ in range(max(1, options['repeticiones'])):
+                started = time.perf_counter()
+                result = function()
+                timings.append(time.perf_counter() - started)
+            return min(timings), result
+
+        single_time, single = best_of(lambda: [shipping_index.quote(code) for code in codes])
+        batch_time, batch = best_of(lambda: shipping_index.quote_many(codes))
+
+        if [q and q.zone_id for q in single] != [q and q.zone_id for q in batch]:
+            raise CommandError("Las cotizaciones en lote no coinciden con las individuales")
+
+        engine = 'numpy.searchsorted' if np is not None else 'bisect (numpy no instalado)'
+        self.stdout.write(f"{total} códigos, {len(shipping_index.zones())} zonas, lote con {engine}")
+        self.stdout.write(f"  uno por uno: {single_time * 1000:8.1f} ms  ({total / single_time:,.0f} códigos/s)")
+        self.stdout.write(f"  en lote:     {batch_time * 1000:8.1f} ms  ({total / batch_time:,.0f} códigos/s)")
+        self.stdout.write(self.style.SUCCESS(f"Lote {single_time / batch_time:.1f}x más rápido"))
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from chat.gemini import LLMSlots, gemini_provider
+from chat.response_cache import response_cache
+from marketplace.models import Product
+
+
+class InFlight:
+    """Llamadas al servicio externo en curso (y el máximo simultáneo)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def reset(self):
+        self.current = self.peak = 0
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.current -= 1
+
+
+class SlowModel:
+    """Gemini con una demora fija por respuesta"""
+
+    def __init__(self, latency, in_flight):
+        self.latency = latency
+        self.in_flight = in_flight
+
+    async def generate_content_async(self, prompt, stream=False):
+        with self.in_flight:
+            await asyncio.sleep(self.latency)
+        return mock.Mock(text='Respuesta de prueba')
+
+
+def slow_mercadopago(latency, in_flight):
+    """API de preferencias de MercadoPago con una demora fija, en un hilo local"""
+    created = iter(range(1, 10 ** 9))
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            with in_flight:
+                time.sleep(latency)
+            preference_id = f'bench-{next(created)}'
+            body = json.dumps({'id': preference_id, 'init_point': f'https://mercadopago.test/{preference_id}'}).encode()
+            self.send_response(201)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara cuántos requests de chat y de pago sostiene un worker sync (WSGI) "
+        "contra uno de uvicorn (ASGI), con Gemini y MercadoPago simulados con latencia fija"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=60, help="Requests por escenario y modo")
+        parser.add_argument('--concurrencia', type=int, default=50, help="Clientes simultáneos contra el worker ASGI")
+        parser.add_argument('--latencia', type=int, default=200, help="Demora de Gemini/MercadoPago en ms")
+
+    def handle(self, *args, **options):
+        total, concurrency = options['requests'], options['concurrencia']
+        if total < 1 or concurrency < 1:
+            raise CommandError("--requests y --concurrencia deben ser mayores que 0")
+        latency = options['latencia'] / 1000
+        self.in_flight = InFlight()
+        self.chat_client = Client()
+        self.async_chat_client = AsyncClient()
+        server = slow_mercadopago(latency, self.in_flight)
+
+        self.stdout.write(
+            f"Latencia simulada {options['latencia']} ms, {total} requests por escenario, "
+            f"{concurrency} clientes contra el worker ASGI"
+        )
+        # Cache propio (memoria de chat, preferencias) y todo lo escrito en la base se descarta al final.
+        # Cada consulta llega al modelo: sin cache de respuestas (las juntaría por similitud) y
+        # con el cupo de llamadas (CHAT_LLM_CONCURRENCY) abierto, para medir el worker y no el cupo.
+        isolated = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                'LOCATION': 'benchmark-workers'}},
+            ALLOWED_HOSTS=['testserver'],
+            RATE_LIMIT_ENABLED=False,
+            MERCADOPAGO_API_BASE='http://127.0.0.1:%s' % server.server_address[1],
+            MERCADOPAGO_ACCESS_TOKEN='TEST-benchmark',
+            CELERY_BROKER_URL=None,
+        )
+        try:
+            with isolated, transaction.atomic(), \
+                    mock.patch.object(gemini_provider, 'get_model', return_value=SlowModel(latency, self.in_flight)), \
+                    mock.patch('chat.views.llm_slots', LLMSlots(limit=concurrency, wait=latency * 10)), \
+                    mock.patch.object(response_cache, 'get', return_value=None):
+                self.product = Product.objects.create(
+                    name='Producto benchmark', description='', category='teclados',
+                    price=Decimal('1000.00'), stock=10 ** 6,
+                )
+                results = [
+                    ('chat', 'sync', self.sync_run(self.chat_payload, self.sync_chat, total)),
+                    ('chat', 'asgi', async_to_sync(self.async_run)(
+                        self.async_chat_payload, self.async_chat, total, concurrency)),
+                    ('pago', 'sync', self.sync_run(self.sync_visitor, self.sync_payment, total)),
+                    ('pago', 'asgi', async_to_sync(self.async_run)(
+                        self.async_visitor, self.async_payment, total, concurrency)),
+                ]
+                transaction.set_rollback(True)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        throughput = {}
+        for scenario, mode, (elapsed, latencies, peak) in results:
+            throughput[scenario, mode] = len(latencies) / elapsed
+            self.stdout.write(
+                f"  {scenario:<5} {mode} (1 worker): {throughput[scenario, mode]:7.1f} req/s  "
+                f"p50 {statistics.median(latencies) * 1000:6.0f} ms  "
+                f"p95 {self.percentile(latencies, 95) * 1000:6.0f} ms  "
+                f"en vuelo a la vez: {peak}"
+            )
+        for scenario in ('chat', 'pago'):
+            speedup = throughput[scenario, 'asgi'] / throughput[scenario, 'sync']
+            self.stdout.write(self.style.SUCCESS(f"{scenario}: ASGI sostiene {speedup:.1f}x más requests por worker"))
+
+    @staticmethod
+    def percentile(values, percent):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, round(len(ordered) * percent / 100))]
+
+    # -------------------------------------------------------------------------
+    # Modos: un worker sync atiende de a un request; uno ASGI, todos a la vez
+    # -------------------------------------------------------------------------
+
+    def sync_run(self, prepare, send, total):
+        prepared = [prepare(n) for n in range(total)]
+        self.in_flight.reset()
+        latencies = []
+        started = time.perf_counter()
+        for item in prepared:
+            request_started = time.perf_counter()
+            send(item)
+            latencies.append(time.perf_counter() - request_started)
+        return time.perf_counter() - started, latencies, self.in_flight.peak
+
+    async def async_run(self, prepare, send, total, concurrency):
+        prepared = [await prepare(n) for n in range(total)]
+        self.in_flight.reset()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one(item):
+            async with semaphore:
+                request_started = time.perf_counter()
+                await send(item)
+                latencies.append(time.perf_counter() - request_started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(item) for item in prepared))
+        return time.perf_counter() - started, latencies, self.in_flight.peak
+
+    # -------------------------------------------------------------------------
+    # Escenarios
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def chat_payload(n):
+        # Preguntas distintas: ni el catálogo ni el cache de respuestas las contestan
+        return json.dumps({'message': f'armando un setup gamer número {n}, qué me conviene?'})
+
+    async def async_chat_payload(self, n):
+        return self.chat_payload(n)
+
+    def sync_visitor(self, n):
+        # Un visitante (sesión y carrito) por request: cada checkout crea su orden y su preferencia
+        client = Client()
+        client.post(reverse('add_to_cart', args=[self.product.id]), {'quantity': 1}, secure=True)
+        return client
+
+    async def async_visitor(self, n):
+        client = AsyncClient()
+        await client.post(reverse('add_to_cart', args=[self.product.id]), {'quantity': 1}, secure=True)
+        return client
+
+    @staticmethod
+    def expect_ok(response, scenario):
+        if response.status_code != 200:
+            raise CommandError(f"{scenario}: respuesta {response.status_code} {response.content[:200]!r}")
+
+    def sync_chat(self, payload):
+        self.expect_ok(self.chat_client.post(reverse('chat_api'), data=payload, content_type='application/json',
+                                         secure=True), 'chat')
+
+    async def async_chat(self, payload):
+        self.expect_ok(await self.async_chat_client.post(reverse('chat_api'), data=payload,
+                                                     content_type='application/json', secure=True), 'chat')
+
+    def sync_payment(self, client):
+        self.expect_ok(client.post(reverse('create_payment'), data='{}', content_type='application/json',
+                               secure=True), 'pago')
+
+    async def async_payment(self, client):
+        self.expect_ok(await client.post(reverse('create_payment'), data='{}', content_type='application/json',
+                                     secure=True), 'pago')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from marketplace.images import compute_renditions
+from marketplace.models import Product
+
+
+class Command(BaseCommand):
+    help = "Calcula y guarda las variantes responsive (thumb/card/detail) de las imágenes de producto"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help="Recalcular también las que ya están al día")
+
+    def handle(self, *args, **options):
+        updated = failed = 0
+        batch = []
+        for product in Product.objects.exclude(image='').exclude(image__isnull=True).iterator():
+            if not options['todas'] and (product.image_renditions or {}).get('source') == product.image.name:
+                continue
+            try:
+                product.image_renditions = compute_renditions(product.image)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{product.name}: {e}")
+                continue
+            batch.append(product)
+            if len(batch) == 200:
+                updated += Product.objects.bulk_update(batch, ['image_renditions'])
+                batch = []
+        if batch:
+            updated += Product.objects.bulk_update(batch, ['image_renditions'])
+        self.stdout.write(self.style.SUCCESS(f"Variantes actualizadas: {updated} productos ({failed} con error)"))
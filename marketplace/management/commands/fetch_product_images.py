@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from marketplace.seeding import fetch_pending_images
+
+
+class Command(BaseCommand):
+    help = "Descarga las imágenes de producto pendientes (cargadas por la semilla)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', type=int, default=0, metavar='SEGUNDOS',
+            help="Ejecutar como proceso de fondo, revisando la cola cada N segundos",
+        )
+
+    def handle(self, *args, **options):
+        interval = options['loop']
+        while True:
+            saved = fetch_pending_images()
+            while saved:
+                self.stdout.write(f"Imágenes guardadas: {saved}")
+                saved = fetch_pending_images()
+            if not interval:
+                break
+            time.sleep(interval)
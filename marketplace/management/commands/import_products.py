@@ -0,0 +1,46 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.importer import BATCH_SIZE, IMAGE_THREADS, Checkpoint, ImageFetcher, ProductImporter
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa productos desde un CSV o JSONL (por lotes, con imágenes en paralelo y reanudable). "
+        "Los productos existentes se reconocen por nombre normalizado; la columna sku solo descarta "
+        "filas repetidas dentro del mismo archivo, porque Product no guarda el sku"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta al .csv o .jsonl")
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help="Por defecto, según la extensión")
+        parser.add_argument('--lote', type=int, default=BATCH_SIZE, help="Filas por escritura en la base")
+        parser.add_argument('--hilos', type=int, default=IMAGE_THREADS, help="Descargas de imágenes simultáneas")
+        parser.add_argument('--solo-nuevos', action='store_true', help="No actualizar productos existentes")
+        parser.add_argument('--reiniciar', action='store_true', help="Ignorar el checkpoint y empezar de cero")
+
+    def handle(self, *args, **options):
+        path = Path(options['archivo'])
+        if not path.exists():
+            raise CommandError(f"No existe el archivo {path}")
+        if options['lote'] < 1 or options['hilos'] < 1:
+            raise CommandError("--lote y --hilos deben ser mayores a 0")
+
+        checkpoint = Checkpoint(path)
+        if options['reiniciar']:
+            checkpoint.clear()
+
+        importer = ProductImporter(
+            batch_size=options['lote'],
+            only_new=options['solo_nuevos'],
+            fetcher=ImageFetcher(threads=options['hilos']),
+            log=self.stdout.write,
+        )
+        started = time.monotonic()
+        stats = importer.run(path, options['formato'], checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            "Importación completa en {:.1f}s: {created} creados, {updated} actualizados, "
+            "{unchanged} sin cambios, {skipped} repetidos, {errors} con error, {images} imágenes".format(time.monotonic() - started, **stats)
+        ))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from marketplace.webhooks import drain
+
+
+class Command(BaseCommand):
+    help = "Procesa las notificaciones de MercadoPago pendientes (alternativa a Celery)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', type=int, default=0, metavar='SEGUNDOS',
+            help="Ejecutar como proceso de fondo, consultando la bandeja cada N segundos",
+        )
+
+    def handle(self, *args, **options):
+        interval = options['loop']
+        while True:
+            processed = drain()
+            if processed or not interval:
+                self.stdout.write(f"Notificaciones procesadas: {processed}")
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.cart_store import purge_anonymous_carts
+
+
+class Command(BaseCommand):
+    help = "Borra las líneas de los carritos anónimos sin cambios en ANONYMOUS_CART_TTL_DAYS días"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=None,
+            help="Antigüedad mínima en días (por defecto ANONYMOUS_CART_TTL_DAYS)",
+        )
+
+    def handle(self, *args, **options):
+        days = options['dias']
+        if days is not None and days < 1:
+            raise CommandError("--dias debe ser mayor que 0")
+        deleted = purge_anonymous_carts(days=days)
+        self.stdout.write(f"Líneas de carrito borradas: {deleted}")
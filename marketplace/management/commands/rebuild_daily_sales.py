@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from marketplace.sales import rebuild_daily_sales
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el resumen de ventas diarias (DailySales) desde las órdenes vendidas"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', metavar='AAAA-MM-DD', help="Primer día a recalcular (por defecto, todo)")
+        parser.add_argument('--hasta', metavar='AAAA-MM-DD', help="Último día a recalcular (por defecto, todo)")
+
+    def handle(self, *args, **options):
+        start = end = None
+        try:
+            if options['desde']:
+                start = parse_date(options['desde'])
+            if options['hasta']:
+                end = parse_date(options['hasta'])
+        except ValueError as e:
+            raise CommandError(f"Fecha inválida: {e}")
+        if (options['desde'] and start is None) or (options['hasta'] and end is None):
+            raise CommandError("Las fechas deben tener el formato AAAA-MM-DD")
+
+        rows = rebuild_daily_sales(start, end)
+        self.stdout.write(self.style.SUCCESS(f"Resumen reconstruido: {rows} filas"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from marketplace.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda full-text de productos"
+
+    def handle(self, *args, **kwargs):
+        backend = get_search_backend()
+        self.stdout.write(f"Reconstruyendo índice con {type(backend).__name__}...")
+        backend.rebuild()
+        self.stdout.write("Índice de búsqueda actualizado.")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from marketplace.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "Libera el stock de las órdenes pendientes cuya reserva venció"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', type=int, default=0, metavar='SEGUNDOS',
+            help="Ejecutar como proceso de fondo, barriendo cada N segundos",
+        )
+
+    def handle(self, *args, **options):
+        interval = options['loop']
+        while True:
+            released = release_expired_reservations()
+            self.stdout.write(f"Órdenes liberadas: {released}")
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from marketplace.seeding import seed_products
+
+
+class Command(BaseCommand):
+    help = "Carga los productos semilla si cambiaron (idempotente, sin descargar imágenes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivos', nargs='*', help="Archivos semilla (por defecto scripts/productos.jsonl)")
+        parser.add_argument('--forzar', action='store_true', help="Aplicar aunque el checksum no haya cambiado")
+
+    def handle(self, *args, **options):
+        stats = seed_products(options['archivos'] or None, force=options['forzar'])
+        if stats is None:
+            self.stdout.write("Semilla sin cambios: nada que hacer")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            "Semilla aplicada: {created} creados, {skipped} existentes, {errors} con error, "
+            "{pending_images} imágenes pendientes".format(**stats)
+        ))
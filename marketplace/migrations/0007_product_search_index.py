@@ -0,0 +1,108 @@
+from django.db import migrations
+
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    # unaccent() no es IMMUTABLE; el wrapper permite usarlo en un índice por expresión
+    """
+    CREATE OR REPLACE FUNCTION marketplace_unaccent(text) RETURNS text AS $$
+        SELECT public.unaccent('public.unaccent', $1)
+    $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS marketplace_product_search_gin ON marketplace_product USING GIN ((
+        setweight(to_tsvector('spanish', marketplace_unaccent(coalesce("marketplace_product"."name", ''))), 'A') ||
+        setweight(to_tsvector('spanish', marketplace_unaccent(coalesce("marketplace_product"."category", ''))), 'B') ||
+        setweight(to_tsvector('spanish', marketplace_unaccent(coalesce("marketplace_product"."description", ''))), 'C')
+    ))
+    """,
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS marketplace_product_search_gin",
+    "DROP FUNCTION IF EXISTS marketplace_unaccent(text)",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS marketplace_product_fts USING fts5(
+        name, description, category,
+        content='marketplace_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS marketplace_product_fts_ai AFTER INSERT ON marketplace_product BEGIN
+        INSERT INTO marketplace_product_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS marketplace_product_fts_ad AFTER DELETE ON marketplace_product BEGIN
+        INSERT INTO marketplace_product_fts(marketplace_product_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS marketplace_product_fts_au AFTER UPDATE OF name, description, category ON marketplace_product BEGIN
+        INSERT INTO marketplace_product_fts(marketplace_product_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+        INSERT INTO marketplace_product_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END
+    """,
+    "INSERT INTO marketplace_product_fts(marketplace_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS marketplace_product_fts_ai",
+    "DROP TRIGGER IF EXISTS marketplace_product_fts_ad",
+    "DROP TRIGGER IF EXISTS marketplace_product_fts_au",
+    "DROP TABLE IF EXISTS marketplace_product_fts",
+]
+
+
+def sqlite_has_fts5(cursor):
+    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    if cursor.fetchone()[0]:
+        return True
+    # Algunas builds cargan FTS5 sin la opción de compilación
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        cursor.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except Exception:
+        return False
+
+
+def run_statements(schema_editor, postgres, sqlite):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            statements = postgres
+        elif vendor == 'sqlite' and sqlite_has_fts5(cursor):
+            statements = sqlite
+        else:
+            # Otros motores usan el backend icontains
+            return
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    run_statements(schema_editor, POSTGRES_FORWARD, SQLITE_FORWARD)
+
+
+def drop_search_index(apps, schema_editor):
+    run_statements(schema_editor, POSTGRES_REVERSE, SQLITE_REVERSE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0006_alter_product_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0007_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cart_key', models.CharField(help_text='Identificador del carrito (usuario o token anónimo)', max_length=64, verbose_name='Carrito')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Cantidad')),
+                ('price', models.DecimalField(decimal_places=2, help_text='Precio al momento de agregar el producto', max_digits=10, verbose_name='Precio Unitario')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_lines', to='marketplace.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Línea de Carrito',
+                'verbose_name_plural': 'Líneas de Carrito',
+                'indexes': [models.Index(fields=['updated_at'], name='marketplace_updated_e5fdb3_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cart_key', 'product'), name='unique_cart_line')],
+            },
+        ),
+    ]
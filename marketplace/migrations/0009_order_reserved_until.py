@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0008_cartline'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='reserved_until',
+            field=models.DateTimeField(blank=True, help_text='Vencimiento de la reserva de stock de una orden pendiente', null=True, verbose_name='Reserva hasta'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'reserved_until'], name='marketplace_status_16fda5_idx'),
+        ),
+    ]
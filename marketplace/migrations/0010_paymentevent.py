@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0009_order_reserved_until'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_id', models.CharField(help_text='Identificador de la notificación enviada por MercadoPago', max_length=100, unique=True, verbose_name='ID de Notificación')),
+                ('topic', models.CharField(help_text='Tipo de recurso notificado (payment, merchant_order, ...)', max_length=50, verbose_name='Tipo')),
+                ('resource_id', models.CharField(help_text='ID del pago u otro recurso notificado', max_length=100, verbose_name='ID del Recurso')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Contenido')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('processing', 'Procesando'), ('done', 'Procesado'), ('failed', 'Fallido')], default='pending', max_length=20, verbose_name='Estado')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Intentos')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último Error')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Evento de Pago',
+                'verbose_name_plural': 'Eventos de Pago',
+                'ordering': ['received_at'],
+                'indexes': [models.Index(fields=['status', 'received_at'], name='marketplace_status_bb75d4_idx')],
+            },
+        ),
+    ]
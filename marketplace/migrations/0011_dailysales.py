@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:23
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+
+SOLD_STATUSES = ['paid', 'processing', 'shipped', 'delivered']
+
+
+def populate_daily_sales(apps, schema_editor):
+    """Carga inicial del resumen con las órdenes ya vendidas (una sola consulta agregada)"""
+    OrderItem = apps.get_model('marketplace', 'OrderItem')
+    DailySales = apps.get_model('marketplace', 'DailySales')
+    rows = (
+        OrderItem.objects.filter(order__status__in=SOLD_STATUSES)
+        .annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product__category')
+        .annotate(
+            orders=Count('order', distinct=True),
+            units=Sum('quantity'),
+            revenue=Sum(ExpressionWrapper(F('price') * F('quantity'),
+                                          output_field=DecimalField(max_digits=12, decimal_places=2))),
+        )
+    )
+    DailySales.objects.bulk_create([
+        DailySales(date=row['day'], category=row['product__category'], orders=row['orders'],
+                   units=row['units'], revenue=row['revenue'])
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0010_paymentevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Fecha')),
+                ('category', models.CharField(choices=[('teclados', 'Teclados Mecánicos'), ('mouses', 'Mouses Gaming'), ('auriculares', 'Auriculares'), ('monitores', 'Monitores Gaming')], max_length=20, verbose_name='Categoría')),
+                ('orders', models.IntegerField(default=0, verbose_name='Órdenes')),
+                ('units', models.IntegerField(default=0, verbose_name='Unidades')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, help_text='Suma de precio x cantidad de los items vendidos (sin envío)', max_digits=12, verbose_name='Ingresos')),
+            ],
+            options={
+                'verbose_name': 'Venta Diaria',
+                'verbose_name_plural': 'Ventas Diarias',
+                'ordering': ['-date', 'category'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'category'), name='unique_daily_sales')],
+            },
+        ),
+        migrations.RunPython(populate_daily_sales, migrations.RunPython.noop),
+    ]
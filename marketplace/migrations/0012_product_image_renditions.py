@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0011_dailysales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Variantes de imagen'),
+        ),
+    ]
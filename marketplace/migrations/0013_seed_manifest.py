@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0012_product_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeedManifest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Semilla')),
+                ('checksum', models.CharField(max_length=64, verbose_name='Checksum SHA-256')),
+                ('files', models.JSONField(blank=True, default=dict, verbose_name='Archivos')),
+                ('applied_at', models.DateTimeField(auto_now=True, verbose_name='Aplicada')),
+            ],
+            options={
+                'verbose_name': 'Semilla Aplicada',
+                'verbose_name_plural': 'Semillas Aplicadas',
+            },
+        ),
+        migrations.CreateModel(
+            name='PendingProductImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500, verbose_name='URL de origen')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Intentos')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pending_image', to='marketplace.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Imagen Pendiente',
+                'verbose_name_plural': 'Imágenes Pendientes',
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
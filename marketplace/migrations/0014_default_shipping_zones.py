@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:05
+
+from django.db import migrations
+
+# Las tarifas que antes estaban fijas en calculate_shipping y envios_info.
+# 'Interior' cubre todo el país; CABA y GBA son rangos más angostos dentro
+# de él y tienen prioridad al cotizar.
+DEFAULT_ZONES = [
+    ('CABA', '1000', '1499', 'Envío CABA', '1500.00', '24-48 horas'),
+    ('GBA', '1600', '1899', 'Envío GBA', '2000.00', '48-72 horas'),
+    ('Interior', '1000', '9999', 'Envío al Interior', '3500.00', '5-7 días'),
+]
+
+
+def create_default_zones(apps, schema_editor):
+    """Carga las zonas por defecto solo si todavía no hay ninguna configurada"""
+    ShippingZone = apps.get_model('marketplace', 'ShippingZone')
+    ShippingOption = apps.get_model('marketplace', 'ShippingOption')
+    if ShippingZone.objects.exists():
+        return
+    for zone, start, end, option, price, days in DEFAULT_ZONES:
+        shipping_option = ShippingOption.objects.create(name=option, price=price, estimated_days=days)
+        ShippingZone.objects.create(name=zone, postal_code_start=start, postal_code_end=end,
+                                    shipping_option=shipping_option)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0013_seed_manifest'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_default_zones, migrations.RunPython.noop),
+    ]
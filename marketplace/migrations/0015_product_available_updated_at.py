@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0014_default_shipping_zones'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['available', 'updated_at'], name='marketplace_availab_93149c_idx'),
+        ),
+    ]
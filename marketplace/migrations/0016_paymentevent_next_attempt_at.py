@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0015_product_available_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, help_text='Un evento que falló no se reintenta antes de esta fecha (backoff exponencial)', null=True, verbose_name='Próximo Intento'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentevent',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='marketplace_status_b83807_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def close_unhandled_events(apps, schema_editor):
+    """Eventos de tópicos que el worker no reclama (merchant_order, ...) quedaban 'pending' para siempre"""
+    PaymentEvent = apps.get_model('marketplace', 'PaymentEvent')
+    PaymentEvent.objects.filter(status='pending').exclude(topic='payment').update(
+        status='done', processed_at=F('received_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0016_paymentevent_next_attempt_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_unhandled_events, migrations.RunPython.noop),
+    ]
@@ -72,6 +72,13 @@ class Product(models.Model):
     blank=True,
     null=True
     )
+    # URLs de las variantes responsive (thumb/card/detail), ver marketplace/images.py
+    image_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Variantes de imagen"
+    )
 
     # Gestión de inventario
     stock = models.PositiveIntegerField(
@@ -98,6 +105,8 @@ class Product(models.Model):
             models.Index(fields=['category', 'available']),
             models.Index(fields=['created_at']),
             models.Index(fields=['price']),
+            # Validadores HTTP del catálogo: MAX(updated_at) + COUNT sobre el índice
+            models.Index(fields=['available', 'updated_at']),
         ]
     
     def __str__(self):
@@ -180,6 +189,13 @@ class Order(models.Model):
         help_text="ID de la transacción en MercadoPago"
     )
     
+    reserved_until = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name="Reserva hasta",
+        help_text="Vencimiento de la reserva de stock de una orden pendiente"
+    )
+    
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -192,6 +208,7 @@ class Order(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
             models.Index(fields=['email']),
+            models.Index(fields=['status', 'reserved_until']),
         ]
     
     def __str__(self):
@@ -336,4 +353,208 @@ class ShippingZone(models.Model):
     
     def __str__(self):
         """Representación legible de la zona de envío"""
-        return f"{self.name} ({self.postal_code_start}-{self.postal_code_end})"
\ No newline at end of file
+        return f"{self.name} ({self.postal_code_start}-{self.postal_code_end})"
+
+
+class CartLine(models.Model):
+    """
+    Línea de carrito persistida en la base (store 'database').
+    Cada carrito se identifica por `cart_key`: 'user:<id>' o 'anon:<token>'.
+    """
+    
+    cart_key = models.CharField(
+        max_length=64,
+        verbose_name="Carrito",
+        help_text="Identificador del carrito (usuario o token anónimo)"
+    )
+    
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='cart_lines',
+        verbose_name="Producto"
+    )
+    
+    quantity = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Cantidad"
+    )
+    
+    price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name="Precio Unitario",
+        help_text="Precio al momento de agregar el producto"
+    )
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Línea de Carrito"
+        verbose_name_plural = "Líneas de Carrito"
+        constraints = [
+            models.UniqueConstraint(fields=['cart_key', 'product'], name='unique_cart_line'),
+        ]
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
+    
+    def __str__(self):
+        """Representación legible de la línea"""
+        return f"{self.cart_key}: {self.quantity} x {self.product_id}"
+
+
+class PaymentEvent(models.Model):
+    """
+    Bandeja de entrada de notificaciones de MercadoPago.
+    El webhook solo inserta (deduplicando por `notification_id`);
+    un worker procesa los eventos pendientes en lotes.
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('processing', 'Procesando'),
+        ('done', 'Procesado'),
+        ('failed', 'Fallido'),
+    ]
+    
+    notification_id = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name="ID de Notificación",
+        help_text="Identificador de la notificación enviada por MercadoPago"
+    )
+    
+    topic = models.CharField(
+        max_length=50,
+        verbose_name="Tipo",
+        help_text="Tipo de recurso notificado (payment, merchant_order, ...)"
+    )
+    
+    resource_id = models.CharField(
+        max_length=100,
+        verbose_name="ID del Recurso",
+        help_text="ID del pago u otro recurso notificado"
+    )
+    
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Contenido")
+    
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name="Estado"
+    )
+    
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Intentos")
+    last_error = models.TextField(blank=True, verbose_name="Último Error")
+    
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    
+    next_attempt_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name="Próximo Intento",
+        help_text="Un evento que falló no se reintenta antes de esta fecha (backoff exponencial)"
+    )
+    
+    class Meta:
+        verbose_name = "Evento de Pago"
+        verbose_name_plural = "Eventos de Pago"
+        ordering = ['received_at']
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        """Representación legible del evento"""
+        return f"{self.topic} {self.resource_id} ({self.status})"
+
+
+class DailySales(models.Model):
+    """
+    Resumen de ventas por día y categoría (tabla materializada).
+    Se actualiza de forma incremental cuando una orden pasa a 'paid'
+    (marketplace.sales) y se puede reconstruir con `manage.py rebuild_daily_sales`.
+    """
+    
+    date = models.DateField(verbose_name="Fecha")
+    
+    category = models.CharField(
+        max_length=20,
+        choices=Product.CATEGORY_CHOICES,
+        verbose_name="Categoría"
+    )
+    
+    orders = models.IntegerField(default=0, verbose_name="Órdenes")
+    units = models.IntegerField(default=0, verbose_name="Unidades")
+    
+    revenue = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Ingresos",
+        help_text="Suma de precio x cantidad de los items vendidos (sin envío)"
+    )
+    
+    class Meta:
+        verbose_name = "Venta Diaria"
+        verbose_name_plural = "Ventas Diarias"
+        ordering = ['-date', 'category']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'category'], name='unique_daily_sales'),
+        ]
+    
+    def __str__(self):
+        """Representación legible del resumen"""
+        return f"{self.date} {self.category}: ${self.revenue}"
+
+
+class SeedManifest(models.Model):
+    """
+    Checksum de los datos semilla ya aplicados (ver marketplace.seeding).
+    Si el contenido no cambió, el seed del deploy es una sola consulta.
+    """
+    
+    name = models.CharField(max_length=50, unique=True, verbose_name="Semilla")
+    checksum = models.CharField(max_length=64, verbose_name="Checksum SHA-256")
+    files = models.JSONField(default=dict, blank=True, verbose_name="Archivos")
+    applied_at = models.DateTimeField(auto_now=True, verbose_name="Aplicada")
+    
+    class Meta:
+        verbose_name = "Semilla Aplicada"
+        verbose_name_plural = "Semillas Aplicadas"
+    
+    def __str__(self):
+        """Representación legible de la semilla"""
+        return f"{self.name} ({self.checksum[:12]})"
+
+
+class PendingProductImage(models.Model):
+    """
+    Imagen de producto a descargar en segundo plano (fuera del build).
+    La procesa `manage.py fetch_product_images` o la tarea Celery equivalente.
+    """
+    
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='pending_image',
+        verbose_name="Producto"
+    )
+    
+    url = models.URLField(max_length=500, verbose_name="URL de origen")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Intentos")
+    last_error = models.TextField(blank=True, verbose_name="Último Error")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Imagen Pendiente"
+        verbose_name_plural = "Imágenes Pendientes"
+        ordering = ['created_at']
+    
+    def __str__(self):
+        """Representación legible de la descarga pendiente"""
+        return f"{self.product_id}: {self.url}"
@@ -0,0 +1,273 @@
+# === marketplace/pagination.py - Paginación por cursor (keyset) ===
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+
+# Ordenamientos soportados: clave de la URL -> campos (con `id` como desempate)
+SORT_KEYS = {
+    'name': ('name', 'id'),
+    'price_low': ('price', 'id'),
+    'price_high': ('-price', '-id'),
+    'newest': ('-created_at', '-id'),
+    # Solo válido sobre querysets anotados por marketplace.search
+    'relevance': ('-search_rank', 'id'),
+}
+# El rank es un float calculado en cada consulta: una búsqueda por igualdad
+# sobre él no es confiable entre motores. Estos ordenamientos (resultados de
+# búsqueda) paginan por OFFSET también con cursor, pero solo hasta count_limit:
+# más allá no hay páginas (hay que refinar la búsqueda), así el OFFSET está acotado.
+OFFSET_SORTS = {'relevance'}
+
+PAGE_SIZE = 12
+# Solo las primeras páginas se sirven por número (OFFSET barato);
+# más allá se navega únicamente con cursores
+NUMBERED_PAGES = 5
+# Tope del conteo: si hay más resultados no se hace COUNT(*) completo
+COUNT_LIMIT = 500
+
+CURSOR_SALT = 'marketplace.pagination.cursor'
+
+
+class InvalidCursor(Exception):
+    """Cursor alterado, vencido o de otro ordenamiento"""
+
+
+class KeysetPaginator:
+    """
+    Paginador por cursor sobre un queryset de productos.
+    Las páginas profundas se buscan con `WHERE (campo, id) > (valor, id)`
+    en lugar de OFFSET, así el costo no crece con la profundidad.
+    """
+
+    def __init__(self, queryset, sort_by='name', per_page=PAGE_SIZE,
+                 numbered_pages=NUMBERED_PAGES, count_limit=COUNT_LIMIT):
+        self.sort_by = sort_by if sort_by in SORT_KEYS else 'name'
+        self.ordering = SORT_KEYS[self.sort_by]
+        self.uses_offset = self.sort_by in OFFSET_SORTS
+        self.queryset = queryset.order_by(*self.ordering)
+        self.per_page = per_page
+        self.numbered_pages = numbered_pages
+        self.count_limit = count_limit
+        self._count = None
+        self._count_computed = False
+
+    # -------------------------------------------------------------------------
+    # Conteo acotado
+    # -------------------------------------------------------------------------
+
+    @property
+    def count(self):
+        """Total de resultados, o None si supera `count_limit`"""
+        if not self._count_computed:
+            # COUNT sobre una subconsulta con LIMIT: nunca recorre más de count_limit + 1 filas
+            bounded = self.queryset.order_by()[:self.count_limit + 1].count()
+            self._count = bounded if bounded <= self.count_limit else None
+            self._count_computed = True
+        return self._count
+
+    @property
+    def count_is_exact(self):
+        return self.count is not None
+
+    @property
+    def num_pages(self):
+        """Páginas conocidas (None si el conteo fue truncado)"""
+        if self.count is None:
+            return None
+        return max(1, -(-self.count // self.per_page))
+
+    @property
+    def page_range(self):
+        """Números de página navegables directamente"""
+        last = self.numbered_pages
+        if self.num_pages is not None:
+            last = min(last, self.num_pages)
+        return range(1, last + 1)
+
+    # -------------------------------------------------------------------------
+    # Cursores
+    # -------------------------------------------------------------------------
+
+    def _field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def encode_cursor(self, product, direction, number, offset=0):
+        """Genera un token opaco y firmado a partir de la fila frontera (o del offset)"""
+        if self.uses_offset:
+            payload = {'s': self.sort_by, 'o': offset, 'd': direction, 'n': number}
+            return signing.dumps(payload, salt=CURSOR_SALT, compress=True)
+        values = []
+        for name in self._field_names():
+            value = getattr(product, name)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            elif not isinstance(value, float):
+                value = str(value)
+            values.append(value)
+        payload = {'s': self.sort_by, 'v': values, 'd': direction, 'n': number}
+        return signing.dumps(payload, salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, token):
+        """Devuelve (valores u offset, dirección, número de página) de un token"""
+        try:
+            payload = signing.loads(token, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            raise InvalidCursor(token)
+
+        if payload.get('s') != self.sort_by or payload.get('d') not in ('next', 'prev'):
+            raise InvalidCursor(token)
+
+        if self.uses_offset:
+            offset = payload.get('o')
+            if not isinstance(offset, int) or not 0 <= offset < self.count_limit:
+                raise InvalidCursor(token)
+            return offset, payload['d'], int(payload.get('n', 1))
+
+        try:
+            values = [
+                self._to_python(name, raw)
+                for name, raw in zip(self._field_names(), payload['v'], strict=True)
+            ]
+        except Exception:
+            raise InvalidCursor(token)
+        return values, payload['d'], int(payload.get('n', 1))
+
+    def _to_python(self, name, raw):
+        try:
+            return self.queryset.model._meta.get_field(name).to_python(raw)
+        except FieldDoesNotExist:
+            # Anotaciones (p. ej. search_rank) son numéricas
+            return float(raw)
+
+    def _seek_filter(self, values, reverse=False):
+        """Construye el predicado lexicográfico (a > x) OR (a = x AND b > y) ..."""
+        condition = Q()
+        equal_prefix = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = f'{name}__lt' if descending else f'{name}__gt'
+            condition |= equal_prefix & Q(**{lookup: value})
+            equal_prefix &= Q(**{name: value})
+        return condition
+
+    # -------------------------------------------------------------------------
+    # Páginas
+    # -------------------------------------------------------------------------
+
+    def page(self, number=None, cursor=None):
+        """
+        Obtiene una página por número (solo primeras páginas) o por cursor.
+        Un cursor inválido o un número fuera de rango vuelven a la página 1.
+        """
+        if cursor:
+            try:
+                values, direction, number = self.decode_cursor(cursor)
+            except InvalidCursor:
+                return self._numbered_page(1)
+            return self._cursor_page(values, direction, number)
+
+        try:
+            number = int(number or 1)
+        except (TypeError, ValueError):
+            number = 1
+        if number < 1 or number > self.numbered_pages:
+            number = 1
+        return self._numbered_page(number)
+
+    def _numbered_page(self, number):
+        return self._offset_page((number - 1) * self.per_page, number)
+
+    def _offset_page(self, offset, number):
+        size = self.per_page
+        if self.uses_offset:
+            # Solo los primeros count_limit resultados de una búsqueda son navegables
+            size = max(0, min(size, self.count_limit - offset))
+        rows = list(self.queryset[offset:offset + size + 1])
+        has_next = len(rows) > size
+        if self.uses_offset and offset + size >= self.count_limit:
+            has_next = False
+        return KeysetPage(self, rows[:size], number, has_next, offset > 0, offset)
+
+    def _cursor_page(self, values, direction, number):
+        if self.uses_offset:
+            return self._offset_page(values, max(1, number))
+        if direction == 'next':
+            queryset = self.queryset.filter(self._seek_filter(values))
+            rows = list(queryset[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = True
+        else:
+            reversed_ordering = [
+                field[1:] if field.startswith('-') else f'-{field}'
+                for field in self.ordering
+            ]
+            queryset = self.queryset.filter(self._seek_filter(values, reverse=True))
+            rows = list(queryset.order_by(*reversed_ordering)[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = True
+        return KeysetPage(self, rows, max(1, number), has_next, has_previous)
+
+
+class KeysetPage:
+    """Página compatible con la interfaz de `django.core.paginator.Page` usada en las plantillas"""
+
+    def __init__(self, paginator, object_list, number, has_next, has_previous, offset=0):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.number = number
+        self.offset = offset  # solo lo usan los ordenamientos paginados por OFFSET
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(
+            self.object_list[-1], 'next', self.number + 1, offset=self.offset + len(self.object_list),
+        )
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(
+            self.object_list[0], 'prev', self.number - 1, offset=max(0, self.offset - self.paginator.per_page),
+        )
+
+    @property
+    def next_is_numbered(self):
+        """La página siguiente todavía se puede pedir por número"""
+        return self.number + 1 <= self.paginator.numbered_pages
+
+    @property
+    def previous_is_numbered(self):
+        return 1 <= self.number - 1 <= self.paginator.numbered_pages
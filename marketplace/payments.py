@@ -0,0 +1,326 @@
+# === marketplace/payments.py - Gateway de MercadoPago ===
+#
+# Un único cliente por proceso:
+#   - requests.Session compartida con pool de conexiones keep-alive (el SDK
+#     abre una sesión nueva, con su handshake TLS, en cada llamada)
+#   - timeout de conexión/lectura y reintentos con backoff exponencial + jitter
+#     ante errores de red, 429 y 5xx. Los POST llevan X-Idempotency-Key, así
+#     un reintento nunca crea dos recursos en MercadoPago.
+#   - preferencias cacheadas por huella del carrito: un doble click o un
+#     reintento del checkout reutiliza la preferencia (y la reserva) existente.
+#   - para las vistas async (modo ASGI) la preferencia se crea con un
+#     httpx.AsyncClient, con el mismo esquema de timeouts, reintentos e
+#     idempotencia. Los clientes async quedan atados a su event loop: se
+#     guarda uno por loop (con uvicorn es uno solo por worker).
+
+import asyncio
+import hashlib
+import logging
+import random
+import threading
+import time
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import mercadopago
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from mercadopago.config import RequestOptions
+from mercadopago.http.http_client import HttpClient
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_BASE = 'https://api.mercadopago.com'
+
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 4.0
+POOL_SIZE = 10
+ASYNC_POOL_SIZE = 100  # un worker ASGI atiende muchos checkouts a la vez
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+PREFERENCE_KEY = 'marketplace:mp-preference:{}'
+PREFERENCE_LOCK_TIMEOUT = 30
+PREFERENCE_LOCK_WAIT = 5.0
+
+
+class PaymentGatewayError(Exception):
+    """MercadoPago no respondió o devolvió un error"""
+
+
+class PreferenceInProgress(Exception):
+    """Otra request sigue creando la preferencia de este carrito"""
+
+
+class PooledHttpClient(HttpClient):
+    """Cliente HTTP del SDK sobre una sesión persistente con reintentos propios"""
+
+    def __init__(self, base_url=DEFAULT_API_BASE, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                 max_retries=MAX_RETRIES, pool_size=POOL_SIZE):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _backoff(self, attempt):
+        # "Full jitter": espera aleatoria en [0, base * 2^intento]
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        if self.base_url != DEFAULT_API_BASE and url.startswith(DEFAULT_API_BASE):
+            url = self.base_url + url[len(DEFAULT_API_BASE):]
+        # El timeout único del SDK (60 s) se reemplaza por (conexión, lectura)
+        kwargs['timeout'] = self.timeout
+        if method == 'POST':
+            headers = dict(kwargs.get('headers') or {})
+            headers.setdefault('X-Idempotency-Key', uuid.uuid4().hex)
+            kwargs['headers'] = headers
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                result = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise PaymentGatewayError(f"MercadoPago no responde: {e}") from e
+                error, status = str(e), None
+            else:
+                if result.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    logger.info(
+                        "mercadopago.request method=%s path=%s status=%s attempt=%s ms=%.0f",
+                        method, url[len(self.base_url):], result.status_code, attempt + 1,
+                        (time.perf_counter() - started) * 1000,
+                    )
+                    return self._response(result)
+                error, status = None, result.status_code
+
+            delay = self._backoff(attempt)
+            logger.warning(
+                "mercadopago.retry method=%s path=%s status=%s error=%s attempt=%s delay=%.2f",
+                method, url[len(self.base_url):], status, error, attempt + 1, delay,
+            )
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _response(result):
+        response = {'status': result.status_code, 'response': None}
+        if result.status_code != 204 and result.content:
+            try:
+                response['response'] = result.json()
+            except ValueError:
+                logger.warning("mercadopago.invalid_json status=%s", result.status_code)
+        return response
+
+
+class AsyncHttpClient:
+    """Equivalente async de PooledHttpClient (httpx, un cliente por event loop)"""
+
+    def __init__(self, access_token, base_url=DEFAULT_API_BASE, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                 max_retries=MAX_RETRIES, pool_size=ASYNC_POOL_SIZE):
+        self.access_token = access_token
+        self.base_url = base_url.rstrip('/')
+        self.timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.max_retries = max_retries
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+                headers={
+                    'Authorization': f'Bearer {self.access_token}',
+                    'User-Agent': 'MasivoTech-Checkout/1.0',
+                },
+            )
+        return client
+
+    async def request(self, method, path, json=None, headers=None):
+        headers = dict(headers or {})
+        if method == 'POST':
+            headers.setdefault('X-Idempotency-Key', uuid.uuid4().hex)
+        client = self._client()
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                result = await client.request(method, path, json=json, headers=headers)
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise PaymentGatewayError(f"MercadoPago no responde: {e}") from e
+                error, status = str(e) or type(e).__name__, None
+            else:
+                if result.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    logger.info(
+                        "mercadopago.request method=%s path=%s status=%s attempt=%s ms=%.0f async=1",
+                        method, path, result.status_code, attempt + 1, (time.perf_counter() - started) * 1000,
+                    )
+                    return PooledHttpClient._response(result)
+                error, status = None, result.status_code
+
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            logger.warning(
+                "mercadopago.retry method=%s path=%s status=%s error=%s attempt=%s delay=%.2f",
+                method, path, status, error, attempt + 1, delay,
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class MercadoPagoGateway:
+    """SDK configurado una sola vez por proceso"""
+
+    def __init__(self, access_token, base_url=DEFAULT_API_BASE):
+        self.http_client = PooledHttpClient(base_url)
+        self.async_client = AsyncHttpClient(access_token, base_url)
+        self.sdk = mercadopago.SDK(access_token, http_client=self.http_client)
+
+    @staticmethod
+    def _preference(response):
+        if response['status'] not in (200, 201):
+            logger.error("mercadopago.preference_error status=%s body=%s",
+                         response['status'], response['response'])
+            raise PaymentGatewayError(f"MercadoPago devolvió {response['status']}")
+        preference = response['response'] or {}
+        init_point = preference.get('init_point') or preference.get('sandbox_init_point')
+        if not init_point:
+            raise PaymentGatewayError("MercadoPago no devolvió URL de pago válida")
+        return {'id': preference['id'], 'init_point': init_point}
+
+    def create_preference(self, preference_data, idempotency_key=None):
+        options = RequestOptions(
+            custom_headers={'X-Idempotency-Key': idempotency_key} if idempotency_key else None,
+        )
+        return self._preference(self.sdk.preference().create(preference_data, options))
+
+    async def acreate_preference(self, preference_data, idempotency_key=None):
+        """create_preference sin bloquear el event loop"""
+        headers = {'X-Idempotency-Key': idempotency_key} if idempotency_key else None
+        response = await self.async_client.request('POST', '/checkout/preferences',
+                                                   json=preference_data, headers=headers)
+        return self._preference(response)
+
+    def get_payment(self, payment_id):
+        """Datos del pago o None si no se pudo consultar"""
+        try:
+            response = self.sdk.payment().get(payment_id)
+        except PaymentGatewayError as e:
+            logger.warning("mercadopago.payment_unreachable payment=%s error=%s", payment_id, e)
+            return None
+        if response.get('status') != 200:
+            logger.warning("mercadopago.payment_error payment=%s status=%s", payment_id, response.get('status'))
+            return None
+        return response['response']
+
+    def fetch_payments(self, payment_ids, max_workers=4):
+        """
+        Consulta varios pagos en paralelo (un GET por pago distinto).
+        Devuelve {payment_id: datos del pago o None si falló}.
+        """
+        payment_ids = list(dict.fromkeys(str(pid) for pid in payment_ids))
+        if not payment_ids:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(payment_ids))) as pool:
+            return dict(zip(payment_ids, pool.map(self.get_payment, payment_ids)))
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Gateway del proceso; se recrea si cambian las credenciales o la URL base"""
+    global _gateway
+    token = settings.MERCADOPAGO_ACCESS_TOKEN
+    if not token:
+        raise PaymentGatewayError("MERCADOPAGO_ACCESS_TOKEN no configurado")
+    base_url = getattr(settings, 'MERCADOPAGO_API_BASE', DEFAULT_API_BASE)
+    gateway = _gateway
+    if gateway is None or gateway.config != (token, base_url):
+        with _gateway_lock:
+            gateway = _gateway
+            if gateway is None or gateway.config != (token, base_url):
+                gateway = MercadoPagoGateway(token, base_url)
+                gateway.config = (token, base_url)
+                _gateway = gateway
+    return gateway
+
+
+def fetch_payments(payment_ids, max_workers=4):
+    return get_gateway().fetch_payments(payment_ids, max_workers)
+
+
+# =============================================================================
+# PREFERENCIAS CACHEADAS POR CARRITO
+# =============================================================================
+
+def cart_fingerprint(owner, cart, shipping_price=0, postal_code='', customer=None):
+    """Huella estable del contenido del checkout (líneas, envío y datos de contacto)"""
+    parts = [str(owner), str(shipping_price), str(postal_code)]
+    parts.extend(
+        f"{item['product'].id}:{item['quantity']}:{item['price']}"
+        for item in sorted(cart, key=lambda item: item['product'].id)
+    )
+    if customer:
+        parts.extend(f"{field}={customer[field]}" for field in sorted(customer))
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+
+def preference_idempotency_key(fingerprint, order_id):
+    """X-Idempotency-Key de la preferencia: el mismo carrito con otra orden es otro recurso"""
+    return hashlib.sha256(f"{fingerprint}:order:{order_id}".encode()).hexdigest()
+
+
+async def acached_preference(fingerprint, create, is_valid, timeout):
+    """
+    Devuelve la preferencia cacheada para `fingerprint` si `await is_valid(cached)`;
+    si no, la crea con `await create()` (que devuelve un dict serializable) y la guarda.
+    Un lock en el cache evita que dos requests simultáneas creen dos preferencias;
+    si no se libera en PREFERENCE_LOCK_WAIT segundos levanta PreferenceInProgress.
+    """
+    key = PREFERENCE_KEY.format(fingerprint)
+    cached = await cache.aget(key)
+    if cached is not None:
+        if await is_valid(cached):
+            logger.info("mercadopago.preference_reused preference=%s", cached['id'])
+            return cached
+        # Reserva vencida o liberada: la preferencia apunta a una orden cancelada
+        await cache.adelete(key)
+
+    # El lock guarda un token propio: solo quien lo tomó lo libera
+    lock_key = key + ':lock'
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + PREFERENCE_LOCK_WAIT
+    while not await cache.aadd(lock_key, token, PREFERENCE_LOCK_TIMEOUT):
+        # Otra request está creando la misma preferencia: esperar su resultado
+        if time.monotonic() > deadline:
+            raise PreferenceInProgress("El pago de este carrito se está procesando, reintentá en unos segundos")
+        await asyncio.sleep(0.1)
+        cached = await cache.aget(key)
+        if cached is not None and await is_valid(cached):
+            return cached
+
+    try:
+        preference = await create()
+        await cache.aset(key, preference, timeout)
+        return preference
+    finally:
+        # Si create() superó PREFERENCE_LOCK_TIMEOUT el lock venció y puede ser de otra request
+        if await cache.aget(lock_key) == token:
+            await cache.adelete(lock_key)
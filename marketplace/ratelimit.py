@@ -0,0 +1,218 @@
+# === marketplace/ratelimit.py - Límite de consultas por cliente ===
+#
+# Token buckets por endpoint, definidos en settings.RATE_LIMITS:
+#
+#   RATE_LIMITS = {'chat': '10/m', 'autocomplete': '10/s'}
+#
+# '10/m' = balde de 10 fichas que se recarga a 10 por minuto (ráfagas de
+# hasta 10, promedio de 10 por minuto). Cada request consume una ficha del
+# balde del cliente (usuario autenticado, o si no, su sesión) y otra del
+# balde de su IP, que es RATE_LIMIT_IP_FACTOR veces más grande para no
+# castigar a varios clientes detrás del mismo NAT. Sin fichas: 429 con
+# Retry-After, sin tocar la vista. Los baldes se consumen todos o ninguno:
+# un request rechazado por su IP no gasta la cuota de su sesión.
+#
+# Stores (RATE_LIMIT_STORE):
+#   - 'local': baldes exactos en memoria del proceso (un lock, LRU acotado)
+#   - 'cache': compartido entre workers con el cache de Django. Como el cache
+#     solo ofrece add/incr atómicos, el balde se aproxima con un contador por
+#     ventana de capacity/rate segundos: mismo promedio, ráfaga de hasta 2x
+#     en el borde entre ventanas.
+
+import functools
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+DEFAULT_IP_FACTOR = 5
+MAX_LOCAL_BUCKETS = 50000
+
+
+def parse_rate(rate):
+    """'10/m' -> (capacidad 10, 10/60 fichas por segundo)"""
+    count, _, period = str(rate).partition('/')
+    count = int(count)
+    seconds = PERIODS[period.strip().lower()[:1]]
+    return count, count / seconds
+
+
+class LocalBucketStore:
+    """Token buckets exactos en memoria del proceso"""
+
+    def __init__(self, max_buckets=MAX_LOCAL_BUCKETS):
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # clave -> (fichas, último cálculo)
+
+    def consume(self, key, capacity, refill_rate):
+        """Devuelve 0 si había ficha, o los segundos hasta la próxima"""
+        return self.consume_all([(key, capacity, refill_rate)])[0]
+
+    def consume_all(self, buckets):
+        """
+        Una ficha de cada balde [(clave, capacidad, recarga)], solo si todos tienen.
+        Devuelve (0, None) o (segundos hasta poder pasar, clave del balde vacío).
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, capacity, refill_rate in buckets:
+                tokens, updated = self._buckets.pop(key, (capacity, now))
+                levels.append(min(capacity, tokens + (now - updated) * refill_rate))
+            short = [
+                ((1 - tokens) / refill_rate, key)
+                for (key, _, refill_rate), tokens in zip(buckets, levels) if tokens < 1
+            ]
+            wait, rejected = max(short) if short else (0.0, None)
+            for (key, _, _), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens if short else tokens - 1, now)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return wait, rejected
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """Contadores por ventana en el cache de Django (incr atómico en Redis/Memcached)"""
+
+    def consume(self, key, capacity, refill_rate):
+        return self.consume_all([(key, capacity, refill_rate)])[0]
+
+    def consume_all(self, buckets):
+        """
+        Como LocalBucketStore.consume_all. El cache no permite mirar sin
+        consumir: se incrementa balde por balde y, si uno se pasa, se
+        devuelve lo consumido.
+        """
+        taken = []
+        for key, capacity, refill_rate in buckets:
+            cache_key, wait = self._take(key, capacity, refill_rate)
+            taken.append(cache_key)
+            if wait:
+                for consumed in taken:
+                    try:
+                        cache.decr(consumed)
+                    except ValueError:
+                        # La ventana venció mientras tanto: no hay nada que devolver
+                        pass
+                return wait, key
+        return 0.0, None
+
+    @staticmethod
+    def _take(key, capacity, refill_rate):
+        window = max(1, math.ceil(capacity / refill_rate))
+        now = time.time()
+        slot = int(now // window)
+        cache_key = f"ratelimit:{key}:{slot}"
+        cache.add(cache_key, 0, window + 1)
+        try:
+            used = cache.incr(cache_key)
+        except ValueError:
+            # Vencida entre add e incr: arranca una ventana nueva
+            cache.set(cache_key, 1, window + 1)
+            used = 1
+        if used <= capacity:
+            return cache_key, 0.0
+        return cache_key, (slot + 1) * window - now
+
+    def clear(self):
+        pass
+
+
+_stores = {}
+
+
+def get_store():
+    name = getattr(settings, 'RATE_LIMIT_STORE', 'local')
+    if name not in _stores:
+        _stores[name] = CacheBucketStore() if name == 'cache' else LocalBucketStore()
+    return _stores[name]
+
+
+def client_ip(request):
+    """IP del cliente; detrás del proxy de Render es la última de X-Forwarded-For"""
+    if getattr(settings, 'RATE_LIMIT_TRUST_FORWARDED', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def bucket_keys(request, scope, user):
+    """Baldes que consume el request: (clave, multiplicador de capacidad)"""
+    keys = []
+    if user is not None and user.is_authenticated:
+        keys.append((f"{scope}:user:{user.pk}", 1))
+    else:
+        session = getattr(request, 'session', None)
+        session_key = session.session_key if session is not None else None
+        if session_key:
+            keys.append((f"{scope}:session:{session_key}", 1))
+    ip = client_ip(request)
+    if ip:
+        keys.append((f"{scope}:ip:{ip}", getattr(settings, 'RATE_LIMIT_IP_FACTOR', DEFAULT_IP_FACTOR)))
+    return keys
+
+
+def check(request, scope, user):
+    """Segundos a esperar (0 si el request puede pasar)"""
+    rate = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+    if not rate or not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+        return 0.0
+    capacity, refill_rate = parse_rate(rate)
+    buckets = [
+        (key, capacity * factor, refill_rate * factor) for key, factor in bucket_keys(request, scope, user)
+    ]
+    wait, key = get_store().consume_all(buckets)
+    if wait:
+        logger.info("ratelimit.reject scope=%s key=%s retry_after=%.1f", scope, key, wait)
+    return wait
+
+
+def too_many_requests(retry_after, message='Demasiadas consultas. Esperá unos segundos e intentá de nuevo.'):
+    response = JsonResponse({'error': message, 'retry_after': math.ceil(retry_after)}, status=429)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def rate_limit(scope):
+    """Decorador de vista (sync o async) con el límite settings.RATE_LIMITS[scope]"""
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                user = await request.auser() if hasattr(request, 'auser') else None
+                if getattr(settings, 'RATE_LIMIT_STORE', 'local') == 'cache':
+                    wait = await sync_to_async(check)(request, scope, user)
+                else:
+                    wait = check(request, scope, user)
+                if wait:
+                    return too_many_requests(wait)
+                return await view(request, *args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            wait = check(request, scope, getattr(request, 'user', None))
+            if wait:
+                return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,114 @@
+# === marketplace/sales.py - Resumen materializado de ventas diarias ===
+#
+# DailySales guarda (fecha, categoría) -> órdenes, unidades e ingresos.
+#   - record_sale(): cuando una orden pasa a vendida suma sus líneas con
+#     UPDATE ... SET x = x + n por categoría (INSERT si la fila no existe).
+#   - reverse_sale(): resta lo mismo si una orden vendida se cancela.
+#   - rebuild_daily_sales(): recalcula un rango desde OrderItem con una sola
+#     consulta agregada (comando rebuild_daily_sales).
+# La fecha es la de creación de la orden en la zona horaria del sitio, igual
+# que TruncDate('created_at') en las consultas del dashboard.
+
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailySales, Order, OrderItem
+
+logger = logging.getLogger(__name__)
+
+# Estados en los que una orden cuenta como venta
+SOLD_STATUSES = ('paid', 'processing', 'shipped', 'delivered')
+
+LINE_TOTAL = ExpressionWrapper(
+    F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)
+)
+
+
+def is_sold(status):
+    return status in SOLD_STATUSES
+
+
+def _order_totals(order_id):
+    """{categoría: (unidades, ingresos)} de una orden"""
+    rows = (
+        OrderItem.objects.filter(order_id=order_id)
+        .values('product__category')
+        .annotate(units=Sum('quantity'), revenue=Sum(LINE_TOTAL))
+    )
+    return {row['product__category']: (row['units'], row['revenue']) for row in rows}
+
+
+def _apply(order_id, sign):
+    created_at = Order.objects.filter(id=order_id).values_list('created_at', flat=True).first()
+    if created_at is None:
+        return
+    day = timezone.localdate(created_at)
+    for category, (units, revenue) in _order_totals(order_id).items():
+        rows = DailySales.objects.filter(date=day, category=category)
+        changes = {
+            'orders': F('orders') + sign,
+            'units': F('units') + sign * units,
+            'revenue': F('revenue') + sign * revenue,
+        }
+        if rows.update(**changes) or sign < 0:
+            continue
+        try:
+            with transaction.atomic():
+                DailySales.objects.create(date=day, category=category, orders=1, units=units, revenue=revenue)
+        except IntegrityError:
+            # Otra transacción creó la fila en paralelo
+            rows.update(**changes)
+
+
+def record_sale(order_id):
+    """Suma una orden recién vendida al resumen (llamar una vez por transición)"""
+    _apply(order_id, 1)
+
+
+def reverse_sale(order_id):
+    """Descuenta una orden vendida que se canceló o devolvió"""
+    _apply(order_id, -1)
+
+
+def track_status_change(order_id, old_status, new_status):
+    """Mantiene el resumen cuando cambia el estado de una orden"""
+    if not is_sold(old_status) and is_sold(new_status):
+        record_sale(order_id)
+    elif is_sold(old_status) and not is_sold(new_status):
+        reverse_sale(order_id)
+
+
+def rebuild_daily_sales(start=None, end=None):
+    """
+    Recalcula el resumen desde las órdenes (fechas inclusivas, None = sin límite).
+    Devuelve la cantidad de filas generadas.
+    """
+    items = OrderItem.objects.filter(order__status__in=SOLD_STATUSES)
+    existing = DailySales.objects.all()
+    if start:
+        items = items.filter(order__created_at__date__gte=start)
+        existing = existing.filter(date__gte=start)
+    if end:
+        items = items.filter(order__created_at__date__lte=end)
+        existing = existing.filter(date__lte=end)
+
+    rows = (
+        items.annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product__category')
+        .annotate(orders=Count('order', distinct=True), units=Sum('quantity'), revenue=Sum(LINE_TOTAL))
+        .order_by()
+    )
+    with transaction.atomic():
+        existing.delete()
+        created = DailySales.objects.bulk_create([
+            DailySales(date=row['day'], category=row['product__category'], orders=row['orders'],
+                       units=row['units'], revenue=row['revenue'])
+            for row in rows
+        ], batch_size=500)
+
+    logger.info("Resumen de ventas reconstruido: %s filas (%s - %s)", len(created), start, end)
+    return len(created)
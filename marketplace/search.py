@@ -0,0 +1,185 @@
+# === marketplace/search.py - Búsqueda full-text de productos ===
+#
+# Backends intercambiables:
+#   - PostgreSQL: tsvector + índice GIN (config 'spanish', sin acentos)
+#   - SQLite: tabla sombra FTS5 mantenida por triggers
+#   - Fallback: icontains (cualquier otro motor)
+#
+# El índice se mantiene en la base de datos (índice por expresión en Postgres,
+# triggers en SQLite), así que save(), bulk_create(), bulk_update() y
+# queryset.update() quedan sincronizados sin señales.
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 8
+
+
+def tokenize(query):
+    """Extrae los términos buscables de la consulta del usuario"""
+    return TOKEN_RE.findall(query or '')[:MAX_TERMS]
+
+
+class BaseSearchBackend:
+    """
+    Interfaz de los backends de búsqueda.
+    `search()` filtra el queryset y lo anota con `search_rank` (mayor = más relevante).
+    """
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def is_available(self):
+        return True
+
+    def rebuild(self):
+        """Reconstruye el índice completo (no-op si el motor lo mantiene solo)"""
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """Búsqueda por icontains: sin índice, solo como último recurso"""
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        for term in terms:
+            queryset = queryset.filter(
+                Q(name__icontains=term) |
+                Q(description__icontains=term) |
+                Q(category__icontains=term)
+            )
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector ponderado (nombre > categoría > descripción) con índice GIN por expresión"""
+
+    # Debe coincidir exactamente con el índice creado en la migración 0007
+    VECTOR_SQL = (
+        "(setweight(to_tsvector('spanish', marketplace_unaccent(coalesce(\"marketplace_product\".\"name\", ''))), 'A') || "
+        "setweight(to_tsvector('spanish', marketplace_unaccent(coalesce(\"marketplace_product\".\"category\", ''))), 'B') || "
+        "setweight(to_tsvector('spanish', marketplace_unaccent(coalesce(\"marketplace_product\".\"description\", ''))), 'C'))"
+    )
+    QUERY_SQL = "to_tsquery('spanish', marketplace_unaccent(%s))"
+
+    def build_query(self, terms):
+        # Prefijo en cada término: 'tecl' encuentra 'teclado'
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        tsquery = self.build_query(terms)
+        return queryset.filter(
+            RawSQL(f'{self.VECTOR_SQL} @@ {self.QUERY_SQL}', [tsquery], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f'ts_rank({self.VECTOR_SQL}, {self.QUERY_SQL})', [tsquery], output_field=FloatField())
+        )
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """Tabla virtual FTS5 (unicode61 sin diacríticos) ordenada por bm25"""
+
+    TABLE = 'marketplace_product_fts'
+    # Mismos triggers que la migración 0007. SQLite recrea la tabla de productos en
+    # cada AlterField/AddField y los triggers se pierden con la tabla vieja.
+    TRIGGERS = [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {TABLE}_ai AFTER INSERT ON marketplace_product BEGIN
+            INSERT INTO {TABLE}(rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {TABLE}_ad AFTER DELETE ON marketplace_product BEGIN
+            INSERT INTO {TABLE}({TABLE}, rowid, name, description, category)
+            VALUES ('delete', old.id, old.name, old.description, old.category);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {TABLE}_au AFTER UPDATE OF name, description, category ON marketplace_product BEGIN
+            INSERT INTO {TABLE}({TABLE}, rowid, name, description, category)
+            VALUES ('delete', old.id, old.name, old.description, old.category);
+            INSERT INTO {TABLE}(rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END
+        """,
+    ]
+
+    def __init__(self):
+        self._available = None
+
+    def is_available(self):
+        if self._available is None:
+            self._available = self.TABLE in connection.introspection.table_names()
+        return self._available
+
+    def build_query(self, terms):
+        return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        match = self.build_query(terms)
+        product_table = connection.ops.quote_name(queryset.model._meta.db_table)
+        # Un solo JOIN con la tabla FTS: MATCH se evalúa una vez y bm25() sale de esa
+        # misma fila (una subconsulta correlacionada repetiría el MATCH por producto).
+        # bm25 es negativo y menor = mejor; se invierte para que mayor = más relevante.
+        # Pesos por columna: name, description, category
+        return queryset.extra(
+            tables=[self.TABLE],
+            where=[f'{self.TABLE}.rowid = {product_table}."id"', f'{self.TABLE} MATCH %s'],
+            params=[match],
+            select={'search_rank': f'-bm25({self.TABLE}, 10.0, 1.0, 4.0)'},
+        )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.TABLE}({self.TABLE}) VALUES('rebuild')")
+
+    def sync(self):
+        """Vuelve a crear los triggers que falten y reindexa lo escrito sin ellos"""
+        with connection.cursor() as cursor:
+            for statement in self.TRIGGERS:
+                cursor.execute(statement)
+        self.rebuild()
+
+
+VENDOR_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Backend configurado en `MARKETPLACE_SEARCH_BACKEND` (ruta de import) o,
+    si no hay, el correspondiente al motor de la base de datos.
+    """
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'MARKETPLACE_SEARCH_BACKEND', None)
+        if backend_path:
+            backend = import_string(backend_path)()
+        else:
+            backend = VENDOR_BACKENDS.get(connection.vendor, LikeSearchBackend)()
+        if not backend.is_available():
+            backend = LikeSearchBackend()
+        _backend = backend
+    return _backend
+
+
+def search_products(queryset, query):
+    """Atajo usado por las vistas"""
+    return get_search_backend().search(queryset, query)
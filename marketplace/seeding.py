@@ -0,0 +1,122 @@
+# === marketplace/seeding.py - Datos semilla idempotentes para el deploy ===
+#
+# build.sh corre `manage.py seed_products` en cada deploy. El checksum de los
+# archivos semilla (más SEED_VERSION) se guarda en SeedManifest:
+#   - Sin cambios: una sola consulta y listo.
+#   - Con cambios: se importan solo los productos nuevos (ProductImporter)
+#     sin tocar la red; sus imágenes quedan en PendingProductImage y las
+#     descarga después `manage.py fetch_product_images` (o la tarea Celery).
+
+import hashlib
+import logging
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .importer import ImageFetcher, ProductImporter, name_key
+from .models import PendingProductImage, SeedManifest
+
+logger = logging.getLogger(__name__)
+
+SEED_NAME = 'productos'
+SEED_VERSION = 1  # subir si cambia la forma de aplicar la semilla
+DEFAULT_SEED_FILES = [Path(settings.BASE_DIR) / 'scripts' / 'productos.jsonl']
+
+IMAGE_BATCH = 20
+MAX_IMAGE_ATTEMPTS = 5
+FETCH_LOCK_KEY = 'marketplace:image-fetch-lock'
+FETCH_LOCK_TTL = 10 * 60
+
+
+def manifest_checksum(paths):
+    """(checksum combinado, {archivo: sha256}) del contenido de los archivos semilla"""
+    combined = hashlib.sha256(f"seed-v{SEED_VERSION}".encode())
+    files = {}
+    for path in sorted(Path(p) for p in paths):
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        files[path.name] = digest
+        combined.update(f"{path.name}:{digest}".encode())
+    return combined.hexdigest(), files
+
+
+class DeferredImages:
+    """'Fetcher' para el importador que solo anota las descargas para después"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def fetch_many(self, jobs):
+        self.jobs.extend(jobs)
+        return {}
+
+
+def seed_products(paths=None, name=SEED_NAME, force=False):
+    """Aplica la semilla; devuelve las estadísticas o None si ya estaba aplicada"""
+    paths = paths or DEFAULT_SEED_FILES
+    checksum, files = manifest_checksum(paths)
+    if not force and SeedManifest.objects.filter(name=name, checksum=checksum).exists():
+        return None
+
+    deferred = DeferredImages()
+    importer = ProductImporter(only_new=True, fetcher=deferred)
+    for path in paths:
+        importer.run(path)
+
+    pending = [
+        PendingProductImage(product_id=importer.existing[name_key(product_name)], url=url)
+        for product_name, url in deferred.jobs
+        if importer.existing.get(name_key(product_name))
+    ]
+    PendingProductImage.objects.bulk_create(pending, ignore_conflicts=True)
+    SeedManifest.objects.update_or_create(name=name, defaults={'checksum': checksum, 'files': files})
+    if pending:
+        schedule_image_fetch()
+    return {**importer.stats, 'pending_images': len(pending)}
+
+
+def schedule_image_fetch():
+    """Encola la descarga si hay Celery; si no, la toma el proceso `images` del Procfile"""
+    if not getattr(settings, 'CELERY_BROKER_URL', None):
+        return
+    try:
+        from .tasks import fetch_product_images
+        fetch_product_images.delay()
+    except Exception as e:
+        logger.warning("No se pudo encolar la descarga de imágenes: %s", e)
+
+
+def fetch_pending_images(batch_size=IMAGE_BATCH, fetcher=None):
+    """Descarga un lote de imágenes pendientes; devuelve cuántas se guardaron"""
+    if not cache.add(FETCH_LOCK_KEY, 1, FETCH_LOCK_TTL):
+        return 0  # otro proceso está descargando
+    try:
+        pending = list(
+            PendingProductImage.objects.select_related('product')
+            .filter(attempts__lt=MAX_IMAGE_ATTEMPTS)
+            .order_by('attempts', 'created_at')[:batch_size]
+        )
+        if not pending:
+            return 0
+        fetcher = fetcher or ImageFetcher()
+        stored = fetcher.fetch_many([(item.product.name, item.url) for item in pending])
+
+        saved = 0
+        for item in pending:
+            image = stored.get(item.product.name)
+            if not image:
+                PendingProductImage.objects.filter(pk=item.pk).update(
+                    attempts=F('attempts') + 1, last_error="descarga fallida"
+                )
+                continue
+            product = item.product
+            product.image = image
+            # save() dispara las señales: variantes, autocompletado, snapshots
+            product.save(update_fields=['image', 'updated_at'])
+            item.delete()
+            saved += 1
+        logger.info("seed.images saved=%s failed=%s", saved, len(pending) - saved)
+        return saved
+    finally:
+        cache.delete(FETCH_LOCK_KEY)
@@ -0,0 +1,218 @@
+# === marketplace/shipping.py - Cotizador de envíos por código postal ===
+#
+# Las zonas (ShippingZone) son rangos de códigos postales con su opción de
+# envío (ShippingOption). Al construir el índice se normalizan los rangos y
+# se parten en segmentos disjuntos ordenados; cada segmento queda con la zona
+# más específica (el rango más angosto) que lo cubre. Así una zona amplia
+# como 'Interior' (1000-9999) puede convivir con 'CABA' y 'GBA' adentro, y
+# cotizar es un bisect sobre los inicios de segmento: O(log n).
+#
+# Los códigos se aceptan como CPA ('C1425ABC') o en el formato viejo de 4
+# dígitos ('1425'); se cotiza por los 4 dígitos.
+#
+# Actualización:
+#   - Señales post_save / post_delete de zonas y opciones (admin) en el propio
+#     proceso invalidan el índice de inmediato
+#   - Cada REFRESH_INTERVAL segundos se reconstruye igual, para tomar cambios
+#     hechos desde otros workers
+#
+# Cotización en lote (quote_many): los inicios y fines de segmento también se
+# guardan como arrays de numpy y miles de códigos se resuelven en una sola
+# pasada con numpy.searchsorted. Sin numpy se usa bisect código por código.
+
+import bisect
+import logging
+import re
+import threading
+import time
+from decimal import Decimal
+
+from .models import ShippingZone
+
+try:
+    import numpy as np
+except ImportError:  # quote_many cae a bisect por código
+    np = None
+
+logger = logging.getLogger(__name__)
+
+CPA_PATTERN = re.compile(r'^[A-Z]?(\d{4})[A-Z]{0,3}$')
+
+
+def normalize_postal_code(value):
+    """'C1425ABC', 'c 1425', '1425' -> 1425; None si no es un código válido"""
+    if isinstance(value, str) and len(value) == 4 and value.isdigit():
+        return int(value)  # caso más común, sin regex
+    code = re.sub(r'[\s.-]', '', str(value or '')).upper()
+    match = CPA_PATTERN.match(code)
+    return int(match.group(1)) if match else None
+
+
+class ShippingQuote:
+    """Resultado de una cotización (una zona con su opción de envío)"""
+
+    __slots__ = ('zone_id', 'zone', 'option', 'price', 'estimated_days', 'description', 'start', 'end')
+
+    def __init__(self, zone, start, end):
+        option = zone.shipping_option
+        self.zone_id = zone.id
+        self.zone = zone.name
+        self.option = option.name
+        self.price = Decimal(option.price)
+        self.estimated_days = option.estimated_days
+        self.description = option.description
+        self.start = start
+        self.end = end
+
+    @property
+    def width(self):
+        return self.end - self.start
+
+    def as_dict(self):
+        return {
+            'zone': self.zone,
+            'option': self.option,
+            'price': str(self.price),
+            'estimated_days': self.estimated_days,
+        }
+
+
+class ShippingZoneIndex:
+    REFRESH_INTERVAL = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._starts = []
+        self._segments = []  # (inicio, fin, ShippingQuote), disjuntos y ordenados
+        self._zones = []
+        self._arrays = None  # (inicios, fines) como arrays de numpy
+        self._built_at = 0.0
+        self.ready = False
+
+    # -------------------------------------------------------------------------
+    # Construcción
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _load_zones():
+        quotes = []
+        zones = ShippingZone.objects.select_related('shipping_option').filter(shipping_option__is_active=True)
+        for zone in zones:
+            start = normalize_postal_code(zone.postal_code_start)
+            end = normalize_postal_code(zone.postal_code_end)
+            if start is None or end is None or start > end:
+                logger.warning("Zona de envío con rango inválido: %s", zone)
+                continue
+            quotes.append(ShippingQuote(zone, start, end))
+        return quotes
+
+    @staticmethod
+    def _segments_for(quotes):
+        """Parte los rangos (que pueden solaparse) en segmentos disjuntos con la zona más específica"""
+        bounds = sorted({q.start for q in quotes} | {q.end + 1 for q in quotes})
+        by_start = sorted(quotes, key=lambda q: q.start)
+        segments = []
+        active = []
+        position = 0
+        for low, high in zip(bounds, bounds[1:]):
+            while position < len(by_start) and by_start[position].start <= low:
+                active.append(by_start[position])
+                position += 1
+            active = [q for q in active if q.end >= low]
+            if not active:
+                continue
+            best = min(active, key=lambda q: (q.width, q.price, q.zone_id))
+            if segments and segments[-1][2] is best and segments[-1][1] == low - 1:
+                segments[-1] = (segments[-1][0], high - 1, best)
+            else:
+                segments.append((low, high - 1, best))
+        return segments
+
+    def build(self):
+        started = time.perf_counter()
+        quotes = self._load_zones()
+        segments = self._segments_for(quotes)
+        with self._lock:
+            self._segments = segments
+            self._starts = [segment[0] for segment in segments]
+            if np is not None:
+                self._arrays = (
+                    np.array(self._starts, dtype=np.int32),
+                    np.array([segment[1] for segment in segments], dtype=np.int32),
+                )
+            self._zones = sorted(quotes, key=lambda q: (q.price, q.start))
+            self._built_at = time.monotonic()
+            self.ready = True
+        logger.info(
+            "Índice de envíos: %s zonas, %s segmentos en %.1f ms",
+            len(quotes), len(segments), (time.perf_counter() - started) * 1000,
+        )
+
+    def ensure_fresh(self):
+        if not self.ready or time.monotonic() - self._built_at > self.REFRESH_INTERVAL:
+            self.build()
+
+    def invalidate(self):
+        with self._lock:
+            self.ready = False
+
+    # -------------------------------------------------------------------------
+    # Consultas
+    # -------------------------------------------------------------------------
+
+    def quote(self, postal_code):
+        """ShippingQuote para el código, o None si es inválido o no hay zona que lo cubra"""
+        code = normalize_postal_code(postal_code)
+        if code is None:
+            return None
+        self.ensure_fresh()
+        with self._lock:
+            position = bisect.bisect_right(self._starts, code) - 1
+            if position < 0:
+                return None
+            start, end, quote = self._segments[position]
+        return quote if code <= end else None
+
+    def quote_many(self, postal_codes):
+        """
+        Cotiza muchos códigos en una pasada; devuelve una lista alineada con
+        la entrada con un ShippingQuote o None por código.
+        """
+        # En un lote los códigos se repiten mucho: se normaliza y busca cada uno una vez
+        unique = list(dict.fromkeys(postal_codes))
+        codes = [normalize_postal_code(code) for code in unique]
+        self.ensure_fresh()
+        with self._lock:
+            starts, segments, arrays = self._starts, self._segments, self._arrays
+        if not segments:
+            return [None] * len(postal_codes)
+
+        if arrays is None:
+            found = []
+            for code in codes:
+                position = bisect.bisect_right(starts, code) - 1 if code is not None else -1
+                hit = position >= 0 and code <= segments[position][1]
+                found.append(segments[position][2] if hit else None)
+        else:
+            start_array, end_array = arrays
+            values = np.fromiter((-1 if code is None else code for code in codes), dtype=np.int32, count=len(codes))
+            positions = np.searchsorted(start_array, values, side='right') - 1
+            safe = positions.clip(min=0)
+            hits = (values >= 0) & (positions >= 0) & (values <= end_array[safe])
+            found = [segments[position][2] if hit else None for position, hit in zip(safe.tolist(), hits.tolist())]
+
+        resolved = dict(zip(unique, found))
+        return [resolved[code] for code in postal_codes]
+
+    def zones(self):
+        """Zonas activas ordenadas por precio, una por nombre (para la página de envíos)"""
+        self.ensure_fresh()
+        with self._lock:
+            quotes = list(self._zones)
+        unique = {}
+        for quote in quotes:
+            unique.setdefault(quote.zone, quote)
+        return list(unique.values())
+
+
+shipping_index = ShippingZoneIndex()
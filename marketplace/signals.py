@@ -0,0 +1,55 @@
+# === marketplace/signals.py - Sincronización de cachés en memoria ===
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .autocomplete import autocomplete_index
+from .cart_store import get_cart_store_class
+from .catalog_cache import bump_catalog_generation
+from .images import refresh_product_renditions
+from .models import Product, ShippingOption, ShippingZone
+from .search import SQLiteSearchBackend
+from .shipping import shipping_index
+from .snapshots import invalidate_product
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    """Actualiza variantes de imagen, índice de autocompletado, snapshots del carrito y páginas cacheadas"""
+    refresh_product_renditions(instance)
+    autocomplete_index.upsert(instance)
+    invalidate_product(instance.id)
+    bump_catalog_generation()
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    autocomplete_index.remove(instance.id)
+    invalidate_product(instance.id)
+    bump_catalog_generation()
+
+
+@receiver(post_migrate)
+def sync_search_index(sender, app_config=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Reinstala los triggers del índice FTS de SQLite si una migración recreó la tabla de productos"""
+    if app_config is None or app_config.name != 'marketplace' or using != DEFAULT_DB_ALIAS \
+            or connection.vendor != 'sqlite':
+        return
+    backend = SQLiteSearchBackend()
+    if backend.is_available():
+        backend.sync()
+
+
+@receiver([post_save, post_delete], sender=ShippingZone)
+@receiver([post_save, post_delete], sender=ShippingOption)
+def shipping_changed(sender, **kwargs):
+    """Zonas u opciones editadas desde el admin: el cotizador se reconstruye en la próxima consulta"""
+    shipping_index.invalidate()
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Fusiona el carrito anónimo con el carrito guardado del usuario"""
+    get_cart_store_class().merge_on_login(request, user)
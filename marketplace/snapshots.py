@@ -0,0 +1,131 @@
+# === marketplace/snapshots.py - Snapshots de productos para el carrito ===
+#
+# Cache de proceso con los datos que el carrito muestra (nombre, precio,
+# stock, URL de imagen). Cada entrada guarda la versión del producto con la
+# que se creó; las versiones viven en el cache de Django y se renuevan en
+# cada save/delete, así un cambio hecho en otro worker invalida la copia
+# local en cuanto el cache es compartido. SNAPSHOT_TTL acota lo que pueda
+# escaparse a las señales (p. ej. queryset.update()). El cache es LRU con a lo
+# sumo SNAPSHOT_MAX_ENTRIES productos: un catálogo grande no crece sin límite
+# en cada worker.
+
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from .images import renditions_for
+from .models import Product
+
+SNAPSHOT_TTL = 300
+SNAPSHOT_MAX_ENTRIES = 2000
+VERSION_KEY = 'marketplace:product-version:{}'
+
+_snapshots = OrderedDict()  # id -> (versión, vence, snapshot), del menos al más usado
+_lock = threading.Lock()
+
+
+class SnapshotImage:
+    """Imita lo que las plantillas usan de un ImageField: `name`, `url` y su valor de verdad"""
+
+    __slots__ = ('name', 'url')
+
+    def __init__(self, url, name=''):
+        self.url = url
+        self.name = name
+
+    def __bool__(self):
+        return bool(self.url)
+
+    def __str__(self):
+        return self.url or ''
+
+
+class ProductSnapshot:
+    """Vista inmutable y liviana de un producto"""
+
+    __slots__ = ('id', 'pk', 'name', 'price', 'stock', 'available', 'category', 'image', 'image_renditions')
+
+    def __init__(self, product):
+        self.id = self.pk = product.id
+        self.name = product.name
+        self.price = Decimal(str(product.price))
+        self.stock = product.stock
+        self.available = product.available
+        self.category = product.category
+        self.image = SnapshotImage(product.image.url if product.image else '', product.image.name or '')
+        self.image_renditions = renditions_for(product)
+
+    def is_in_stock(self):
+        return self.stock > 0 and self.available
+
+    def __str__(self):
+        return f"{self.name} - ${self.price}"
+
+
+def _versions(product_ids):
+    keys = {pid: VERSION_KEY.format(pid) for pid in product_ids}
+    found = cache.get_many(list(keys.values()))
+    return {pid: found.get(key, 0) for pid, key in keys.items()}
+
+
+def get_snapshots(product_ids):
+    """
+    Devuelve {id: ProductSnapshot} para los ids pedidos.
+    Solo consulta la base por los que faltan, vencieron o cambiaron de versión.
+    """
+    product_ids = {int(pid) for pid in product_ids}
+    if not product_ids:
+        return {}
+
+    versions = _versions(product_ids)
+    now = time.monotonic()
+    result = {}
+    missing = []
+    with _lock:
+        for pid in product_ids:
+            cached = _snapshots.get(pid)
+            if cached and cached[0] == versions[pid] and cached[1] > now:
+                _snapshots.move_to_end(pid)
+                result[pid] = cached[2]
+            else:
+                # Vencida o de otra versión: se descarta ya, no al llenarse el cache
+                _snapshots.pop(pid, None)
+                missing.append(pid)
+
+    if missing:
+        expires = now + SNAPSHOT_TTL
+        fresh = {product.id: ProductSnapshot(product) for product in Product.objects.filter(id__in=missing)}
+        with _lock:
+            for pid, snapshot in fresh.items():
+                _snapshots[pid] = (versions[pid], expires, snapshot)
+                _snapshots.move_to_end(pid)
+            while len(_snapshots) > SNAPSHOT_MAX_ENTRIES:
+                _snapshots.popitem(last=False)
+        result.update(fresh)
+
+    return result
+
+
+def invalidate_product(product_id):
+    """Renueva la versión del producto (llamar tras cambios de precio/stock)"""
+    cache.set(VERSION_KEY.format(product_id), time.time_ns(), None)
+    with _lock:
+        _snapshots.pop(product_id, None)
+
+
+def invalidate_products(product_ids):
+    """Versión en lote de invalidate_product (un solo set_many al cache)"""
+    product_ids = [int(pid) for pid in product_ids]
+    version = time.time_ns()
+    cache.set_many({VERSION_KEY.format(pid): version for pid in product_ids}, None)
+    with _lock:
+        for pid in product_ids:
+            _snapshots.pop(pid, None)
+
+
+def clear_snapshots():
+    with _lock:
+        _snapshots.clear()
@@ -0,0 +1,30 @@
+# === marketplace/tasks.py - Tareas Celery ===
+
+from celery import shared_task
+
+from . import cart_store
+from .seeding import fetch_pending_images
+from .webhooks import drain
+
+
+@shared_task
+def process_payment_events():
+    """Procesa la bandeja de notificaciones de MercadoPago"""
+    return drain()
+
+
+@shared_task
+def fetch_product_images():
+    """Descarga todas las imágenes pendientes de la semilla, por lotes"""
+    total = 0
+    saved = fetch_pending_images()
+    while saved:
+        total += saved
+        saved = fetch_pending_images()
+    return total
+
+
+@shared_task
+def purge_anonymous_carts():
+    """Borra los carritos anónimos abandonados"""
+    return cart_store.purge_anonymous_carts()
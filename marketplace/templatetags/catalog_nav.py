@@ -0,0 +1,35 @@
+# === marketplace/templatetags/catalog_nav.py - Navegación de categorías del catálogo ===
+#
+#   {% load cache catalog_nav %}
+#   {% cache catalog_cache_timeout category_nav 'desktop' catalog_generation %}
+#     {% category_nav_items as categories %} ...
+#   {% endcache %}
+#
+# Una consulta agregada por render; dentro de {% cache %} solo corre cuando
+# cambia la generación del catálogo.
+
+from django import template
+from django.db.models import Count
+
+from marketplace.models import Product
+
+register = template.Library()
+
+CATEGORY_ICONS = {
+    'teclados': 'fa-keyboard',
+    'mouses': 'fa-mouse',
+    'auriculares': 'fa-headset',
+    'monitores': 'fa-desktop',
+}
+
+
+@register.simple_tag
+def category_nav_items():
+    """[{'value', 'label', 'icon', 'count'}] en el orden de CATEGORY_CHOICES"""
+    counts = dict(
+        Product.objects.filter(available=True).values_list('category').annotate(total=Count('id')).order_by()
+    )
+    return [
+        {'value': value, 'label': label, 'icon': CATEGORY_ICONS.get(value, 'fa-tag'), 'count': counts.get(value, 0)}
+        for value, label in Product.CATEGORY_CHOICES
+    ]
@@ -0,0 +1,40 @@
+# === marketplace/templatetags/product_images.py - <img> responsive para productos ===
+#
+#   {% load product_images %}
+#   {% product_image product 'card' class='product-img' %}
+#   {% product_image product 'detail' lazy=False %}   (imagen principal: carga inmediata)
+#   {% rendition_url product 'thumb' %}
+
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from marketplace.images import rendition_src, renditions_for
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_image(product, size='card', lazy=True, alt=None, **attrs):
+    """<img> con src/srcset/sizes de la variante `size` ('' si no hay imagen)"""
+    rendition = renditions_for(product).get(size)
+    if not rendition:
+        return ''
+    if lazy:
+        attrs.setdefault('loading', 'lazy')
+    else:
+        attrs.setdefault('fetchpriority', 'high')
+    attrs.setdefault('decoding', 'async')
+    sizes = attrs.pop('sizes', rendition['sizes'])
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}>',
+        rendition['src'],
+        rendition['srcset'],
+        sizes,
+        product.name if alt is None else alt,
+        format_html_join('', ' {}="{}"', sorted(attrs.items())),
+    )
+
+
+@register.simple_tag
+def rendition_url(product, size='card'):
+    return rendition_src(product, size)
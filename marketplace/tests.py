@@ -1,3 +1,1489 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.template import Context, Template
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import snapshots
+from .admin import OrderAdmin
+from .autocomplete import AutocompleteIndex
+from .cart_store import CART_TOKEN_SESSION_KEY, DatabaseCartStore, purge_anonymous_carts
+from .images import CloudinaryRenditions
+from .importer import Checkpoint, ImageFetcher, ProductImporter
+from .inventory import (
+    InsufficientStock, confirm_order, refund_order, release_expired_reservations, release_order, reserve_order,
+)
+from .models import CartLine, DailySales, Order, OrderItem, PaymentEvent, PendingProductImage, Product, ShippingOption
+from .pagination import InvalidCursor, KeysetPaginator
+from .payments import PREFERENCE_KEY, PreferenceInProgress, acached_preference
+from .ratelimit import CacheBucketStore, LocalBucketStore, get_store
+from .sales import rebuild_daily_sales
+from .search import (
+    LikeSearchBackend, PostgresSearchBackend, SQLiteSearchBackend, get_search_backend, search_products, tokenize,
+)
+from .seeding import fetch_pending_images, seed_products
+from .shipping import normalize_postal_code, shipping_index
+from .snapshots import SNAPSHOT_TTL, clear_snapshots, get_snapshots, invalidate_products
+from .webhooks import MAX_ATTEMPTS, PROCESSING_TIMEOUT, process_pending_events
+
+
+# =============================================================================
+# SERVIDOR FALSO DE MERCADOPAGO
+# =============================================================================
+
+class FakeMercadoPago:
+    """API mínima de MercadoPago (pagos y preferencias) en un hilo local"""
+
+    def __init__(self):
+        self.payments = {}
+        self.requests = []
+        self.preferences = []
+        self.failures = 0  # próximas respuestas 503
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def reply(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                fake.requests.append(self.path)
+                payment_id = self.path.rstrip('/').rsplit('/', 1)[-1]
+                payment = fake.payments.get(payment_id)
+                self.reply(200 if payment else 404, payment or {'message': 'not found'})
+
+            def do_POST(self):
+                fake.requests.append(self.path)
+                data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if fake.failures:
+                    fake.failures -= 1
+                    return self.reply(503, {'message': 'unavailable'})
+                key = self.headers.get('X-Idempotency-Key')
+                # Como MercadoPago: la misma clave devuelve el recurso ya creado
+                known = [n for n, (seen, _) in enumerate(fake.preferences, 1) if key and seen == key]
+                if not known:
+                    fake.preferences.append((key, data))
+                preference_id = f'pref-{known[0] if known else len(fake.preferences)}'
+                self.reply(201, {
+                    'id': preference_id,
+                    'init_point': f'https://mercadopago.test/checkout/{preference_id}',
+                })
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s' % self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeCart(list):
+    """Iterable con la forma de los ítems de Cart"""
+
+    def __init__(self, *lines):
+        super().__init__(
+            {'product': product, 'quantity': quantity, 'price': product.price,
+             'total_price': product.price * quantity}
+            for product, quantity in lines
+        )
+
+
+CUSTOMER = {
+    'first_name': 'Ana', 'last_name': 'Pérez', 'email': 'ana@example.com',
+    'address': 'Calle 123', 'city': 'CABA', 'phone': '1122334455',
+}
+
+
+class FakeMercadoPagoMixin:
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.mercadopago = FakeMercadoPago()
+        cls.mercadopago.start()
+        cls.settings_override = override_settings(
+            MERCADOPAGO_API_BASE=cls.mercadopago.url,
+            MERCADOPAGO_ACCESS_TOKEN='TEST-token',
+            CELERY_BROKER_URL=None,
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.mercadopago.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.mercadopago.payments.clear()
+        self.mercadopago.requests.clear()
+        self.mercadopago.preferences.clear()
+        self.mercadopago.failures = 0
+        self.product = Product.objects.create(
+            name='Teclado Redragon Kumara', description='Mecánico', category='teclados',
+            price=Decimal('45000.00'), stock=5,
+        )
+
+
+class PaymentWebhookTests(FakeMercadoPagoMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.order = reserve_order(FakeCart((self.product, 2)), CUSTOMER)
+
+    def notify(self, payment_id, notification_id='1001', action='payment.updated'):
+        return self.client.post(
+            reverse('payment_webhook'),
+            data=json.dumps({
+                'id': notification_id, 'type': 'payment', 'action': action,
+                'data': {'id': str(payment_id)},
+            }),
+            content_type='application/json',
+            secure=True,
+        )
+
+    def add_payment(self, payment_id, status):
+        self.mercadopago.payments[str(payment_id)] = {
+            'id': payment_id, 'status': status,
+            'external_reference': f'masivotech_{self.order.id}',
+        }
+
+    def test_webhook_responds_immediately_and_dedupes(self):
+        first = self.notify(555)
+        second = self.notify(555)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+        # El webhook no consulta la API: eso queda para el worker
+        self.assertEqual(self.mercadopago.requests, [])
+
+    def test_unhandled_topics_are_not_left_pending(self):
+        response = self.client.post(
+            reverse('payment_webhook'),
+            data=json.dumps({'id': '2001', 'type': 'merchant_order', 'data': {'id': '42'}}),
+            content_type='application/json',
+            secure=True,
+        )
+
+        self.assertEqual(response.status_code, 200)
+        event = PaymentEvent.objects.get()
+        self.assertEqual((event.topic, event.status), ('merchant_order', 'done'))
+        self.assertIsNotNone(event.processed_at)
+        self.assertFalse(PaymentEvent.objects.filter(status='pending').exists())
+        self.assertEqual(process_pending_events(), 0)
+
+    def test_approved_payment_confirms_order(self):
+        self.add_payment(555, 'approved')
+        self.notify(555, notification_id='1')
+        self.notify(555, notification_id='2', action='payment.created')
+
+        self.assertEqual(process_pending_events(), 2)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertEqual(self.order.mercadopago_id, '555')
+        # Un solo GET por pago aunque llegaran dos notificaciones
+        self.assertEqual(self.mercadopago.requests, ['/v1/payments/555'])
+        self.assertEqual(PaymentEvent.objects.filter(status='done').count(), 2)
+
+    def test_rejected_payment_releases_stock(self):
+        self.add_payment(777, 'rejected')
+        self.notify(777)
+
+        process_pending_events()
+
+        self.order.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.order.status, 'cancelled')
+        self.assertEqual(self.product.stock, 5)
+
+    def test_unreachable_payment_is_retried(self):
+        self.notify(999)
+
+        process_pending_events()
+
+        event = PaymentEvent.objects.get()
+        self.assertEqual(event.status, 'pending')
+        self.assertEqual(event.attempts, 1)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+
+    def test_failed_event_waits_for_backoff_before_retrying(self):
+        self.notify(999)
+        process_pending_events()
+        event = PaymentEvent.objects.get()
+        self.assertGreater(event.next_attempt_at, timezone.now())
+
+        # Dentro de la espera no se reclama
+        self.assertEqual(process_pending_events(), 0)
+
+        first_delay = event.next_attempt_at - event.processed_at
+        PaymentEvent.objects.update(next_attempt_at=timezone.now())
+        self.add_payment(999, 'approved')
+        self.assertEqual(process_pending_events(), 1)
+
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'done')
+        self.assertEqual(event.attempts, 2)
+        self.assertIsNone(event.next_attempt_at)
+        self.assertGreater(first_delay, timedelta(seconds=30))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+
+    def test_backoff_grows_until_attempts_are_exhausted(self):
+        self.notify(999)
+        delays = []
+        for _ in range(MAX_ATTEMPTS):
+            PaymentEvent.objects.update(next_attempt_at=None)
+            self.assertEqual(process_pending_events(), 1)
+            event = PaymentEvent.objects.get()
+            if event.next_attempt_at:
+                delays.append(event.next_attempt_at - event.processed_at)
+
+        self.assertEqual(event.status, 'failed')
+        self.assertEqual(event.attempts, MAX_ATTEMPTS)
+        self.assertEqual(len(delays), MAX_ATTEMPTS - 1)
+        self.assertEqual(delays, sorted(delays))
+        self.assertGreater(delays[-1], delays[0] * 4)
+        # Agotado: no se vuelve a reclamar
+        PaymentEvent.objects.update(next_attempt_at=None)
+        self.assertEqual(process_pending_events(), 0)
+
+    def test_stale_processing_event_is_reclaimed(self):
+        self.add_payment(555, 'approved')
+        self.notify(555)
+        # Un worker lo reclamó y murió
+        PaymentEvent.objects.update(status='processing', attempts=1, processed_at=timezone.now())
+        self.assertEqual(process_pending_events(), 0)
+
+        PaymentEvent.objects.update(processed_at=timezone.now() - PROCESSING_TIMEOUT - timedelta(seconds=1))
+        self.assertEqual(process_pending_events(), 1)
+
+        event = PaymentEvent.objects.get()
+        self.assertEqual(event.status, 'done')
+        self.assertEqual(event.attempts, 2)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+
+
+class CheckoutPreferenceTests(FakeMercadoPagoMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.post(reverse('add_to_cart', args=[self.product.id]), {'quantity': 2}, secure=True)
+
+    def checkout(self):
+        return self.client.post(reverse('create_payment'), data='{}',
+                                content_type='application/json', secure=True)
+
+    def test_double_click_reuses_preference_and_reservation(self):
+        first = self.checkout()
+        second = self.checkout()
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['id'], second.json()['id'])
+        self.assertEqual(len(self.mercadopago.preferences), 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+
+    def test_changed_cart_releases_previous_reservation(self):
+        self.checkout()
+        self.client.post(reverse('add_to_cart', args=[self.product.id]), {'quantity': 1}, secure=True)
+        self.checkout()
+
+        self.assertEqual(len(self.mercadopago.preferences), 2)
+        self.assertEqual(list(Order.objects.order_by('id').values_list('status', flat=True)),
+                         ['cancelled', 'pending'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+
+    def test_retry_after_expired_reservation_gets_a_new_preference(self):
+        first = self.checkout().json()
+        Order.objects.update(reserved_until=timezone.now() - timedelta(minutes=1))
+        release_expired_reservations()
+
+        second = self.checkout().json()
+
+        self.assertNotEqual(first['id'], second['id'])
+        self.assertEqual(len(self.mercadopago.preferences), 2)
+        self.assertNotEqual(self.mercadopago.preferences[0][0], self.mercadopago.preferences[1][0])
+        latest = Order.objects.latest('id')
+        self.assertEqual(latest.status, 'pending')
+        self.assertEqual(self.mercadopago.preferences[1][1]['external_reference'], f'masivotech_{latest.id}')
+
+    def test_transient_errors_are_retried_with_same_idempotency_key(self):
+        self.mercadopago.failures = 1
+
+        response = self.checkout()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.mercadopago.requests, ['/checkout/preferences', '/checkout/preferences'])
+        self.assertIsNotNone(self.mercadopago.preferences[0][0])
+
+
+class PreferenceLockTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.lock_key = PREFERENCE_KEY.format('carrito') + ':lock'
+
+    async def never_valid(self, cached):
+        return False
+
+    def test_busy_lock_fails_instead_of_creating(self):
+        cache.set(self.lock_key, 'otra-request', 30)
+        created = []
+
+        async def create():
+            created.append(1)
+            return {'id': 'pref'}
+
+        with mock.patch('marketplace.payments.PREFERENCE_LOCK_WAIT', 0.15):
+            with self.assertRaises(PreferenceInProgress):
+                async_to_sync(acached_preference)('carrito', create, self.never_valid, timeout=60)
+
+        self.assertEqual(created, [])
+        self.assertEqual(cache.get(self.lock_key), 'otra-request')
+
+    def test_lock_taken_over_after_expiry_is_not_released(self):
+        async def slow_create():
+            # El lock venció durante create() y lo tomó otra request
+            await cache.aset(self.lock_key, 'otra-request', 30)
+            return {'id': 'pref'}
+
+        preference = async_to_sync(acached_preference)('carrito', slow_create, self.never_valid, timeout=60)
+
+        self.assertEqual(preference, {'id': 'pref'})
+        self.assertEqual(cache.get(self.lock_key), 'otra-request')
+
+    def test_own_lock_is_released(self):
+        async def create():
+            return {'id': 'pref'}
+
+        async_to_sync(acached_preference)('carrito', create, self.never_valid, timeout=60)
+
+        self.assertIsNone(cache.get(self.lock_key))
+
+
+# =============================================================================
+# RESERVAS DE STOCK
+# =============================================================================
+
+class StockReservationTests(TestCase):
+
+    def setUp(self):
+        self.keyboard = Product.objects.create(name='Teclado Redragon Kumara', description='', category='teclados',
+                                               price=Decimal('45000.00'), stock=5)
+        self.mouse = Product.objects.create(name='Mouse Logitech G203', description='', category='mouses',
+                                            price=Decimal('18000.00'), stock=2)
+
+    def stock(self, product):
+        return Product.objects.values_list('stock', flat=True).get(id=product.id)
+
+    def test_reserve_takes_stock_in_one_conditional_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            order = reserve_order(FakeCart((self.keyboard, 3), (self.mouse, 2)), CUSTOMER)
+
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "marketplace_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"stock" >= (CASE', updates[0])
+        self.assertEqual((self.stock(self.keyboard), self.stock(self.mouse)), (2, 0))
+        self.assertEqual(order.status, 'pending')
+        self.assertIsNotNone(order.reserved_until)
+
+    def test_concurrent_checkout_cannot_oversell(self):
+        # Dos compradores armaron el carrito viendo stock 5; la condición la evalúa la base
+        first, second = Product.objects.get(id=self.keyboard.id), Product.objects.get(id=self.keyboard.id)
+        reserve_order(FakeCart((first, 3)), CUSTOMER)
+
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_order(FakeCart((second, 3)), CUSTOMER)
+
+        self.assertEqual([p.id for p in raised.exception.products], [self.keyboard.id])
+        self.assertEqual(self.stock(self.keyboard), 2)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_short_line_rolls_back_the_whole_order(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_order(FakeCart((self.keyboard, 1), (self.mouse, 3)), CUSTOMER)
+
+        self.assertEqual([p.id for p in raised.exception.products], [self.mouse.id])
+        self.assertEqual((self.stock(self.keyboard), self.stock(self.mouse)), (5, 2))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_cancel_returns_stock_once(self):
+        order = reserve_order(FakeCart((self.keyboard, 3)), CUSTOMER)
+
+        self.assertTrue(release_order(order.id))
+        self.assertFalse(release_order(order.id))
+        self.assertEqual(self.stock(self.keyboard), 5)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+        self.assertIsNone(order.reserved_until)
+
+    def test_failed_payment_page_releases_the_session_order(self):
+        order = reserve_order(FakeCart((self.keyboard, 3)), CUSTOMER)
+        session = self.client.session
+        session['pending_order_id'] = order.id
+        session.save()
+
+        self.client.get(reverse('payment_failure'), secure=True)
+
+        self.assertEqual(self.stock(self.keyboard), 5)
+        self.assertNotIn('pending_order_id', self.client.session)
+
+    def test_sweep_releases_only_expired_reservations(self):
+        expired = reserve_order(FakeCart((self.keyboard, 3)), CUSTOMER)
+        fresh = reserve_order(FakeCart((self.mouse, 1)), CUSTOMER)
+        Order.objects.filter(id=expired.id).update(reserved_until=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(release_expired_reservations(batch_size=1), 1)
+
+        self.assertEqual((self.stock(self.keyboard), self.stock(self.mouse)), (5, 1))
+        self.assertEqual(Order.objects.get(id=fresh.id).status, 'pending')
+
+    def test_late_payment_retakes_released_stock(self):
+        order = reserve_order(FakeCart((self.keyboard, 3)), CUSTOMER)
+        release_order(order.id)
+
+        confirm_order(order.id, payment_id=99)
+        self.assertEqual(self.stock(self.keyboard), 2)
+
+        # Si mientras tanto se vendió, el pago tardío no puede dejar stock negativo
+        other = reserve_order(FakeCart((self.mouse, 2)), CUSTOMER)
+        release_order(other.id)
+        reserve_order(FakeCart((self.mouse, 2)), CUSTOMER)
+        with self.assertRaises(InsufficientStock):
+            confirm_order(other.id, payment_id=100)
+        self.assertEqual(self.stock(self.mouse), 0)
+
+
+# =============================================================================
+# CARRITO EN LA BASE
+# =============================================================================
+
+@override_settings(CART_STORE='marketplace.cart_store.DatabaseCartStore')
+class DatabaseCartStoreTests(TestCase):
+
+    def setUp(self):
+        self.keyboard = Product.objects.create(name='Teclado Redragon Kumara', description='', category='teclados',
+                                               price=Decimal('45000.00'), stock=5)
+        self.mouse = Product.objects.create(name='Mouse Logitech G203', description='', category='mouses',
+                                            price=Decimal('25000.00'), stock=2)
+        self.user = get_user_model().objects.create_user(email='ana@example.com', username='ana', password='x')
+
+    def request(self, user=None, session=None):
+        request = RequestFactory().get('/')
+        request.session = session or SessionStore()
+        request.user = user or AnonymousUser()
+        return request
+
+    def test_add_is_capped_by_stock_and_refreshes_updated_at(self):
+        store = DatabaseCartStore(self.request())
+        store.add(self.mouse, 1, limit=self.mouse.stock)
+        CartLine.objects.update(updated_at=timezone.now() - timedelta(days=3))
+
+        line = store.add(self.mouse, 5, limit=self.mouse.stock)
+
+        self.assertEqual(line, {'quantity': 2, 'price': '25000.00'})
+        self.assertGreater(CartLine.objects.get().updated_at, timezone.now() - timedelta(minutes=1))
+
+    def test_set_load_and_remove(self):
+        request = self.request()
+        store = DatabaseCartStore(request)
+        self.assertEqual(store.load(), {})
+        # Leer un carrito vacío no crea token en la sesión
+        self.assertNotIn(CART_TOKEN_SESSION_KEY, request.session)
+
+        store.add(self.keyboard, 1, limit=5)
+        store.add(self.mouse, 1, limit=2)
+        CartLine.objects.update(updated_at=timezone.now() - timedelta(days=3))
+        self.assertEqual(store.set(self.keyboard, 3), {'quantity': 3, 'price': '45000.00'})
+        self.assertGreater(CartLine.objects.get(product=self.keyboard).updated_at,
+                           timezone.now() - timedelta(minutes=1))
+        store.remove(self.mouse.id)
+
+        self.assertEqual(DatabaseCartStore(request).load(), {str(self.keyboard.id): {'quantity': 3, 'price': '45000.00'}})
+        self.assertIsNone(store.set(self.keyboard, 0))
+        self.assertEqual(DatabaseCartStore(request).load(), {})
+
+    def test_session_cart_is_adopted_on_first_use(self):
+        # Carrito que dejó SessionCartStore antes del cambio de store
+        request = self.request()
+        request.session[settings.CART_SESSION_ID] = {
+            str(self.keyboard.id): {'quantity': 2, 'price': '44000.00'},
+            str(self.mouse.id): {'quantity': 9, 'price': '25000.00'},
+            '999999': {'quantity': 1, 'price': '1.00'},
+        }
+
+        cart = DatabaseCartStore(request).load()
+
+        self.assertEqual(cart, {
+            str(self.keyboard.id): {'quantity': 2, 'price': '44000.00'},
+            str(self.mouse.id): {'quantity': 2, 'price': '25000.00'},
+        })
+        self.assertNotIn(settings.CART_SESSION_ID, request.session)
+        self.assertEqual(DatabaseCartStore(request).load(), cart)
+
+    def test_merge_on_login(self):
+        session = SessionStore()
+        anonymous = DatabaseCartStore(self.request(session=session))
+        anonymous.add(self.keyboard, 2, limit=5)
+        anonymous.add(self.mouse, 2, limit=2)
+        DatabaseCartStore(self.request(user=self.user)).add(self.mouse, 1, limit=2)
+
+        DatabaseCartStore.merge_on_login(self.request(session=session), self.user)
+
+        self.assertEqual(DatabaseCartStore(self.request(user=self.user)).load(), {
+            str(self.keyboard.id): {'quantity': 2, 'price': '45000.00'},
+            str(self.mouse.id): {'quantity': 2, 'price': '25000.00'},
+        })
+        self.assertFalse(CartLine.objects.filter(cart_key__startswith='anon:').exists())
+        self.assertNotIn(CART_TOKEN_SESSION_KEY, session)
+
+    def test_purge_removes_only_abandoned_anonymous_carts(self):
+        old = timezone.now() - timedelta(days=30)
+        abandoned = DatabaseCartStore(self.request())
+        abandoned.add(self.keyboard, 1, limit=5)
+        abandoned.add(self.mouse, 1, limit=2)
+        active = DatabaseCartStore(self.request())
+        active.add(self.keyboard, 1, limit=5)
+        DatabaseCartStore(self.request(user=self.user)).add(self.keyboard, 1, limit=5)
+        CartLine.objects.update(updated_at=old)
+        # Un carrito con una línea reciente se conserva entero
+        active.add(self.mouse, 1, limit=2)
+
+        self.assertEqual(purge_anonymous_carts(batch_size=1), 2)
+
+        self.assertEqual(sorted(CartLine.objects.values_list('cart_key', flat=True)),
+                         sorted([active.cart_key(), active.cart_key(), 'user:%s' % self.user.pk]))
+
+
+class ProductSnapshotTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        clear_snapshots()
+        self.products = [
+            Product.objects.create(name=f'Mouse {n}', description='', category='mouses',
+                                   price=Decimal('1000.00'), stock=5)
+            for n in range(4)
+        ]
+        self.ids = [product.id for product in self.products]
+
+    def tearDown(self):
+        clear_snapshots()
+
+    def test_cache_is_bounded_and_keeps_recently_used(self):
+        with mock.patch('marketplace.snapshots.SNAPSHOT_MAX_ENTRIES', 2):
+            get_snapshots(self.ids[:2])
+            get_snapshots(self.ids[:1])  # el primero pasa a ser el más reciente
+            get_snapshots(self.ids[2:3])
+
+            self.assertEqual(list(snapshots._snapshots), [self.ids[0], self.ids[2]])
+            with self.assertNumQueries(0):
+                get_snapshots([self.ids[0], self.ids[2]])
+            with self.assertNumQueries(1):
+                get_snapshots(self.ids[1:2])
+
+    def test_expired_and_outdated_entries_are_evicted(self):
+        get_snapshots(self.ids)
+
+        with mock.patch('marketplace.snapshots.time.monotonic', return_value=time.monotonic() + SNAPSHOT_TTL + 1):
+            Product.objects.filter(id=self.ids[0]).delete()
+            get_snapshots(self.ids[:1])
+        self.assertNotIn(self.ids[0], snapshots._snapshots)
+
+        Product.objects.filter(id=self.ids[1]).update(price=Decimal('900.00'))
+        invalidate_products([self.ids[1]])
+        self.assertEqual(get_snapshots(self.ids[1:2])[self.ids[1]].price, Decimal('900.00'))
+
+
+# =============================================================================
+# PAGINACIÓN POR CURSOR
+# =============================================================================
+
+class KeysetPaginatorTests(TestCase):
+
+    def setUp(self):
+        # Precios repetidos: el orden depende del desempate por id
+        self.products = [
+            Product.objects.create(name=f'Auricular {n:02d}', description='', category='auriculares',
+                                   price=Decimal(1000 + (n // 3) * 100), stock=n % 4)
+            for n in range(11)
+        ]
+
+    def walk(self, paginator):
+        """Recorre todas las páginas con cursores 'next' y luego vuelve con 'prev'"""
+        pages = [paginator.page(1)]
+        while pages[-1].has_next():
+            pages.append(paginator.page(cursor=pages[-1].next_cursor))
+        back = [pages[-1]]
+        while back[-1].has_previous():
+            back.append(paginator.page(cursor=back[-1].previous_cursor))
+        return [[p.id for p in page] for page in pages], [[p.id for p in page] for page in reversed(back)]
+
+    def test_cursor_round_trip_with_ties(self):
+        for sort_by in ('price_low', 'price_high', 'name', 'newest'):
+            paginator = KeysetPaginator(Product.objects.all(), sort_by=sort_by, per_page=2, numbered_pages=1)
+            expected = list(paginator.queryset.values_list('id', flat=True))
+
+            forward, backward = self.walk(paginator)
+
+            self.assertEqual(sum(forward, []), expected, sort_by)
+            self.assertEqual(backward, forward, sort_by)
+            self.assertEqual([len(page) for page in forward], [2, 2, 2, 2, 2, 1])
+
+    def test_relevance_pages_by_offset(self):
+        ranked = Product.objects.annotate(search_rank=Cast('stock', FloatField()) / 3)
+        paginator = KeysetPaginator(ranked, sort_by='relevance', per_page=3, numbered_pages=1)
+        expected = list(paginator.queryset.values_list('id', flat=True))
+
+        forward, backward = self.walk(paginator)
+
+        self.assertEqual(sum(forward, []), expected)
+        self.assertEqual(backward, forward)
+        cursor = paginator.page(1).next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            paginator.page(cursor=cursor)
+        # Sin comparar floats: la página sale por OFFSET
+        self.assertIn('OFFSET 3', queries[0]['sql'])
+
+    def test_relevance_depth_is_bounded_by_count_limit(self):
+        ranked = Product.objects.annotate(search_rank=Cast('stock', FloatField()) / 3)
+        paginator = KeysetPaginator(ranked, sort_by='relevance', per_page=3, numbered_pages=1, count_limit=7)
+        expected = list(paginator.queryset.values_list('id', flat=True))
+
+        forward, _ = self.walk(paginator)
+
+        # 11 resultados, pero solo los primeros 7 tienen página
+        self.assertEqual(sum(forward, []), expected[:7])
+        self.assertEqual([len(page) for page in forward], [3, 3, 1])
+        deep = paginator.encode_cursor(None, 'next', 40, offset=120)
+        with self.assertRaises(InvalidCursor):
+            paginator.decode_cursor(deep)
+        with CaptureQueriesContext(connection) as queries:
+            page = paginator.page(cursor=deep)
+        self.assertEqual((page.number, [p.id for p in page]), (1, expected[:3]))
+        self.assertNotIn('OFFSET 120', queries[-1]['sql'])
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        paginator = KeysetPaginator(Product.objects.all(), sort_by='price_low', per_page=2, numbered_pages=1)
+        first = [p.id for p in paginator.page(1)]
+        cursor = paginator.page(1).next_cursor
+        other_sort = KeysetPaginator(Product.objects.all(), sort_by='name', per_page=2, numbered_pages=1)
+
+        for token in (cursor[:-2] + 'xx', 'basura', other_sort.page(1).next_cursor):
+            with self.assertRaises(InvalidCursor):
+                paginator.decode_cursor(token)
+            self.assertEqual([p.id for p in paginator.page(cursor=token)], first)
+
+
+# =============================================================================
+# AUTOCOMPLETADO
+# =============================================================================
+
+class AutocompleteTests(TestCase):
+
+    def setUp(self):
+        # Índice propio por test: el del proceso arrastra productos de otros tests
+        self.index = AutocompleteIndex()
+        for target in ('marketplace.views.autocomplete_index', 'marketplace.signals.autocomplete_index'):
+            patcher = mock.patch(target, self.index)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.kumara = Product.objects.create(name='Teclado Redragon Kumara', description='', category='teclados',
+                                             price=Decimal('45000.00'), stock=5)
+        self.mouse = Product.objects.create(name='Mouse Redragon Cobra', description='', category='mouses',
+                                            price=Decimal('18000.00'), stock=5)
+
+    def autocomplete(self, query):
+        response = self.client.get(reverse('search_autocomplete'), {'q': query}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['results']
+
+    def test_built_lazily_on_first_request(self):
+        self.assertFalse(self.index.ready)
+
+        results = self.autocomplete('red')
+
+        self.assertTrue(self.index.ready)
+        self.assertEqual({r['name'] for r in results}, {'Teclado Redragon Kumara', 'Mouse Redragon Cobra'})
+        with self.assertNumQueries(0):
+            self.autocomplete('kum')
+
+    def test_results_link_to_product_detail(self):
+        result, = self.autocomplete('kumara')
+
+        self.assertEqual(result['url'], reverse('product_detail', args=[self.kumara.id]))
+        self.assertEqual(result['price'], '45000.00')
+        self.assertEqual(result['category'], self.kumara.get_category_display())
+
+    def test_ranks_name_prefix_first_and_follows_saves(self):
+        self.assertEqual([r['name'] for r in self.autocomplete('mouse')], ['Mouse Redragon Cobra'])
+        Product.objects.create(name='Pad Mouse HyperX', description='', category='mouses',
+                               price=Decimal('9000.00'), stock=5)
+        self.assertEqual([r['name'] for r in self.autocomplete('mouse')], ['Mouse Redragon Cobra', 'Pad Mouse HyperX'])
+
+        self.mouse.available = False
+        self.mouse.save()
+        self.kumara.delete()
+        self.assertEqual([r['name'] for r in self.autocomplete('mouse')], ['Pad Mouse HyperX'])
+        self.assertEqual(self.autocomplete('kumara'), [])
+
+    def test_staleness_check_runs_off_the_request(self):
+        self.autocomplete('red')
+        self.index._checked_at = 0.0
+        checked_in = []
+
+        def signature():
+            checked_in.append(threading.current_thread().name)
+            return self.index._signature
+
+        with mock.patch.object(self.index, '_signature_query', side_effect=signature):
+            with self.assertNumQueries(0):
+                self.assertEqual(len(self.autocomplete('red')), 2)
+            for _ in range(50):
+                if not self.index._refreshing:
+                    break
+                time.sleep(0.02)
+
+        self.assertEqual(checked_in, ['autocomplete-refresh'])
+
+    def test_concurrent_first_requests_build_once(self):
+        builds = []
+
+        def slow_build():
+            # Sin base: los hilos del test no ven las tablas de la transacción
+            builds.append(1)
+            time.sleep(0.05)
+            self.index.ready = True
+
+        with mock.patch.object(self.index, 'build', side_effect=slow_build):
+            threads = [threading.Thread(target=self.index.ensure_fresh) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(builds), 1)
+
+    def test_falls_back_to_database_search(self):
+        with mock.patch.object(self.index, 'ensure_fresh', side_effect=RuntimeError('sin índice')):
+            result, = self.autocomplete('kumara')
+
+        self.assertEqual(result['url'], reverse('product_detail', args=[self.kumara.id]))
+
+
+# =============================================================================
+# BÚSQUEDA
+# =============================================================================
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.kumara = Product.objects.create(name='Teclado Redragon Kumara', description='Mecánico switches rojos',
+                                             category='teclados', price=Decimal('45000.00'), stock=5)
+        self.cobra = Product.objects.create(name='Mouse Redragon Cobra', description='Ideal para acompañar un teclado',
+                                            category='mouses', price=Decimal('18000.00'), stock=5)
+        Product.objects.create(name='Monitor Samsung Odyssey', description='144hz', category='monitores',
+                               price=Decimal('300000.00'), stock=5)
+
+    def ranked(self, query):
+        return [p.name for p in search_products(Product.objects.all(), query).order_by('-search_rank', 'id')]
+
+    @skipUnless(connection.vendor == 'sqlite' and SQLiteSearchBackend().is_available(), "requiere SQLite con FTS5")
+    def test_fts_matches_once_and_ranks_name_first(self):
+        with CaptureQueriesContext(connection) as queries:
+            names = self.ranked('teclado')
+
+        # El nombre pesa más que la descripción; prefijos y acentos se normalizan
+        self.assertEqual(names, ['Teclado Redragon Kumara', 'Mouse Redragon Cobra'])
+        self.assertEqual(self.ranked('mecanico'), ['Teclado Redragon Kumara'])
+        self.assertEqual(self.ranked('redr cob'), ['Mouse Redragon Cobra'])
+        # Un JOIN con la tabla FTS: un solo MATCH y ninguna subconsulta por producto
+        sql = queries[-1]['sql']
+        self.assertEqual(sql.count(' MATCH '), 1)
+        self.assertEqual(sql.count('SELECT'), 1)
+
+    @skipUnless(connection.vendor == 'sqlite' and SQLiteSearchBackend().is_available(), "requiere SQLite con FTS5")
+    def test_index_follows_saves_updates_and_deletes(self):
+        self.kumara.name = 'Teclado HyperX Alloy'
+        self.kumara.save()
+        Product.objects.filter(id=self.cobra.id).update(name='Mouse Logitech G203')
+        self.assertEqual(self.ranked('hyperx'), ['Teclado HyperX Alloy'])
+        self.assertEqual(self.ranked('logitech'), ['Mouse Logitech G203'])
+        self.assertEqual(self.ranked('kumara'), [])
+
+        Product.objects.filter(id=self.kumara.id).delete()
+        self.assertEqual(self.ranked('hyperx'), [])
+        Product.objects.bulk_create([Product(name='Silla Corsair T3', description='', category='sillas',
+                                             price=Decimal('250000.00'), stock=1)])
+        self.assertEqual(self.ranked('corsair'), ['Silla Corsair T3'])
+
+    def test_postgres_query_uses_the_indexed_expression(self):
+        backend = PostgresSearchBackend()
+        queryset = backend.search(Product.objects.all(), 'tecl "red"')
+
+        self.assertEqual(backend.build_query(tokenize('tecl "red"')), 'tecl:* & red:*')
+        sql = str(queryset.query)
+        # Misma expresión que el índice GIN de la migración 0007, para que el planner lo use
+        self.assertIn(PostgresSearchBackend.VECTOR_SQL + ' @@ ', sql)
+        self.assertIn('ts_rank(', sql)
+
+    def test_like_fallback(self):
+        names = [p.name for p in LikeSearchBackend().search(Product.objects.order_by('id'), 'redragon')]
+
+        self.assertEqual(names, ['Teclado Redragon Kumara', 'Mouse Redragon Cobra'])
+        self.assertFalse(LikeSearchBackend().search(Product.objects.all(), '   ').exists())
+
+    def test_unavailable_backend_falls_back_to_like(self):
+        with mock.patch('marketplace.search._backend', None), \
+                mock.patch.object(SQLiteSearchBackend, 'is_available', return_value=False), \
+                override_settings(MARKETPLACE_SEARCH_BACKEND='marketplace.search.SQLiteSearchBackend'):
+            self.assertIsInstance(get_search_backend(), LikeSearchBackend)
+
+
+# =============================================================================
+# LÍMITE DE CONSULTAS
+# =============================================================================
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_burst_then_refill(self):
+        store = LocalBucketStore()
+        self.assertEqual([store.consume('k', 3, 10) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(store.consume('k', 3, 10), 0.1, places=2)
+        self.assertEqual(store.consume('otra', 3, 10), 0)
+
+    def assert_all_or_nothing(self, store):
+        session, ip = ('s', 3, 0.001), ('ip', 1, 0.001)
+        self.assertEqual(store.consume_all([session, ip]), (0.0, None))
+
+        wait, rejected = store.consume_all([session, ip])
+
+        self.assertGreater(wait, 0)
+        self.assertEqual(rejected, 'ip')
+        # El rechazo por IP no gastó fichas de la sesión: le quedan 2
+        self.assertEqual([store.consume_all([session])[0] for _ in range(2)], [0.0, 0.0])
+        self.assertGreater(store.consume_all([session])[0], 0)
+
+    def test_local_buckets_are_consumed_all_or_nothing(self):
+        self.assert_all_or_nothing(LocalBucketStore())
+
+    def test_cache_buckets_refund_on_reject(self):
+        cache.clear()
+        self.assert_all_or_nothing(CacheBucketStore())
+
+
+@override_settings(RATE_LIMITS={'autocomplete': '3/m'}, RATE_LIMIT_IP_FACTOR=2, RATE_LIMIT_STORE='local')
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        get_store().clear()
+
+    def autocomplete(self, ip='10.0.0.1'):
+        return self.client.get(reverse('search_autocomplete'), {'q': 'x'}, REMOTE_ADDR=ip, secure=True)
+
+    def test_ip_bucket_answers_429_with_retry_after(self):
+        statuses = [self.autocomplete().status_code for _ in range(7)]
+
+        self.assertEqual(statuses, [200] * 6 + [429])
+        response = self.autocomplete()
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(self.autocomplete('10.0.0.2').status_code, 200)
+
+    def test_session_bucket_is_checked_before_ip(self):
+        self.client.session.save()  # el cliente queda con cookie de sesión
+
+        statuses = [self.autocomplete().status_code for _ in range(4)]
+
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+
+# =============================================================================
+# VARIANTES DE IMAGEN
+# =============================================================================
+
+class FakeImage:
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+
+
+class ImageRenditionTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        root = Path(self.media.name)
+        (root / 'products').mkdir()
+        Image.new('RGB', (1000, 500), 'red').save(root / 'products' / 'g203.png')
+        self.local = override_settings(
+            IMAGE_RENDITION_BACKEND='local',
+            IMAGE_RENDITION_ROOT=root / 'renditions',
+            IMAGE_RENDITION_SOURCE_ROOT=root,
+            IMAGE_RENDITION_URL='/media/renditions/',
+        )
+        self.local.enable()
+        self.root = root
+
+    def tearDown(self):
+        self.local.disable()
+        self.media.cleanup()
+
+    def render(self, product, size):
+        template = Template("{% load product_images %}{% product_image product '" + size + "' class='product-img' %}")
+        return template.render(Context({'product': product}))
+
+    def test_cloudinary_transformations(self):
+        image = FakeImage('products/g203', 'https://res.cloudinary.com/demo/image/upload/v1/media/products/g203')
+
+        urls = CloudinaryRenditions().build(image, [320])
+
+        self.assertEqual(urls[320], 'https://res.cloudinary.com/demo/image/upload/'
+                                    'c_limit,w_320,f_auto,q_auto/v1/media/products/g203')
+
+    def test_renditions_are_generated_and_stored_on_save(self):
+        product = Product.objects.create(name='Mouse G203', description='', category='mouses',
+                                         price=Decimal('25000.00'), stock=3, image='products/g203.png')
+
+        stored = Product.objects.get(pk=product.pk).image_renditions
+        self.assertEqual(stored['source'], 'products/g203.png')
+        card = stored['card']
+        self.assertEqual(card['srcset'].count('w,'), 2)
+        with Image.open(self.root / card['src'].replace('/media/', '')) as variant:
+            self.assertEqual((variant.format, variant.size), ('WEBP', (480, 240)))
+
+        html = self.render(product, 'card')
+        self.assertIn(f'srcset="{card["srcset"]}"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('class="product-img"', html)
+
+    def test_product_without_image_renders_nothing(self):
+        product = Product.objects.create(name='Sin foto', description='', category='mouses',
+                                         price=Decimal('1.00'), stock=1)
+
+        self.assertEqual(product.image_renditions, {})
+        self.assertEqual(self.render(product, 'thumb'), '')
+
+
+# =============================================================================
+# IMPORTACIÓN MASIVA
+# =============================================================================
+
+class FakeFetcher:
+    """Reemplaza las descargas: devuelve un nombre de archivo o corta la importación"""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.jobs = []
+        self.discarded = []
+
+    def fetch_many(self, jobs):
+        self.jobs.extend(jobs)
+        if any(name == self.fail_on for name, _ in jobs):
+            raise RuntimeError("importación interrumpida")
+        return {name: f"products/{index}.jpg" for index, (name, _) in enumerate(jobs)}
+
+    def discard(self, names):
+        self.discarded.extend(names)
+
+
+class ProductImporterTests(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.existing = Product.objects.create(name='Mouse Logitech G203', description='viejo', category='mouses',
+                                               price=Decimal('1.00'), stock=1, image='products/g203.jpg')
+
+    def write(self, name, content):
+        path = Path(self.folder.name) / name
+        path.write_text(content, encoding='utf-8')
+        return path
+
+    def test_csv_dedupes_and_updates_in_bulk(self):
+        path = self.write('productos.csv', (
+            "name,description,price,category,stock,image_url,sku\n"
+            "MOUSE  logitech g203,Nuevo,\"25000,50\",Mouses Gaming,8,http://img/g203,\n"
+            "Teclado Kumara,Mecánico,45000,teclados,3,http://img/kumara,K552\n"
+            "Teclado Kumara (otro),Repetido por SKU,1,teclados,1,,K552\n"
+            "Sin categoría,,10,sillas,1,,\n"
+        ))
+        fetcher = FakeFetcher()
+
+        with self.assertNumQueries(7):
+            stats = ProductImporter(fetcher=fetcher).run(path)
+
+        self.assertEqual(stats, {'created': 1, 'updated': 1, 'unchanged': 0, 'skipped': 1, 'errors': 1, 'images': 1})
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.price, self.existing.stock, self.existing.name),
+                         (Decimal('25000.50'), 8, 'Mouse Logitech G203'))
+        # El existente ya tenía imagen: solo se descarga la del nuevo
+        self.assertEqual(fetcher.jobs, [('Teclado Kumara', 'http://img/kumara')])
+        self.assertEqual(Product.objects.get(name='Teclado Kumara').image.name, 'products/0.jpg')
+
+    def test_interrupted_import_resumes_from_checkpoint(self):
+        lines = [json.dumps({'name': f'Monitor {n}', 'price': 100 + n, 'category': 'monitores',
+                             'image_url': f'http://img/{n}'}) for n in range(5)]
+        path = self.write('productos.jsonl', '\n'.join(lines) + '\n')
+        checkpoint = Checkpoint(path)
+
+        with self.assertRaises(RuntimeError):
+            ProductImporter(batch_size=2, fetcher=FakeFetcher(fail_on='Monitor 3')).run(path, checkpoint=checkpoint)
+        self.assertEqual(checkpoint.load(), 2)
+        self.assertEqual(Product.objects.filter(category='monitores').count(), 2)
+
+        fetcher = FakeFetcher()
+        stats = ProductImporter(batch_size=2, fetcher=fetcher).run(path, checkpoint=checkpoint)
+
+        self.assertEqual(stats['created'], 3)
+        self.assertEqual([name for name, _ in fetcher.jobs], ['Monitor 2', 'Monitor 3', 'Monitor 4'])
+        self.assertEqual(Product.objects.filter(category='monitores').count(), 5)
+        self.assertFalse(checkpoint.path.exists())
+
+    def test_failed_write_deletes_the_batch_uploads(self):
+        path = self.write('productos.jsonl', '\n'.join(json.dumps({
+            'name': f'Monitor {n}', 'price': 1000, 'category': 'monitores', 'image_url': f'http://img/{n}',
+        }) for n in range(2)) + '\n')
+        fetcher = FakeFetcher()
+
+        with mock.patch.object(Product.objects, 'bulk_create', side_effect=DatabaseError('disco lleno')), \
+                self.assertRaises(DatabaseError):
+            ProductImporter(fetcher=fetcher).run(path)
+
+        self.assertEqual(sorted(fetcher.discarded), ['products/0.jpg', 'products/1.jpg'])
+        self.assertFalse(Product.objects.filter(category='monitores').exists())
+
+    def test_image_fetcher_discard_removes_stored_files(self):
+        storage = mock.Mock()
+        storage.delete.side_effect = [None, OSError('sin permiso')]
+
+        ImageFetcher(storage=storage).discard(['products/a.jpg', 'products/b.jpg'])
+
+        self.assertEqual([c.args for c in storage.delete.call_args_list], [('products/a.jpg',), ('products/b.jpg',)])
+
+
+class SeedProductsTests(TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.path = Path(folder.name) / 'productos.jsonl'
+        self.path.write_text('\n'.join(json.dumps({
+            'name': f'Auricular {n}', 'price': 1000, 'category': 'auriculares', 'image_url': f'http://img/{n}.jpg',
+        }) for n in range(3)), encoding='utf-8')
+
+    def test_unchanged_seed_is_a_single_query(self):
+        stats = seed_products([self.path])
+        self.assertEqual((stats['created'], stats['pending_images']), (3, 3))
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(seed_products([self.path]))
+
+        with self.path.open('a', encoding='utf-8') as seed:
+            seed.write('\n' + json.dumps({'name': 'Auricular nuevo', 'price': 5, 'category': 'auriculares'}))
+        self.assertEqual(seed_products([self.path])['created'], 1)
+
+    def test_images_are_fetched_later_in_background(self):
+        seed_products([self.path])
+        self.assertFalse(Product.objects.exclude(image='').exclude(image__isnull=True).exists())
+
+        fetcher = FakeFetcher()
+        self.assertEqual(fetch_pending_images(fetcher=fetcher), 3)
+
+        self.assertEqual(len(fetcher.jobs), 3)
+        self.assertFalse(PendingProductImage.objects.exists())
+        product = Product.objects.get(name='Auricular 0')
+        self.assertTrue(product.image.name.startswith('products/'))
+        self.assertEqual(product.image_renditions['source'], product.image.name)
+
+
+# =============================================================================
+# RESUMEN DE VENTAS
+# =============================================================================
+
+class DailySalesTests(TestCase):
+
+    def setUp(self):
+        self.keyboard = Product.objects.create(name='Teclado Redragon Kumara', description='', category='teclados',
+                                               price=Decimal('45000.00'), stock=10)
+        self.mouse = Product.objects.create(name='Mouse Logitech G203', description='', category='mouses',
+                                            price=Decimal('25000.00'), stock=10)
+
+    def sell(self, *lines):
+        order = reserve_order(FakeCart(*lines), CUSTOMER)
+        confirm_order(order.id, payment_id='1')
+        return order
+
+    def summary(self):
+        return {
+            row.category: (row.orders, row.units, row.revenue)
+            for row in DailySales.objects.filter(date=timezone.localdate())
+        }
+
+    def test_paid_orders_are_rolled_up_by_category(self):
+        self.sell((self.keyboard, 2), (self.mouse, 1))
+        self.sell((self.mouse, 3))
+
+        self.assertEqual(self.summary(), {
+            'teclados': (1, 2, Decimal('90000.00')),
+            'mouses': (2, 4, Decimal('100000.00')),
+        })
+
+    def test_refund_reverses_sale_in_any_sold_status(self):
+        paid = self.sell((self.keyboard, 2))
+        shipped = self.sell((self.mouse, 1))
+        Order.objects.filter(id=shipped.id).update(status='shipped')
+
+        self.assertTrue(refund_order(paid.id))
+        self.assertTrue(refund_order(shipped.id))
+        self.assertFalse(refund_order(shipped.id))
+
+        self.assertEqual(self.summary(), {
+            'teclados': (0, 0, Decimal('0.00')),
+            'mouses': (0, 0, Decimal('0.00')),
+        })
+        self.keyboard.refresh_from_db()
+        self.mouse.refresh_from_db()
+        # Lo no despachado vuelve al stock; lo enviado no
+        self.assertEqual(self.keyboard.stock, 10)
+        self.assertEqual(self.mouse.stock, 9)
+
+    def test_admin_deletes_reverse_sales_and_release_reservations(self):
+        order_admin = OrderAdmin(Order, admin.site)
+        request = RequestFactory().post('/')
+        first = self.sell((self.keyboard, 1))
+        second = self.sell((self.mouse, 2))
+        pending = reserve_order(FakeCart((self.keyboard, 3)), CUSTOMER)
+
+        order_admin.delete_model(request, first)
+        order_admin.delete_queryset(request, Order.objects.filter(id__in=[second.id, pending.id]))
+
+        self.assertEqual(self.summary(), {
+            'teclados': (0, 0, Decimal('0.00')),
+            'mouses': (0, 0, Decimal('0.00')),
+        })
+        self.keyboard.refresh_from_db()
+        self.assertEqual(self.keyboard.stock, 9)
+
+    def edit_status(self, order, status):
+        # El admin guarda la instancia del formulario: el estado que trae puede estar viejo
+        order.status = status
+        form = mock.Mock(changed_data=['status'], initial={'status': 'pending'})
+        OrderAdmin(Order, admin.site).save_model(RequestFactory().post('/'), order, form, change=True)
+        order.refresh_from_db()
+
+    def test_admin_cancelling_a_reservation_returns_its_stock(self):
+        pending = reserve_order(FakeCart((self.keyboard, 3)), CUSTOMER)
+
+        self.edit_status(pending, 'cancelled')
+
+        self.keyboard.refresh_from_db()
+        self.assertEqual(self.keyboard.stock, 10)
+        self.assertEqual((pending.status, pending.reserved_until), ('cancelled', None))
+        # El barrido ya no tiene nada que devolver
+        self.assertEqual(release_expired_reservations(now=timezone.now() + timedelta(days=1)), 0)
+        self.keyboard.refresh_from_db()
+        self.assertEqual(self.keyboard.stock, 10)
+
+    def test_admin_cancelling_a_sale_refunds_stock_and_rollup(self):
+        paid = self.sell((self.keyboard, 2))
+        shipped = self.sell((self.mouse, 1))
+        Order.objects.filter(id=shipped.id).update(status='shipped')
+
+        self.edit_status(paid, 'cancelled')
+        self.edit_status(shipped, 'cancelled')
+
+        self.assertEqual(self.summary(), {
+            'teclados': (0, 0, Decimal('0.00')),
+            'mouses': (0, 0, Decimal('0.00')),
+        })
+        self.keyboard.refresh_from_db()
+        self.mouse.refresh_from_db()
+        # Como en un reembolso: lo enviado no vuelve solo al depósito
+        self.assertEqual((self.keyboard.stock, self.mouse.stock), (10, 9))
+        self.assertEqual((paid.status, shipped.status), ('cancelled', 'cancelled'))
+
+    def test_admin_confirming_a_reservation_records_the_sale(self):
+        pending = reserve_order(FakeCart((self.keyboard, 2)), CUSTOMER)
+
+        self.edit_status(pending, 'paid')
+
+        self.keyboard.refresh_from_db()
+        self.assertEqual(self.keyboard.stock, 8)
+        self.assertIsNone(pending.reserved_until)
+        self.assertEqual(self.summary(), {'teclados': (1, 2, Decimal('90000.00'))})
+
+    def test_rebuild_matches_incremental_rollup(self):
+        self.sell((self.keyboard, 2), (self.mouse, 1))
+        refunded = self.sell((self.mouse, 3))
+        self.sell((self.keyboard, 1))
+        refund_order(refunded.id)
+        incremental = {category: row for category, row in self.summary().items() if row[0]}
+
+        rebuild_daily_sales()
+
+        self.assertEqual(self.summary(), incremental)
+
+
+# =============================================================================
+# HISTORIAL DE PEDIDOS
+# =============================================================================
+
+class OrderHistoryTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='cliente@example.com', username='cliente',
+                                                         password='clave-segura-123')
+        self.products = [
+            Product.objects.create(name=f'Teclado {n}', description='', category='teclados',
+                                   price=Decimal('100.00'), stock=5)
+            for n in range(3)
+        ]
+        self.client.force_login(self.user)
+
+    def add_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(user=self.user, first_name='Ana', last_name='Paz', email='a@example.com',
+                                         address='Calle 1', city='CABA', phone='1', total=Decimal('300.00'))
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product=product, quantity=1, price=product.price) for product in self.products
+            )
+
+    def queries_for_page(self):
+        cache.clear()  # mismas condiciones en cada medición (fragmentos del catálogo)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('order_history'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_orders(self):
+        self.add_orders(1)
+        _, few = self.queries_for_page()
+        self.add_orders(9)
+        response, many = self.queries_for_page()
+
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.context['orders']), 10)
+        self.assertEqual(response.context['orders'][0].item_count, 3)
+
+    def test_history_is_paginated_and_old_url_redirects(self):
+        self.add_orders(12)
+        response = self.client.get(reverse('order_history'), {'page': 2}, secure=True)
+        self.assertEqual(len(response.context['orders']), 2)
+
+        response = self.client.get('/accounts/orders/?page=2', secure=True)
+        self.assertRedirects(response, reverse('order_history') + '?page=2', status_code=301,
+                             fetch_redirect_response=False)
+
+
+# =============================================================================
+# COTIZADOR DE ENVÍOS
+# =============================================================================
+
+class ShippingQuoteTests(TestCase):
+    """Las zonas por defecto las carga la migración 0014"""
+
+    def setUp(self):
+        shipping_index.invalidate()
+
+    def test_most_specific_zone_wins(self):
+        self.assertEqual(normalize_postal_code(' c1425abc '), 1425)
+        self.assertIsNone(normalize_postal_code('14250'))
+
+        zones = {code: shipping_index.quote(code).zone for code in ('1425', 'B1640', '1754', '2000', '9410')}
+
+        self.assertEqual(zones, {'1425': 'CABA', 'B1640': 'GBA', '1754': 'GBA', '2000': 'Interior',
+                                 '9410': 'Interior'})
+        with self.assertNumQueries(0):
+            self.assertEqual(shipping_index.quote('1600').price, Decimal('2000.00'))
+
+    def test_admin_edits_invalidate_the_index(self):
+        self.assertEqual(shipping_index.quote('1640').price, Decimal('2000.00'))
+
+        option = ShippingOption.objects.get(shippingzone__name='GBA')
+        option.price = Decimal('2200.00')
+        option.save()
+
+        self.assertEqual(shipping_index.quote('1640').price, Decimal('2200.00'))
+
+    def test_quote_api_stores_shipping_in_session(self):
+        url = reverse('shipping_quote_api')
+        self.assertEqual(self.client.get(url, {'postal_code': 'abc'}, secure=True).status_code, 400)
+
+        response = self.client.post(url, {'postal_code': '1640'}, secure=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['zone'], 'GBA')
+        self.assertEqual(response.json()['total'], '2000.00')
+        self.assertEqual(self.client.session['shipping_price'], 2000.0)
+
+    def test_quote_many_matches_single_quotes(self):
+        codes = ['1425', 'B1640ABC', 'x', '2000', '1425', '0999', 'C1001AAA']
+
+        batch = shipping_index.quote_many(codes)
+
+        self.assertEqual([q and q.zone for q in batch], [q and q.zone for q in map(shipping_index.quote, codes)])
+        self.assertEqual([q and q.zone for q in batch][:4], ['CABA', 'GBA', None, 'Interior'])
+
+    def post_batch(self, codes, client=None, **headers):
+        return (client or self.client).post(reverse('shipping_quote_batch_api'), data={'postal_codes': codes},
+                                            content_type='application/json', secure=True, **headers)
+
+    @override_settings(SHIPPING_BATCH_API_KEY='clave-interna')
+    def test_batch_api(self):
+        response = self.post_batch(['1425', 'x', '0999'], HTTP_X_API_KEY='clave-interna')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['count'], data['quoted']), (3, 1))
+        self.assertEqual(data['results'][0]['price'], '1500.00')
+        self.assertEqual([r.get('error') for r in data['results']], [None, 'invalido', 'sin_cobertura'])
+
+    @override_settings(SHIPPING_BATCH_API_KEY='clave-interna')
+    def test_batch_api_takes_thousands_of_codes(self):
+        codes = [str(1000 + n % 9000) for n in range(3000)]
+
+        response = self.post_batch(codes, HTTP_X_API_KEY='clave-interna')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 3000)
+        self.assertGreaterEqual(settings.SHIPPING_BATCH_MAX_CODES, 5000)
+
+    @override_settings(SHIPPING_BATCH_API_KEY='clave-interna', SHIPPING_BATCH_MAX_CODES=2)
+    def test_batch_api_requires_api_key_or_staff_with_csrf(self):
+        self.assertEqual(self.post_batch(['1425']).status_code, 403)
+        self.assertEqual(self.post_batch(['1425'], HTTP_X_API_KEY='otra').status_code, 403)
+
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(get_user_model().objects.create_user(email='cliente@example.com', username='cliente',
+                                                                password='x'))
+        self.assertEqual(self.post_batch(['1425'], client).status_code, 403)
+
+        staff = get_user_model().objects.create_user(email='staff@example.com', username='staff', password='x',
+                                                     is_staff=True)
+        client.force_login(staff)
+        self.assertEqual(self.post_batch(['1425'], client).status_code, 403)
+        client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 32
+        with_csrf = {'HTTP_X_CSRFTOKEN': 'a' * 32, 'HTTP_REFERER': 'https://testserver/'}
+        self.assertEqual(self.post_batch(['1425'], client, **with_csrf).status_code, 200)
+        self.assertEqual(self.post_batch(['1425', '1640', '2000'], client, **with_csrf).status_code, 400)
+
+
+# =============================================================================
+# CACHE DEL CATÁLOGO
+# =============================================================================
+
+class CatalogCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Mouse Razer Viper', description='', category='mouses',
+                                              price=Decimal('30000.00'), stock=8)
+
+    def get(self, client, url):
+        response = client.get(url, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_anonymous_pages_are_cached_until_a_product_changes(self):
+        url = reverse('product_list') + '?category=mouses&utm_source=ads'
+        self.assertEqual(self.get(self.client, url)['X-Catalog-Cache'], 'miss')
+
+        with self.assertNumQueries(0):
+            response = self.get(self.client, reverse('product_list') + '?category=mouses')
+        self.assertEqual(response['X-Catalog-Cache'], 'hit')
+
+        self.product.name = 'Mouse Razer Viper V2'
+        self.product.save()
+
+        response = self.get(self.client, url)
+        self.assertEqual(response['X-Catalog-Cache'], 'miss')
+        self.assertContains(response, 'Mouse Razer Viper V2')
+
+    def test_cached_page_sets_each_visitors_csrf_cookie(self):
+        url = reverse('product_detail', args=[self.product.id])
+        first = self.get(self.client, url).cookies[settings.CSRF_COOKIE_NAME].value
+        other = Client(enforce_csrf_checks=True)
+
+        response = self.get(other, url)
+
+        self.assertEqual(response['X-Catalog-Cache'], 'hit')
+        self.assertNotIn('name="csrfmiddlewaretoken"', response.content.decode())
+        self.assertNotEqual(response.cookies[settings.CSRF_COOKIE_NAME].value, first)
+        added = other.post(reverse('add_to_cart', args=[self.product.id]), {'quantity': 1}, secure=True,
+                           HTTP_X_CSRFTOKEN=response.cookies[settings.CSRF_COOKIE_NAME].value,
+                           HTTP_X_REQUESTED_WITH='XMLHttpRequest', HTTP_REFERER='https://testserver' + url)
+        self.assertEqual(added.status_code, 200)
+
+    def test_cart_lives_outside_the_cached_page(self):
+        url = reverse('index')
+        self.get(self.client, url)
+        self.client.post(reverse('add_to_cart', args=[self.product.id]), {'quantity': 1}, secure=True,
+                         HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.assertEqual(self.get(self.client, url)['X-Catalog-Cache'], 'hit')
+        panel = self.get(self.client, reverse('cart_panel_api'))
+        self.assertEqual(panel['X-Cart-Count'], '1')
+        self.assertIn('no-cache', panel['Cache-Control'])
+
+        user = get_user_model().objects.create_user(email='cache@example.com', username='cache', password='x')
+        self.client.force_login(user)
+        self.assertNotIn('X-Catalog-Cache', self.get(self.client, url))
+
+    def test_conditional_get_answers_304_until_the_product_changes(self):
+        for url in (reverse('product_list'), reverse('product_detail', args=[self.product.id])):
+            response = self.get(self.client, url)
+            etag = response['ETag']
+            self.assertIn('no-cache', response['Cache-Control'])
+
+            with self.assertNumQueries(0):
+                response = self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+            self.product.stock = 7
+            self.product.save()
+            response = self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
@@ -0,0 +1,17 @@
+# === marketplace/text.py - Normalización de texto para búsquedas ===
+
+import re
+import unicodedata
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fold(text):
+    """Minúsculas y sin acentos: 'Envío Rápido' -> 'envio rapido'"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def words(text):
+    """Palabras normalizadas de un texto"""
+    return WORD_RE.findall(fold(text))
@@ -9,7 +9,8 @@ urlpatterns = [
     path('producto/<int:product_id>/', views.product_detail, name='product_detail'),
     path('ofertas/', views.ofertas, name='ofertas'),
     path('contacto/', views.contacto, name='contacto'),
-    path('envios/', views.envios_info, name='envios_info'),    
+    path('envios/', views.envios_info, name='envios_info'),
+    path('envios/api/cotizar/', views.shipping_quote_batch_api, name='shipping_quote_batch_api'),    
     # Carrito
     path('carrito/', views.cart_detail, name='cart_detail'),
     path('carrito/agregar/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
@@ -18,6 +19,7 @@ urlpatterns = [
     path('carrito/vaciar/', views.clear_cart, name='clear_cart'),
     path('carrito/calcular-envio/', views.calculate_shipping, name='calculate_shipping'),
     path('carrito/api/panel/', cart_panel_api, name='cart_panel_api'),
+    path('carrito/api/envio/', views.shipping_quote_api, name='shipping_quote_api'),
 
     # Mercado Pago
     path('payment/create/', views.create_mercadopago_payment, name='create_payment'),
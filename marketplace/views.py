@@ -1,26 +1,51 @@
 # === marketplace/views.py - VERSIÓN CORREGIDA Y OPTIMIZADA ===
 
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.db.models import Count, Prefetch
 from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_exempt
+from django.middleware.csrf import CsrfViewMiddleware
 from django.utils import timezone
 from decimal import Decimal
-import mercadopago
+import hmac
 import json
+import logging
 from django.conf import settings
 
 from .models import Product, Order, OrderItem
 from .forms import OrderForm, ContactForm
-from .cart import Cart
+from .cart import get_request_cart
+from .catalog_cache import (
+    cache_catalog_page, conditional_catalog_page, listing_signature, product_signature,
+)
+from .pagination import KeysetPaginator
+from .search import search_products
+from .shipping import normalize_postal_code, shipping_index
+from .autocomplete import autocomplete_index
+from .images import rendition_src
+from .inventory import InsufficientStock, release_order, reserve_order
+from .payments import (
+    PaymentGatewayError, PreferenceInProgress, acached_preference, cart_fingerprint, get_gateway,
+    preference_idempotency_key,
+)
+from .ratelimit import rate_limit
+from .webhooks import record_notification
+
+logger = logging.getLogger(__name__)
 
 # =============================================================================
 # VISTAS PRINCIPALES
 # =============================================================================
 
+@conditional_catalog_page(listing_signature)
+@cache_catalog_page
 def index(request):
     """Vista principal de la página de inicio"""
     featured_products = Product.objects.filter(available=True).order_by('-created_at')[:8]
@@ -33,11 +58,16 @@ def index(request):
     
     return render(request, 'marketplace/index.html', context)
 
+@conditional_catalog_page(listing_signature)
+@cache_catalog_page
 def product_list(request):
     """Vista para listar productos con filtros"""
     category = request.GET.get('category', '')
     search_query = request.GET.get('q', '')
-    sort_by = request.GET.get('sort', 'name')
+    # Con búsqueda, el orden por defecto es por relevancia
+    sort_by = request.GET.get('sort', 'relevance' if search_query else 'name')
+    if sort_by == 'relevance' and not search_query:
+        sort_by = 'name'
     
     products = Product.objects.filter(available=True)
     
@@ -46,24 +76,19 @@ def product_list(request):
         products = products.filter(category=category)
     
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | 
-            Q(description__icontains=search_query)
-        )
-    
-    # Ordenamiento
-    sorting_options = {
-        'name': 'name',
-        'price_low': 'price',
-        'price_high': '-price', 
-        'newest': '-created_at'
-    }
+        products = search_products(products, search_query)
     
-    order_field = sorting_options.get(sort_by, 'name')
-    products = products.order_by(order_field)
+    # Ordenamiento + paginación por cursor (sin OFFSET en páginas profundas)
+    paginator = KeysetPaginator(products, sort_by=sort_by)
+    page = paginator.page(
+        number=request.GET.get('page'),
+        cursor=request.GET.get('cursor'),
+    )
     
     context = {
-        'products': products,
+        'products': page,
+        'total_count': paginator.count,
+        'count_limit': paginator.count_limit,
         'categories': Product.CATEGORY_CHOICES,
         'selected_category': category,
         'search_query': search_query,
@@ -73,6 +98,8 @@ def product_list(request):
     
     return render(request, 'marketplace/product_list.html', context)
 
+@conditional_catalog_page(product_signature)
+@cache_catalog_page
 def product_detail(request, product_id):
     """Vista para detalle de producto"""
     product = get_object_or_404(Product, id=product_id, available=True)
@@ -91,7 +118,7 @@ def handle_add_to_cart(request, product):
     """Maneja la lógica de agregar al carrito"""
     try:
         quantity = int(request.POST.get('quantity', 1))
-        cart = Cart(request)
+        cart = get_request_cart(request)
         
         # Validar stock
         cart_quantity = cart.cart.get(str(product.id), {}).get('quantity', 0)
@@ -111,6 +138,8 @@ def handle_add_to_cart(request, product):
     
     return redirect('product_detail', product_id=product.id)
 
+@conditional_catalog_page(listing_signature)
+@cache_catalog_page
 def ofertas(request):
     """Vista para ofertas especiales"""
     productos_oferta = Product.objects.filter(available=True).order_by('-created_at')[:8]
@@ -140,15 +169,9 @@ def contacto(request):
     return render(request, 'marketplace/contacto.html', context)
 
 def envios_info(request):
-    """Vista para información de envíos"""
-    shipping_zones = [
-        {'zona': 'CABA', 'precio': '$1.500', 'tiempo': '24-48 horas'},
-        {'zona': 'GBA', 'precio': '$2.000', 'tiempo': '48-72 horas'},
-        {'zona': 'Interior', 'precio': '$3.500', 'tiempo': '5-7 días'},
-    ]
-    
+    """Vista para información de envíos (zonas y precios desde la base)"""
     context = {
-        'shipping_zones': shipping_zones,
+        'shipping_zones': shipping_index.zones(),
         'page_title': 'Información de Envíos - Masivo Tech'
     }
     
@@ -160,7 +183,7 @@ def envios_info(request):
 
 def cart_detail(request):
     """Vista principal del carrito"""
-    cart = Cart(request)
+    cart = get_request_cart(request)
     
     # Verificar stock
     cart_has_exceeded_stock = False
@@ -184,9 +207,10 @@ def cart_detail(request):
     
     return render(request, 'marketplace/cart.html', context)
 
+@never_cache
 def cart_panel_api(request):
-    """API para panel lateral del carrito"""
-    cart = Cart(request)
+    """API para panel lateral del carrito (también actualiza los contadores del header)"""
+    cart = get_request_cart(request)
     
     context = {
         'cart': cart,
@@ -194,11 +218,14 @@ def cart_panel_api(request):
         'cart_total_price': cart.get_total_price(),
     }
     
-    return render(request, 'marketplace/cart_panel_content.html', context)
+    response = render(request, 'marketplace/cart_panel_content.html', context)
+    response['X-Cart-Count'] = context['cart_total_items']
+    response['X-Cart-Total'] = context['cart_total_price']
+    return response
 
 def add_to_cart(request, product_id):
     """Agregar producto al carrito"""
-    cart = Cart(request)
+    cart = get_request_cart(request)
     product = get_object_or_404(Product, id=product_id)
     
     try:
@@ -238,7 +265,7 @@ def add_to_cart(request, product_id):
 
 def remove_from_cart(request, product_id):
     """Remover producto del carrito"""
-    cart = Cart(request)
+    cart = get_request_cart(request)
     product = get_object_or_404(Product, id=product_id)
     
     cart.remove(product)
@@ -256,7 +283,7 @@ def remove_from_cart(request, product_id):
 
 def update_cart(request, product_id):
     """Actualizar cantidad en carrito"""
-    cart = Cart(request)
+    cart = get_request_cart(request)
     product = get_object_or_404(Product, id=product_id)
     
     try:
@@ -293,192 +320,253 @@ def update_cart(request, product_id):
 
 def clear_cart(request):
     """Vaciar carrito completo"""
-    cart = Cart(request)
+    cart = get_request_cart(request)
     cart.clear()
     messages.success(request, 'Carrito vaciado correctamente.')
     return redirect('cart_detail')
 
+def apply_shipping_quote(request, postal_code):
+    """Cotiza el envío y lo guarda en la sesión para el checkout; devuelve la cotización o None"""
+    quote = shipping_index.quote(postal_code)
+    if quote is not None:
+        request.session['shipping_price'] = float(quote.price)
+        request.session['postal_code'] = postal_code.strip().upper()
+    return quote
+
 def calculate_shipping(request):
-    """Calcular costo de envío"""
+    """Calcular costo de envío (formulario sin JavaScript)"""
     if request.method == 'POST':
         postal_code = request.POST.get('postal_code', '')
-        
-        shipping_price = 0
-        if postal_code:
-            if postal_code.startswith(('1', '2')):  # CABA
-                shipping_price = 1500
-            elif postal_code.startswith(('16', '17')):  # GBA
-                shipping_price = 2000
-            else:  # Interior
-                shipping_price = 3500
-        
-        request.session['shipping_price'] = float(shipping_price)
-        request.session['postal_code'] = postal_code
+        if apply_shipping_quote(request, postal_code) is None:
+            messages.error(request, 'No hacemos envíos a ese código postal o no es válido.')
     
     return redirect('cart_detail')
 
+@require_http_methods(["GET", "POST"])
+def shipping_quote_api(request):
+    """
+    Cotización de envío en JSON.
+    GET ?postal_code= solo cotiza; POST además la guarda en la sesión y
+    devuelve los totales del carrito para actualizarlos sin recargar.
+    """
+    source = request.POST if request.method == 'POST' else request.GET
+    postal_code = source.get('postal_code', '')
+    if request.method == 'POST' and not postal_code and request.content_type == 'application/json':
+        try:
+            postal_code = str(json.loads(request.body or b'{}').get('postal_code', ''))
+        except (ValueError, AttributeError):
+            postal_code = ''
+    
+    if normalize_postal_code(postal_code) is None:
+        return JsonResponse({'error': 'Código postal inválido (ej: 1425 o C1425ABC)'}, status=400)
+    
+    if request.method == 'GET':
+        quote = shipping_index.quote(postal_code)
+    else:
+        quote = apply_shipping_quote(request, postal_code)
+    if quote is None:
+        return JsonResponse({'error': 'No hacemos envíos a ese código postal'}, status=404)
+    
+    data = {'postal_code': postal_code.strip().upper(), **quote.as_dict()}
+    if request.method == 'POST':
+        subtotal = get_request_cart(request).get_total_price()
+        data['subtotal'] = str(subtotal)
+        data['total'] = str(subtotal + quote.price)
+    return JsonResponse(data)
+
+def batch_caller_denied(request):
+    """
+    Herramientas internas: API key en X-Api-Key (SHIPPING_BATCH_API_KEY) o un
+    usuario staff con token CSRF. Devuelve la respuesta de rechazo o None.
+    """
+    api_key = getattr(settings, 'SHIPPING_BATCH_API_KEY', None)
+    sent_key = request.headers.get('X-Api-Key')
+    if sent_key:
+        if api_key and hmac.compare_digest(sent_key.encode(), api_key.encode()):
+            return None
+        return JsonResponse({'error': 'API key inválida'}, status=403)
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return JsonResponse({'error': 'Requiere API key o usuario staff'}, status=403)
+    # La vista es csrf_exempt por los llamados con API key: para la sesión se valida acá
+    if CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {}) is not None:
+        return JsonResponse({'error': 'Token CSRF inválido'}, status=403)
+    return None
+
+@csrf_exempt  # lo valida batch_caller_denied para los llamados con sesión
+@require_http_methods(["POST"])
+@rate_limit('shipping_batch')
+def shipping_quote_batch_api(request):
+    """
+    Cotización en lote para importaciones de órdenes y herramientas internas.
+    Cuerpo: {"postal_codes": ["1425", "B1640", ...]}; la respuesta trae un
+    resultado por código, en el mismo orden.
+    """
+    denied = batch_caller_denied(request)
+    if denied is not None:
+        return denied
+    try:
+        postal_codes = json.loads(request.body or b'{}').get('postal_codes')
+    except (ValueError, AttributeError):
+        postal_codes = None
+    if not isinstance(postal_codes, list):
+        return JsonResponse({'error': 'Se espera {"postal_codes": [...]}'}, status=400)
+    limit = getattr(settings, 'SHIPPING_BATCH_MAX_CODES', 10000)
+    if len(postal_codes) > limit:
+        return JsonResponse({'error': f'Máximo {limit} códigos por consulta'}, status=400)
+    
+    postal_codes = [str(code) for code in postal_codes]
+    quotes = shipping_index.quote_many(postal_codes)
+    
+    # Cada zona se serializa una sola vez aunque la compartan miles de códigos
+    serialized = {}
+    results = []
+    for postal_code, quote in zip(postal_codes, quotes):
+        if quote is None:
+            error = 'invalido' if normalize_postal_code(postal_code) is None else 'sin_cobertura'
+            results.append({'postal_code': postal_code, 'error': error})
+            continue
+        if quote.zone_id not in serialized:
+            serialized[quote.zone_id] = quote.as_dict()
+        results.append({'postal_code': postal_code, **serialized[quote.zone_id]})
+    
+    return JsonResponse({
+        'count': len(results),
+        'quoted': sum(1 for quote in quotes if quote is not None),
+        'results': results,
+    })
+
 # =============================================================================
 # MERCADO PAGO
 # =============================================================================
+def prepare_checkout(request):
+    """
+    Parte sincrónica del checkout (sesión, usuario, ORM): líneas del carrito,
+    envío, datos de contacto y huella. None si el carrito está vacío.
+    """
+    cart = get_request_cart(request)
+    if len(cart) == 0:
+        return None
+
+    shipping_price = request.session.get('shipping_price', 0)
+    postal_code = request.session.get('postal_code', '')
+    customer = checkout_customer(request)
+    lines = list(cart)
+
+    # Huella del checkout: mismo dueño, líneas, envío y datos de contacto
+    owner = f'user:{request.user.pk}' if request.user.is_authenticated else f'session:{request.session.session_key}'
+    return {
+        'lines': lines,
+        'items': len(cart),
+        'shipping_price': shipping_price,
+        'postal_code': postal_code,
+        'customer': customer,
+        'fingerprint': cart_fingerprint(owner, lines, shipping_price, postal_code, customer),
+    }
+
+def reserve_checkout(request, checkout):
+    """Libera la reserva anterior y reserva la nueva: (orden, cuerpo de la preferencia)"""
+    release_pending_order(request)
+    order = reserve_order(checkout['lines'], checkout['customer'], request.user, checkout['shipping_price'])
+    preference_data = build_preference_data(checkout['lines'], order, checkout['shipping_price'], checkout['postal_code'])
+    return order, preference_data
+
 @require_http_methods(["POST"])
 @csrf_exempt
-def create_mercadopago_payment(request):
-    """Crear preferencia de pago en MercadoPago - VERSIÓN CON DEBUG COMPLETO"""
-    try:
-        print("=" * 50)
-        print("🔄 INICIANDO CREACIÓN DE PAGO MERCADOPAGO")
-        print("=" * 50)
-        
-        # 1. Verificar SDK
-        try:
-            import mercadopago
-            print("✅ Paquete mercadopago disponible")
-        except ImportError as e:
-            error_msg = f"❌ mercadopago no instalado: {e}"
-            print(error_msg)
-            return JsonResponse({'error': error_msg}, status=500)
-        
-        # 2. Verificar credenciales
-        if not hasattr(settings, 'MERCADOPAGO_ACCESS_TOKEN'):
-            error_msg = "❌ MERCADOPAGO_ACCESS_TOKEN no existe en settings"
-            print(error_msg)
-            return JsonResponse({'error': error_msg}, status=500)
-        
-        if not settings.MERCADOPAGO_ACCESS_TOKEN:
-            error_msg = "❌ MERCADOPAGO_ACCESS_TOKEN está vacío"
-            print(error_msg)
-            return JsonResponse({'error': error_msg}, status=500)
-        
-        print(f"✅ Credenciales configuradas: {settings.MERCADOPAGO_ACCESS_TOKEN[:20]}...")
-        
-        # 3. Inicializar SDK
-        try:
-            sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN)
-            print("✅ SDK de MercadoPago inicializado")
-        except Exception as e:
-            error_msg = f"❌ Error inicializando SDK: {e}"
-            print(error_msg)
-            return JsonResponse({'error': error_msg}, status=500)
-        
-        # 4. Verificar carrito
-        cart = Cart(request)
-        print(f"🛒 Carrito tiene {len(cart)} items")
-        
-        if len(cart) == 0:
-            error_msg = "❌ El carrito está vacío"
-            print(error_msg)
-            return JsonResponse({'error': error_msg}, status=400)
-        
-        # 5. Construir items con validación
-        items = []
-        total_carrito = 0
-        
-        print("📦 Construyendo items del carrito:")
-        for i, item in enumerate(cart, 1):
-            try:
-                product_name = item['product'].name[:250]  # Limitar longitud
-                unit_price = float(item['price'])
-                quantity = item['quantity']
-                item_total = unit_price * quantity
-                total_carrito += item_total
-                
-                item_data = {
-                    "title": product_name,
-                    "unit_price": unit_price,
-                    "quantity": quantity,
-                    "currency_id": "ARS"
-                }
-                items.append(item_data)
-                
-                print(f"   {i}. {product_name} - ${unit_price} x {quantity} = ${item_total}")
-                
-            except Exception as e:
-                error_msg = f"❌ Error procesando item {i}: {e}"
-                print(error_msg)
-                return JsonResponse({'error': error_msg}, status=500)
-        
-        print(f"💰 Total carrito: ${total_carrito}")
-        
-        # 6. Agregar envío si existe
-        shipping_price = request.session.get('shipping_price', 0)
-        postal_code = request.session.get('postal_code', '')
-        
-        if shipping_price > 0:
-            try:
-                shipping_item = {
-                    "title": f"Envío a {postal_code}"[:250],
-                    "unit_price": float(shipping_price),
-                    "quantity": 1,
-                    "currency_id": "ARS"
-                }
-                items.append(shipping_item)
-                print(f"🚚 Envío agregado: ${shipping_price} para {postal_code}")
-            except Exception as e:
-                error_msg = f"❌ Error agregando envío: {e}"
-                print(error_msg)
-                return JsonResponse({'error': error_msg}, status=500)
-        
-        # 7. Crear preferencia de pago
-        preference_data = {
-            "items": items,
-            "back_urls": {
-                "success": "http://127.0.0.1:8000/payment/success/",
-                "failure": "http://127.0.0.1:8000/payment/failure/", 
-                "pending": "http://127.0.0.1:8000/payment/pending/"
-            },
-            # "auto_return": "approved",  # ← REMOVER ESTA LÍNEA
-            "external_reference": f"masivotech_{int(timezone.now().timestamp())}",
-        }
-        
-        print("📤 Enviando datos a MercadoPago...")
-        print(f"📊 Datos enviados: {preference_data}")
-        
+async def create_mercadopago_payment(request):
+    """
+    Crear preferencia de pago en MercadoPago.
+    Un doble click o un reintento con el mismo carrito reutiliza la
+    preferencia y la reserva de stock ya creadas. La sesión y el ORM corren
+    en sync_to_async; la espera a MercadoPago no ocupa el worker (ASGI).
+    """
+    # 1. Verificar carrito
+    checkout = await sync_to_async(prepare_checkout)(request)
+    if checkout is None:
+        return JsonResponse({'error': '❌ El carrito está vacío'}, status=400)
+    fingerprint = checkout['fingerprint']
+
+    async def reservation_alive(cached):
+        return await Order.objects.filter(
+            id=cached['order_id'], status='pending', reserved_until__gt=timezone.now()
+        ).aexists()
+
+    async def create():
+        # 2. Persistir la orden y reservar stock (un UPDATE condicional para todas las líneas)
+        order, preference_data = await sync_to_async(reserve_checkout)(request, checkout)
         try:
-            preference_response = sdk.preference().create(preference_data)
-            print(f"📥 Respuesta de MP recibida: {preference_response}")
-        except Exception as e:
-            error_msg = f"❌ Error en la petición a MercadoPago: {e}"
-            print(error_msg)
-            return JsonResponse({'error': error_msg}, status=500)
-        
-        # 8. Procesar respuesta
-        if preference_response["status"] in [200, 201]:
-            preference = preference_response["response"]
-            init_point = preference.get('init_point') or preference.get('sandbox_init_point')
-            
-            if not init_point:
-                error_msg = "❌ MercadoPago no devolvió URL de pago válida"
-                print(error_msg)
-                print(f"📋 Respuesta completa: {preference}")
-                return JsonResponse({'error': error_msg}, status=500)
-            
-            print(f"✅ Pago creado exitosamente - ID: {preference['id']}")
-            print(f"🔗 URL de pago: {init_point}")
-            
-            return JsonResponse({
-                'id': preference['id'],
-                'init_point': init_point,
-                'message': 'Pago creado exitosamente'
-            })
-        else:
-            error_msg = f"❌ Error de MercadoPago - Status: {preference_response['status']}"
-            print(error_msg)
-            print(f"📋 Respuesta completa: {preference_response}")
-            return JsonResponse({'error': error_msg}, status=500)
-            
+            # La clave lleva la orden: si la reserva venció y se reintenta con el mismo carrito,
+            # MercadoPago no debe devolver la preferencia de la orden cancelada
+            preference = await get_gateway().acreate_preference(
+                preference_data, idempotency_key=preference_idempotency_key(fingerprint, order.id),
+            )
+        except Exception:
+            await sync_to_async(release_order)(order.id)
+            raise
+        return {**preference, 'order_id': order.id}
+
+    try:
+        preference = await acached_preference(
+            fingerprint, create, reservation_alive,
+            timeout=settings.STOCK_RESERVATION_TTL_MINUTES * 60,
+        )
+    except (InsufficientStock, PreferenceInProgress) as e:
+        return JsonResponse({'error': f"❌ {e}"}, status=409)
+    except PaymentGatewayError as e:
+        logger.warning("checkout.preference_failed error=%s", e)
+        return JsonResponse({'error': f"❌ {e}"}, status=502)
     except Exception as e:
-        error_msg = f"💥 ERROR NO MANEJADO: {str(e)}"
-        print(error_msg)
-        import traceback
-        print(f"📝 Traceback completo: {traceback.format_exc()}")
-        return JsonResponse({'error': error_msg}, status=500)
+        logger.exception("checkout.unhandled_error")
+        return JsonResponse({'error': f"💥 Error creando el pago: {e}"}, status=500)
+
+    # prepare_checkout ya cargó la sesión: asignar no toca la base (la guarda el middleware)
+    request.session['pending_order_id'] = preference['order_id']
+    logger.info(
+        "checkout.preference_ready order=%s preference=%s items=%s",
+        preference['order_id'], preference['id'], checkout['items'],
+    )
+    return JsonResponse({
+        'id': preference['id'],
+        'init_point': preference['init_point'],
+        'message': 'Pago creado exitosamente'
+    })
+
+
+def build_preference_data(cart, order, shipping_price=0, postal_code=''):
+    """Cuerpo de la preferencia: ítems del carrito, envío y referencia a la orden"""
+    items = [
+        {
+            "title": item['product'].name[:250],
+            "unit_price": float(item['price']),
+            "quantity": item['quantity'],
+            "currency_id": "ARS",
+        }
+        for item in cart
+    ]
+    if shipping_price > 0:
+        items.append({
+            "title": f"Envío a {postal_code}"[:250],
+            "unit_price": float(shipping_price),
+            "quantity": 1,
+            "currency_id": "ARS",
+        })
+    return {
+        "items": items,
+        "back_urls": {
+            "success": "http://127.0.0.1:8000/payment/success/",
+            "failure": "http://127.0.0.1:8000/payment/failure/",
+            "pending": "http://127.0.0.1:8000/payment/pending/"
+        },
+        "external_reference": f"masivotech_{order.id}",
+    }
 
 
 def payment_success(request):
     """Pago exitoso"""
-    cart = Cart(request)
+    cart = get_request_cart(request)
     cart.clear()
     clear_shipping_session(request)
+    # La orden queda pendiente hasta que el webhook confirme el pago
+    request.session.pop('pending_order_id', None)
     
     context = {
         'payment_id': request.GET.get('payment_id'),
@@ -490,6 +578,9 @@ def payment_success(request):
 
 def payment_failure(request):
     """Pago fallido"""
+    # Devolver el stock reservado para la orden rechazada
+    release_pending_order(request)
+    
     context = {
         'payment_id': request.GET.get('payment_id'),
         'status': request.GET.get('status'),
@@ -512,16 +603,17 @@ def payment_pending(request):
 
 @csrf_exempt
 def payment_webhook(request):
-    """Webhook para notificaciones de MercadoPago"""
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            print(f"📦 Webhook recibido: {data}")
-            return JsonResponse({'status': 'ok'})
-        except Exception as e:
-            return JsonResponse({'error': str(e)}, status=500)
-    
-    return JsonResponse({'error': 'Método no permitido'}, status=405)
+    """
+    Webhook para notificaciones de MercadoPago.
+    Solo encola la notificación y responde 200; el estado del pago se consulta
+    a la API en segundo plano (marketplace.webhooks), nunca se toma del body.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+
+    if not record_notification(request):
+        logger.debug("Notificación de MercadoPago duplicada o sin recurso")
+    return JsonResponse({'status': 'ok'})
 
 # =============================================================================
 # UTILIDADES
@@ -533,24 +625,64 @@ def get_base_url(request):
         return settings.BASE_URL.rstrip('/')
     return 'http://127.0.0.1:8000'
 
+def checkout_customer(request):
+    """Datos de contacto de la orden: los enviados en el checkout o los del usuario"""
+    user = request.user
+    customer = {
+        'first_name': user.first_name if user.is_authenticated else '',
+        'last_name': user.last_name if user.is_authenticated else '',
+        'email': user.email if user.is_authenticated else '',
+        'address': '',
+        'city': '',
+        'phone': (getattr(user, 'phone_number', '') or '') if user.is_authenticated else '',
+    }
+    
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        payload = {}
+    
+    if payload:
+        form = OrderForm(payload)
+        if form.is_valid():
+            customer.update(form.cleaned_data)
+    
+    return customer
+
+def release_pending_order(request):
+    """Libera la reserva de la orden pendiente guardada en la sesión"""
+    order_id = request.session.pop('pending_order_id', None)
+    if order_id:
+        release_order(order_id)
+
 def clear_shipping_session(request):
     """Limpiar datos de envío de la sesión"""
     for key in ['shipping_price', 'postal_code']:
         if key in request.session:
             del request.session[key]
 
+@rate_limit('autocomplete')
 def search_autocomplete(request):
     """Autocompletado de búsqueda"""
     query = request.GET.get('q', '')
     
-    if len(query) < 2:
+    if len(query) < autocomplete_index.MIN_QUERY_LENGTH:
         return JsonResponse({'results': []})
     
-    products = Product.objects.filter(
-        Q(name__icontains=query) | 
-        Q(category__icontains=query),
-        available=True
-    )[:5]
+    # Camino rápido: índice en memoria con resultados ya serializados
+    try:
+        autocomplete_index.ensure_fresh()
+        fragments = autocomplete_index.search(query, limit=5)
+        return HttpResponse(
+            '{"results": [' + ', '.join(fragments) + ']}',
+            content_type='application/json',
+        )
+    except Exception as e:
+        logger.warning("Autocompletado en memoria no disponible: %s", e)
+    
+    products = search_products(
+        Product.objects.filter(available=True), query
+    ).order_by('-search_rank', 'id')[:5]
     
     results = []
     for product in products:
@@ -558,20 +690,31 @@ def search_autocomplete(request):
             'name': product.name,
             'category': product.get_category_display(),
             'price': str(product.price),
-            'url': f"/producto/{product.id}/",
-            'image': product.image.url if product.image else None
+            'url': reverse('product_detail', args=[product.id]),
+            'image': rendition_src(product, 'thumb') or None
         })
     
     return JsonResponse({'results': results})
 
+ORDERS_PER_PAGE = 10
+
+
 @login_required
 def order_history(request):
-    """Historial de pedidos del usuario"""
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    """Historial de pedidos del usuario (cantidad de consultas fija, sin importar cuántos pedidos tenga)"""
+    # Items con su producto en una sola consulta para toda la página
+    items = Prefetch('items', queryset=OrderItem.objects.select_related('product').order_by('id'))
+    orders = (
+        Order.objects.filter(user=request.user)
+        .annotate(item_count=Count('items'))
+        .prefetch_related(items)
+        .order_by('-created_at', '-id')
+    )
+    page = Paginator(orders, ORDERS_PER_PAGE).get_page(request.GET.get('page'))
     
     context = {
-        'orders': orders,
+        'orders': page,
         'page_title': 'Mis Pedidos - Masivo Tech'
     }
     
-    return render(request, 'users/order_history.html', context)
\ No newline at end of file
+    return render(request, 'users/order_history.html', context)
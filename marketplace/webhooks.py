@@ -0,0 +1,221 @@
+# === marketplace/webhooks.py - Procesamiento asíncrono de notificaciones de pago ===
+#
+# 1. record_notification(): el webhook guarda la notificación cruda en
+#    PaymentEvent (único por notification_id) y
+#    responde 200 de inmediato. Los reintentos de MercadoPago no duplican nada.
+#    Los tópicos que no se procesan (merchant_order, ...) quedan ya como 'done'.
+# 2. process_pending_events(): un worker (tarea Celery o el comando
+#    process_payment_events en modo polling) reclama eventos en lotes,
+#    consulta el estado real de cada pago distinto una sola vez y actualiza
+#    la orden. Nunca se confía en el contenido de la notificación.
+#    Un evento que falla vuelve a 'pending' con next_attempt_at en el futuro
+#    (backoff exponencial): los MAX_ATTEMPTS intentos cubren una caída de la
+#    API de varios minutos en lugar de gastarse en segundos.
+
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .inventory import InsufficientStock, confirm_order, refund_order, release_order
+from .models import Order, PaymentEvent
+from .payments import fetch_payments
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+# Un evento 'processing' más viejo que esto se considera abandonado por un worker caído
+PROCESSING_TIMEOUT = timedelta(minutes=5)
+# Espera antes del reintento N: RETRY_BACKOFF * 2**(N-1), como mucho MAX_RETRY_DELAY
+RETRY_BACKOFF = timedelta(minutes=1)
+MAX_RETRY_DELAY = timedelta(hours=1)
+
+EXTERNAL_REFERENCE_PREFIX = 'masivotech_'
+
+# Tópicos que el worker procesa; el resto se registra pero no queda pendiente
+HANDLED_TOPICS = {'payment'}
+
+APPROVED_STATUSES = {'approved'}
+FAILED_STATUSES = {'rejected', 'cancelled'}
+REVERSED_STATUSES = {'refunded', 'charged_back'}
+
+
+# =============================================================================
+# ENTRADA (webhook)
+# =============================================================================
+
+def parse_notification(request):
+    """Extrae (notification_id, topic, resource_id, payload) del body o la query string"""
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        payload = {}
+    if not isinstance(payload, dict):
+        payload = {}
+
+    data = payload.get('data') or {}
+    topic = payload.get('type') or payload.get('topic') or request.GET.get('type') or request.GET.get('topic') or ''
+    resource_id = (
+        data.get('id') or request.GET.get('data.id') or request.GET.get('id') or payload.get('resource') or ''
+    )
+    resource_id = str(resource_id).rstrip('/').rsplit('/', 1)[-1]
+    if not topic or not resource_id:
+        return None
+
+    action = payload.get('action', '')
+    notification_id = str(payload.get('id') or f"{topic}:{resource_id}:{action}")
+    return notification_id, topic, resource_id, payload
+
+
+def record_notification(request):
+    """Guarda la notificación (idempotente). Devuelve True si era nueva."""
+    parsed = parse_notification(request)
+    if parsed is None:
+        return False
+    notification_id, topic, resource_id, payload = parsed
+
+    handled = topic in HANDLED_TOPICS
+    try:
+        with transaction.atomic():
+            PaymentEvent.objects.create(
+                notification_id=notification_id, topic=topic,
+                resource_id=resource_id, payload=payload,
+                status='pending' if handled else 'done',
+                processed_at=None if handled else timezone.now(),
+            )
+    except IntegrityError:
+        # Reintento de MercadoPago: ya está en la bandeja
+        return False
+    if handled:
+        transaction.on_commit(dispatch_processing)
+    return True
+
+
+def dispatch_processing():
+    """Despierta al worker Celery si hay broker; si no, lo toma el comando de polling"""
+    if not getattr(settings, 'CELERY_BROKER_URL', None):
+        return
+    try:
+        from .tasks import process_payment_events
+        process_payment_events.delay()
+    except Exception as e:
+        # El evento ya está persistido: el polling lo procesará igual
+        logger.warning("No se pudo encolar el procesamiento de pagos: %s", e)
+
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+def retry_delay(attempts):
+    """Espera antes de reintentar un evento que ya falló `attempts` veces"""
+    return min(RETRY_BACKOFF * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def claim_events(batch_size=BATCH_SIZE):
+    """Reclama un lote de eventos pendientes (o abandonados) para este worker"""
+    now = timezone.now()
+    stale = now - PROCESSING_TIMEOUT
+    due = Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now)
+    with transaction.atomic():
+        events = list(
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(topic__in=HANDLED_TOPICS, attempts__lt=MAX_ATTEMPTS)
+            .filter((Q(status='pending') & due) | Q(status='processing', processed_at__lt=stale))
+            [:batch_size]
+        )
+        if events:
+            PaymentEvent.objects.filter(id__in=[event.id for event in events]).update(
+                status='processing', attempts=F('attempts') + 1, processed_at=timezone.now()
+            )
+    return events
+
+
+def order_id_from_reference(reference):
+    if reference and str(reference).startswith(EXTERNAL_REFERENCE_PREFIX):
+        suffix = str(reference)[len(EXTERNAL_REFERENCE_PREFIX):]
+        if suffix.isdigit():
+            return int(suffix)
+    return None
+
+
+def apply_payment(payment):
+    """Transiciona la orden según el estado real del pago"""
+    order_id = order_id_from_reference(payment.get('external_reference'))
+    if order_id is None:
+        logger.info("Pago %s sin orden asociada", payment.get('id'))
+        return
+
+    status = payment.get('status')
+    payment_id = str(payment.get('id'))
+
+    if status in APPROVED_STATUSES:
+        confirm_order(order_id, payment_id)
+    elif status in FAILED_STATUSES:
+        release_order(order_id)
+        Order.objects.filter(id=order_id, mercadopago_id__isnull=True).update(mercadopago_id=payment_id)
+    elif status in REVERSED_STATUSES:
+        refund_order(order_id)
+    else:
+        # pending / in_process / authorized: solo se registra el pago
+        Order.objects.filter(id=order_id).update(mercadopago_id=payment_id)
+    logger.info("Orden #%s: pago %s en estado %s", order_id, payment_id, status)
+
+
+def process_pending_events(batch_size=BATCH_SIZE):
+    """Procesa un lote. Devuelve la cantidad de eventos reclamados."""
+    events = claim_events(batch_size)
+    if not events:
+        return 0
+
+    payments = fetch_payments(event.resource_id for event in events)
+    applied = {}
+    for event in events:
+        payment = payments.get(event.resource_id)
+        error = ''
+        if payment is None:
+            error = 'No se pudo consultar el pago'
+        elif event.resource_id not in applied:
+            try:
+                apply_payment(payment)
+            except InsufficientStock as e:
+                # Pago aprobado de una reserva vencida sin stock: requiere intervención manual
+                error = str(e)
+            except Exception as e:
+                logger.exception("Error aplicando el pago %s", event.resource_id)
+                error = str(e)
+            applied[event.resource_id] = error
+        else:
+            # Mismo pago notificado varias veces en el lote: se aplica una sola vez
+            error = applied[event.resource_id]
+
+        # event.attempts es el valor previo al reclamo: este fue el intento attempts + 1
+        attempts = event.attempts + 1
+        now = timezone.now()
+        next_attempt_at = None
+        if not error:
+            status = 'done'
+        elif attempts >= MAX_ATTEMPTS:
+            status = 'failed'
+        else:
+            status = 'pending'
+            next_attempt_at = now + retry_delay(attempts)
+        PaymentEvent.objects.filter(id=event.id).update(
+            status=status, last_error=error, processed_at=now, next_attempt_at=next_attempt_at
+        )
+    return len(events)
+
+
+def drain(batch_size=BATCH_SIZE):
+    """Procesa lotes hasta vaciar la bandeja"""
+    total = 0
+    while True:
+        processed = process_pending_events(batch_size)
+        total += processed
+        if processed < batch_size:
+            return total
@@ -0,0 +1,9 @@
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'masivo_tech.settings')
+
+app = Celery('masivo_tech')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
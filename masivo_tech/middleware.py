@@ -0,0 +1,36 @@
+# === masivo_tech/middleware.py - Middleware del proyecto ===
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise declarado también async. El original es solo sync y con un
+    único middleware sync Django corre toda la cadena (y las vistas async)
+    en un hilo compartido: bajo ASGI los requests quedaban en fila.
+    Resolver un estático es una búsqueda en el dict precargado y abrir el
+    archivo; no vale la pena mandarlo a un hilo.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
@@ -81,7 +81,7 @@ if CLOUDINARY_CONFIGURED:
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'masivo_tech.middleware.AsyncWhiteNoiseMiddleware',  # WhiteNoise, también async (ASGI)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -109,6 +109,42 @@ DATABASE_URL = os.environ.get("DATABASE_URL")
 if DATABASE_URL:
     DATABASES['default'] = dj_database_url.parse(DATABASE_URL)
 
+# =============================================================================
+# CACHE
+# =============================================================================
+
+# Con REDIS_URL el cache es compartido entre workers (páginas del catálogo,
+# límites de consultas, memoria de Masibot). Sin él, cada proceso usa su
+# propio cache en memoria: las invalidaciones solo alcanzan al worker que
+# hizo el cambio y el resto depende de CATALOG_CACHE_TIMEOUT.
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'masivo',
+            'TIMEOUT': 300,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'masivo-tech',
+            'TIMEOUT': 300,
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('LOCAL_CACHE_MAX_ENTRIES', '5000'))},
+        }
+    }
+
+# Páginas del catálogo para visitantes anónimos y fragmentos (tarjetas, navegación).
+# Las claves llevan la generación del catálogo: un cambio en Product las renueva al instante
+CATALOG_PAGE_CACHE = os.getenv('CATALOG_PAGE_CACHE', 'True').lower() == 'true'
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '600'))
+# Entra en los ETag: un deploy con plantillas nuevas no debe responder 304 con el HTML viejo.
+# Render expone el commit desplegado; sin él se usa el arranque del proceso
+RELEASE_VERSION = os.getenv('RENDER_GIT_COMMIT', '')
+
 # =============================================================================
 # AUTENTICACIÓN
 # =============================================================================
@@ -155,6 +191,13 @@ STATICFILES_STORAGE = 'whitenoise.storage.StaticFilesStorage'
 WHITENOISE_USE_FINDERS = True
 WHITENOISE_AUTOREFRESH = True
 
+# Archivos subidos (solo se usan sin Cloudinary y para las variantes locales)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Variantes responsive de imágenes: 'cloudinary' (transformaciones en la URL) o 'local' (Pillow)
+IMAGE_RENDITION_BACKEND = os.getenv('IMAGE_RENDITION_BACKEND', 'cloudinary')
+
 # =============================================================================
 # TEMPLATES Y OTRAS CONFIGURACIONES
 # =============================================================================
@@ -171,6 +214,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'marketplace.context_processors.cart_context',
+                'marketplace.context_processors.catalog_cache',
             ],
         },
     },
@@ -179,11 +223,68 @@ TEMPLATES = [
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 CART_SESSION_ID = 'cart'
+# Persistencia del carrito: líneas en la base (DatabaseCartStore) o sesión (SessionCartStore).
+# DatabaseCartStore adopta el carrito que haya quedado en la sesión la primera vez que se usa
+CART_STORE = os.getenv('CART_STORE', 'marketplace.cart_store.DatabaseCartStore')
+# Días sin cambios tras los que `purge_anonymous_carts` borra un carrito anónimo (edad de la cookie de sesión)
+ANONYMOUS_CART_TTL_DAYS = int(os.getenv('ANONYMOUS_CART_TTL_DAYS', '14'))
+# Minutos que una orden pendiente retiene su stock antes de que el barrido lo libere
+STOCK_RESERVATION_TTL_MINUTES = int(os.getenv('STOCK_RESERVATION_TTL_MINUTES', '15'))
+# Tope de códigos postales por llamada a la cotización de envíos en lote
+SHIPPING_BATCH_MAX_CODES = int(os.getenv('SHIPPING_BATCH_MAX_CODES', '10000'))
+# Clave (header X-Api-Key) de las herramientas que usan la cotización en lote; sin ella, solo staff
+SHIPPING_BATCH_API_KEY = os.getenv('SHIPPING_BATCH_API_KEY')
 
 # APIs
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# Cache de respuestas de Masibot (por worker). CHAT_CACHE_SIMILARITY=0 desactiva el nivel por similitud
+CHAT_CACHE_TTL_SECONDS = int(os.getenv('CHAT_CACHE_TTL_SECONDS', '3600'))
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv('CHAT_CACHE_MAX_ENTRIES', '500'))
+CHAT_CACHE_SIMILARITY = float(os.getenv('CHAT_CACHE_SIMILARITY', '0.85'))
+
+# Memoria de conversación por sesión (en el cache de Django; vence por inactividad)
+CHAT_MEMORY_TURNS = int(os.getenv('CHAT_MEMORY_TURNS', '6'))
+CHAT_MEMORY_TOKEN_BUDGET = int(os.getenv('CHAT_MEMORY_TOKEN_BUDGET', '600'))
+CHAT_MEMORY_SUMMARY_TOKENS = int(os.getenv('CHAT_MEMORY_SUMMARY_TOKENS', '120'))
+CHAT_MEMORY_IDLE_SECONDS = int(os.getenv('CHAT_MEMORY_IDLE_SECONDS', '1800'))
+
+# Llamadas simultáneas a Gemini por proceso y espera máxima por un lugar antes de responder 429
+CHAT_LLM_CONCURRENCY = int(os.getenv('CHAT_LLM_CONCURRENCY', '4'))
+CHAT_LLM_QUEUE_SECONDS = float(os.getenv('CHAT_LLM_QUEUE_SECONDS', '0.5'))
+
+# Límite de consultas por endpoint: 'N/s', 'N/m' o 'N/h' (balde de N fichas por cliente)
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+RATE_LIMITS = {
+    'chat': os.getenv('RATE_LIMIT_CHAT', '10/m'),
+    'autocomplete': os.getenv('RATE_LIMIT_AUTOCOMPLETE', '10/s'),
+    'shipping_batch': os.getenv('RATE_LIMIT_SHIPPING_BATCH', '30/m'),
+}
+RATE_LIMIT_IP_FACTOR = int(os.getenv('RATE_LIMIT_IP_FACTOR', '5'))
+# 'local' (exacto, por proceso) o 'cache' (compartido entre workers vía CACHES)
+RATE_LIMIT_STORE = os.getenv('RATE_LIMIT_STORE', 'local')
+# En Render la IP real llega en X-Forwarded-For
+RATE_LIMIT_TRUST_FORWARDED = bool(RENDER_EXTERNAL_HOSTNAME)
+
 MERCADOPAGO_ACCESS_TOKEN = os.getenv('MERCADOPAGO_ACCESS_TOKEN')
 MERCADOPAGO_PUBLIC_KEY = os.getenv('MERCADOPAGO_PUBLIC_KEY')
+# Permite apuntar el SDK a un servidor local (tests / sandbox)
+MERCADOPAGO_API_BASE = os.getenv('MERCADOPAGO_API_BASE', 'https://api.mercadopago.com')
+
+# Cola de tareas: sin broker, los webhooks se procesan con `manage.py process_payment_events --loop`
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_ACKS_LATE = True
+# Los eventos con reintento diferido (backoff) no tienen un webhook que los despierte
+CELERY_BEAT_SCHEDULE = {
+    'process-payment-events': {
+        'task': 'marketplace.tasks.process_payment_events',
+        'schedule': 60.0,
+    },
+    'purge-anonymous-carts': {
+        'task': 'marketplace.tasks.purge_anonymous_carts',
+        'schedule': 24 * 60 * 60.0,
+    },
+}
 
 SOCIALACCOUNT_PROVIDERS = {
     'google': {
@@ -211,6 +312,21 @@ CORS_ALLOW_CREDENTIALS = True
 BASE_URL = os.getenv("BASE_URL", "https://masivotest.onrender.com")
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Logging: líneas clave=valor a stdout (Render las recoge del proceso)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'kv': {'format': 'level=%(levelname)s logger=%(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'kv'},
+    },
+    'loggers': {
+        'marketplace': {'handlers': ['console'], 'level': os.getenv('MARKETPLACE_LOG_LEVEL', 'INFO')},
+    },
+}
+
 # Configuración de seguridad para producción
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
@@ -3,7 +3,10 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from marketplace.admin_dashboard import admin_dashboard
+
 urlpatterns = [
+    path('admin/dashboard/', admin.site.admin_view(admin_dashboard), name='admin_dashboard'),
     path('admin/', admin.site.urls),
     path('', include('marketplace.urls')),
     path('soporte/', include('chat.urls')),
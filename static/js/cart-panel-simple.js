@@ -237,6 +237,14 @@ class CartPanelSimple {
 
             const html = await response.text();
             contentElement.innerHTML = html;
+
+            // Los contadores no vienen en el HTML de la página (se comparte en cache)
+            const count = response.headers.get('X-Cart-Count');
+            if (count !== null) {
+                document.querySelectorAll('.cart-badge, #cartPanelCount').forEach(element => {
+                    element.textContent = count;
+                });
+            }
             
         } catch (error) {
             // Mostrar error elegante
@@ -1,4 +1,5 @@
 from django.urls import path, include
+from django.views.generic import RedirectView
 from . import views
 
 urlpatterns = [
@@ -6,5 +7,6 @@ urlpatterns = [
     path('profile/update/', views.update_profile, name='update_profile'),
     path('profile/delete/', views.delete_account, name='delete_account'),
     path('change-password/', views.change_password, name='change_password'),
-    path('orders/', views.order_history, name='order_history'),
+    # El historial vive en marketplace (/mis-pedidos/); se mantiene la URL vieja
+    path('orders/', RedirectView.as_view(pattern_name='order_history', permanent=True, query_string=True)),
 ]
\ No newline at end of file
@@ -5,7 +5,6 @@ from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm
 from .forms import UserUpdateForm, ProfileUpdateForm
 from .models import CustomUser
-from marketplace.models import Order  # ← AGREGAR ESTA IMPORTACIÓN
 
 @login_required
 def profile(request):
@@ -75,13 +74,3 @@ def delete_account(request):
         messages.success(request, 'Tu cuenta ha sido eliminada exitosamente.')
         return redirect('index')
     return render(request, 'users/delete_account.html')
-
-# -------------------------Vista para historial de pedidos (si tienes app de órdenes)
-def order_history(request):
-    """Vista del historial de pedidos del usuario"""
-     # Obtener órdenes del usuario actual
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    
-    return render(request, 'users/order_history.html', {
-        'orders': orders
-    })
\ No newline at end of file